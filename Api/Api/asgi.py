@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Api.settings')
 
 application = get_asgi_application()
+
+# Aquece os caches do processo e sobe as threads de fundo (ver User/startup.py)
+from User import startup  # noqa: E402
+
+startup.run()
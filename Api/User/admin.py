@@ -1,13 +1,22 @@
 # admin.py
 from django.contrib import admin
-from .models import CustomUser, Plan, Role, SubscriptionPlan, Subscription,UserAnalytics
+from .models import (
+    CustomUser, Plan, Role, SubscriptionPlan, Subscription, UserAnalytics,
+    DailyActivity, UserDailyActivity, OutboxEmail, DomainRoleRule,
+)
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from .pagination import EstimatedCountPaginator
 
 @admin.register(CustomUser)
 class CustomUserAdmin(BaseUserAdmin):
     list_display = ('email', 'name', 'role', 'plan', 'is_staff', 'is_active')
     list_filter = ('role', 'plan', 'is_staff', 'is_superuser', 'is_active')
-    search_fields = ('email', 'name')
+    # Tabela grande: role e plan no mesmo SELECT, sem COUNT(*) exato e busca
+    # só por prefixo (usa os índices UPPER(...) text_pattern_ops da 0008)
+    list_select_related = ('role', 'plan')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('^email', '^name')
     ordering = ('email',)
 
     fieldsets = (
@@ -30,3 +39,22 @@ admin.site.register(Role)
 admin.site.register(SubscriptionPlan)
 admin.site.register(Subscription)
 admin.site.register(UserAnalytics)
+admin.site.register(DailyActivity)
+admin.site.register(UserDailyActivity)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'kind', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('^to_email',)
+    readonly_fields = ('last_error',)
+
+
+@admin.register(DomainRoleRule)
+class DomainRoleRuleAdmin(admin.ModelAdmin):
+    # Usuários já cadastrados: python manage.py reassign_roles
+    list_display = ('domain', 'role', 'include_subdomains', 'created_at')
+    list_filter = ('role', 'include_subdomains')
+    list_select_related = ('role',)
+    search_fields = ('domain',)
@@ -0,0 +1,143 @@
+# admission.py
+"""
+Controle de admissão por classe de endpoint (auth, write, read, health).
+
+Cada classe tem um limite de requests simultâneos e uma fila limitada. Quem
+chega com a classe cheia espera na fila até `timeout` segundos; com a fila
+cheia (ou no timeout) é rejeitado na hora com Retry-After. O limite se
+adapta à latência observada (AIMD): cai 10% quando a latência passa do alvo
+e sobe devagar enquanto fica abaixo dele, entre `min_limit` e `max_limit`.
+
+Os limites valem por processo: fazem efeito com workers de várias threads
+(gthread) ou ASGI. `health` tem a própria cota, então probes do Kubernetes
+continuam respondendo mesmo com logins saturando o worker.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+AUTH = 'auth'
+WRITE = 'write'
+READ = 'read'
+HEALTH = 'health'
+
+
+class Rejected(Exception):
+    def __init__(self, limiter, reason):
+        super().__init__(reason)
+        self.limiter = limiter
+        self.reason = reason
+        self.status = limiter.status
+        self.retry_after = limiter.retry_after()
+
+
+class AdaptiveLimiter:
+    def __init__(self, name, limit, min_limit=1, max_limit=None, queue=0, timeout=1.0,
+                 target_ms=None, status=503):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit
+        self.queue_size = queue
+        self.timeout = timeout
+        self.target = target_ms / 1000 if target_ms else None
+        self.status = status
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_latency = 0.0
+        self._cond = threading.Condition()
+
+    def _has_slot(self):
+        return self.inflight < max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        """Ocupa uma vaga (esperando na fila se houver espaço) ou levanta Rejected."""
+        with self._cond:
+            if not self._has_slot():
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise Rejected(self, "fila cheia")
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(self._has_slot, timeout=self.timeout):
+                        self.rejected += 1
+                        raise Rejected(self, "tempo de espera esgotado")
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+            self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, started):
+        latency = time.perf_counter() - started
+        with self._cond:
+            self.inflight -= 1
+            # Média móvel exponencial, usada no Retry-After e nas métricas
+            self.avg_latency = latency if not self.avg_latency else 0.9 * self.avg_latency + 0.1 * latency
+            if self.target is not None:
+                if latency > self.target:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def retry_after(self):
+        """Segundos estimados até a fila andar (mínimo 1)."""
+        backlog = self.inflight + self.waiting
+        return max(1, math.ceil(backlog * (self.avg_latency or 1.0) / max(self.limit, 1)))
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'limit': round(self.limit, 2),
+                'inflight': self.inflight,
+                'queue_depth': self.waiting,
+                'queue_size': self.queue_size,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'avg_latency_ms': round(self.avg_latency * 1000, 3),
+            }
+
+
+class AdmissionController:
+    def __init__(self, config=None, routes=None):
+        config = settings.LOAD_SHEDDING if config is None else config
+        self.routes = settings.LOAD_SHEDDING_ROUTES if routes is None else routes
+        self.limiters = {name: AdaptiveLimiter(name, **options) for name, options in config.items()}
+
+    def classify(self, request, url_name=None):
+        if url_name in self.routes:
+            return self.routes[url_name]
+        return READ if request.method in ('GET', 'HEAD', 'OPTIONS') else WRITE
+
+    def limiter_for(self, request, url_name=None):
+        return self.limiters.get(self.classify(request, url_name))
+
+    def metrics(self):
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
+
+
+def reset_controller():
+    global _controller
+    _controller = None
+
+
+def metrics():
+    return get_controller().metrics()
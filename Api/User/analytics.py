@@ -0,0 +1,215 @@
+# analytics.py
+"""
+Ingestão bufferizada de UserAnalytics.
+
+Os caminhos de request só fazem `record_login` / `record_feature`, que
+adicionam um evento a um ring buffer em memória (limitado a
+ANALYTICS_BUFFER_SIZE; quando cheio os eventos mais antigos são descartados).
+Uma thread de flush, iniciada na subida do worker (wsgi/asgi), agrega os
+eventos por usuário a cada ANALYTICS_FLUSH_INTERVAL segundos e aplica tudo
+em uma transação curta: um INSERT para linhas que ainda não existem e um
+único UPDATE em lote com expressões F(), incluindo o merge atômico do JSON
+de features_used. Os eventos também são gravados em ActivityEvent, de onde o
+`rollup_analytics` calcula as métricas diárias e é o único a gravar
+active_days_count e avg_session_duration_minutes. Se o flush falhar, os eventos
+voltam para o início do buffer (dentro do mesmo limite) e vão no próximo. Na
+saída do processo o buffer é descarregado.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Func, JSONField, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LOGIN = 'login'
+SESSION = 'session'
+FEATURE = 'feature'
+
+
+class JSONIncrement(Func):
+    """
+    `features_used` com cada chave incrementada no próprio banco, sem ler o
+    valor antes (ex.: {"api": 12} + {"api": 3} -> {"api": 15}).
+    """
+    output_field = JSONField()
+
+    def __init__(self, field, increments):
+        self.increments = sorted(increments.items())
+        super().__init__(F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        sql = f"COALESCE({column}, '{{}}')"
+        params = list(params)
+        if connection.vendor == 'postgresql':
+            for key, amount in self.increments:
+                sql = f"jsonb_set({sql}, ARRAY[%s], to_jsonb(COALESCE(({column} ->> %s)::integer, 0) + %s))"
+                params += [key, key, amount]
+            return sql, params
+        # SQLite (e demais bancos com json_set/json_extract)
+        pairs = []
+        for key, amount in self.increments:
+            path = '$."%s"' % key.replace('"', '')
+            pairs.append(f"%s, COALESCE(json_extract({column}, %s), 0) + %s")
+            params += [path, path, amount]
+        return f"json_set({sql}, {', '.join(pairs)})", params
+
+
+class AnalyticsBuffer:
+    def __init__(self, size):
+        self._events = deque(maxlen=size)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def append(self, event):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._events.popleft())
+            except IndexError:
+                return events
+
+    def requeue(self, events):
+        """Devolve ao início do buffer eventos de um flush que falhou, sem passar do limite."""
+        room = self._events.maxlen - len(self._events)
+        keep = events[len(events) - room:] if room > 0 else []
+        # Sem espaço, os mais antigos saem, como no append
+        self.dropped += len(events) - len(keep)
+        self._events.extendleft(reversed(keep))
+
+    @staticmethod
+    def coalesce(events):
+        """Agrega eventos por usuário: logins, último login, dias e features."""
+        per_user = {}
+        for kind, user_id, at, value in events:
+            data = per_user.setdefault(user_id, {
+                'logins': 0, 'last_login': None, 'features': Counter(),
+            })
+            if kind == LOGIN:
+                data['logins'] += 1
+                if data['last_login'] is None or at > data['last_login']:
+                    data['last_login'] = at
+            elif kind == FEATURE:
+                data['features'][value] += 1
+        return per_user
+
+    def flush(self):
+        """Aplica os eventos pendentes; retorna quantos foram gravados."""
+        with self._flush_lock:
+            events = self.drain()
+            if not events:
+                return 0
+            try:
+                self._apply(events, self.coalesce(events))
+            except Exception:
+                # Banco fora do ar, conexão quebrada: tenta de novo no próximo flush
+                logger.exception("Falha ao gravar %d eventos de analytics; voltam para o buffer", len(events))
+                self.requeue(events)
+                return 0
+            return len(events)
+
+    def _apply(self, events, per_user):
+        from .models import ActivityEvent, CustomUser, UserAnalytics
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Ignora eventos de usuários removidos desde o registro
+            existing = set(CustomUser.objects.filter(pk__in=per_user).values_list('pk', flat=True))
+
+            # Eventos brutos (append-only) para os rollups diários (rollups.py)
+            ActivityEvent.objects.bulk_create([
+                ActivityEvent(
+                    user_id=user_id, kind=kind, created_at=at,
+                    feature=value if kind == FEATURE else '',
+                    duration_seconds=value if kind == SESSION else None,
+                )
+                for kind, user_id, at, value in events if user_id in existing
+            ], batch_size=1000)
+
+            UserAnalytics.objects.bulk_create(
+                [UserAnalytics(user_id=user_id) for user_id in existing],
+                ignore_conflicts=True,
+            )
+            pks = dict(UserAnalytics.objects.filter(user_id__in=existing).values_list('user_id', 'pk'))
+
+            rows = []
+            for user_id, data in per_user.items():
+                if user_id not in pks:
+                    continue
+                row = UserAnalytics(pk=pks[user_id], user_id=user_id, updated_at=now)
+                row.total_logins = F('total_logins') + data['logins']
+                if data['last_login'] is not None:
+                    row.last_login_date = Greatest(Coalesce(F('last_login_date'), Value(data['last_login'])),
+                                                   Value(data['last_login']))
+                else:
+                    row.last_login_date = F('last_login_date')
+                if data['features']:
+                    row.features_used = JSONIncrement('features_used', data['features'])
+                else:
+                    row.features_used = F('features_used')
+                rows.append(row)
+
+            UserAnalytics.objects.bulk_update(rows, [
+                'total_logins', 'last_login_date', 'features_used', 'updated_at',
+            ])
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+            close_old_connections()
+
+    def start(self, interval=None):
+        """Inicia a thread de flush (uma por processo) e o flush na saída."""
+        interval = interval if interval is not None else settings.ANALYTICS_FLUSH_INTERVAL
+        # Após um fork (preload do gunicorn) a thread herdada não está viva
+        if (self._thread is not None and self._thread.is_alive()) or interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="analytics-flusher", daemon=True)
+        self._thread.start()
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Para a thread e descarrega o que restou no buffer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+buffer = AnalyticsBuffer(settings.ANALYTICS_BUFFER_SIZE)
+
+
+def record_login(user, at=None):
+    buffer.append((LOGIN, getattr(user, 'pk', user), at or timezone.now(), None))
+
+
+def record_feature(user, feature, at=None):
+    buffer.append((FEATURE, getattr(user, 'pk', user), at or timezone.now(), feature))
+
+
+def record_session(user, duration_seconds, at=None):
+    buffer.append((SESSION, getattr(user, 'pk', user), at or timezone.now(), duration_seconds))
+
+
+def start():
+    buffer.start()
@@ -6,4 +6,5 @@ class UserConfig(AppConfig):
     name = 'User'
 
     def ready(self):
-        import User.signals   # substitua pelo nome do seu app
\ No newline at end of file
+        import User.signals   # substitua pelo nome do seu app
+        import User.dbpool    # conta conexões abertas (métricas do banco)
\ No newline at end of file
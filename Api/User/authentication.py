@@ -0,0 +1,99 @@
+# authentication.py
+"""
+Autenticação JWT sem consulta ao banco (opt-in, JWT_STATELESS_AUTH=True).
+
+O token de acesso já carrega email, nome, is_staff e os claims de direitos
+emitidos em CustomTokenObtainPairSerializer.get_token (plan_id, role_id,
+sub_exp, ent_gen e ent_ver). Enquanto a versão de direitos do usuário (e a
+geração global) forem as mesmas do token, o request.user é um ClaimsUser
+montado só com os claims; caso contrário carregamos o CustomUser do banco.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import backends, entitlements
+
+
+def entitlement_claims(user):
+    """Claims de direitos embutidos no token no momento da emissão."""
+    snapshot = entitlements.get_entitlements(user)
+    generation, _ = entitlements.get_version(user.pk)
+    return {
+        'plan_id': user.plan_id,
+        'role_id': user.role_id,
+        'sub_exp': snapshot.subscription_valid_until if snapshot else None,
+        'ent_gen': generation,
+        'ent_ver': user.entitlement_version,
+    }
+
+
+class ClaimsUser:
+    """Usuário leve, montado a partir dos claims do token (sem banco)."""
+
+    __slots__ = (
+        'id', 'email', 'name', 'is_staff', 'is_superuser', 'plan_id', 'role_id',
+        'subscription_valid_until', 'token',
+    )
+
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.id = token[api_settings.USER_ID_CLAIM]
+        self.email = token.get('email', '')
+        self.name = token.get('name', '')
+        self.is_staff = token.get('is_staff', False)
+        self.is_superuser = token.get('is_superuser', False)
+        self.plan_id = token.get('plan_id')
+        self.role_id = token.get('role_id')
+        self.subscription_valid_until = token.get('sub_exp')
+        self.token = token
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_username(self):
+        return self.email
+
+    def __str__(self):
+        return self.email
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    # Sem grupos nem permissões individuais: só as da role, já compiladas.
+    # Como no PermissionsMixin, superusuário ativo tem todas.
+    def has_perm(self, perm, obj=None):
+        if self.is_active and self.is_superuser:
+            return True
+        return obj is None and perm in backends.role_permissions(self.role_id)
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, module):
+        if self.is_active and self.is_superuser:
+            return True
+        return any(perm.startswith(f"{module}.") for perm in backends.role_permissions(self.role_id))
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token sem identificação de usuário")
+
+        version = validated_token.get('ent_ver')
+        if version is None or 'is_superuser' not in validated_token:
+            # Token emitido antes dos claims de direitos (ou do is_superuser)
+            return super().get_user(validated_token)
+
+        generation, current = entitlements.get_version(validated_token[api_settings.USER_ID_CLAIM])
+        if current == version and generation == validated_token.get('ent_gen'):
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
@@ -0,0 +1,128 @@
+# backends.py
+"""
+Backend de autorização que considera as permissões da Role do usuário.
+
+O PermissionsMixin só olha `groups` e `user_permissions`; as permissões de
+`Role.permissions` entram por aqui. Em vez de um join por checagem, a tabela
+role -> permissões é compilada em frozensets ("app_label.codename") com uma
+única consulta e mantida por processo: `user.has_perm()` (e, por tabela, o
+DjangoModelPermissions do DRF) vira um lookup em dicionário e um teste de
+pertinência, sem banco, usando o `role_id` que já está na linha do usuário
+(ou nos claims do ClaimsUser).
+
+A tabela é descartada quando as permissões de uma role mudam (m2m_changed,
+em signals.py): no processo atual na hora e nos demais pela geração no
+cache compartilhado, conferida no máximo a cada ROLE_PERMISSIONS_LOCAL_TTL
+segundos. Sem cache compartilhado (locmem) a geração não sai do processo:
+a tabela é então recompilada do banco a cada ROLE_PERMISSIONS_MAX_AGE
+segundos, qualquer que seja a geração. Permissões individuais e de grupos continuam valendo pelo
+ModelBackend, exceto com ROLE_PERMISSIONS_ONLY=True, que dispensa essas
+consultas também nas negativas.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = "roles:permissions:generation"
+EMPTY = frozenset()
+
+
+class RolePermissionTable:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roles = None
+        self._generation = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def load(self, generation=None):
+        from .models import Role
+
+        if generation is None:
+            generation = cache.get(GENERATION_KEY, 0)
+        compiled = defaultdict(set)
+        rows = Role.permissions.through.objects.values_list(
+            'role_id', 'permission__content_type__app_label', 'permission__codename',
+        )
+        for role_id, app_label, codename in rows:
+            compiled[role_id].add(f"{app_label}.{codename}")
+        roles = {role_id: frozenset(perms) for role_id, perms in compiled.items()}
+        with self._lock:
+            self._roles = roles
+            self._generation = generation
+            self._checked_at = self._loaded_at = time.monotonic()
+
+    def warm(self):
+        """Compila a tabela na subida; sem banco disponível fica para o primeiro uso."""
+        try:
+            self.load()
+        except Exception:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._roles = None
+
+    def _ensure_loaded(self):
+        if self._roles is not None and time.monotonic() - self._checked_at < settings.ROLE_PERMISSIONS_LOCAL_TTL:
+            return
+        generation = cache.get(GENERATION_KEY, 0)
+        stale = time.monotonic() - self._loaded_at >= settings.ROLE_PERMISSIONS_MAX_AGE
+        if self._roles is None or generation != self._generation or stale:
+            self.load(generation)
+        else:
+            self._checked_at = time.monotonic()
+
+    def for_role(self, role_id):
+        """Permissões ("app_label.codename") da role; frozenset vazio se não houver."""
+        if role_id is None:
+            return EMPTY
+        self._ensure_loaded()
+        return self._roles.get(role_id, EMPTY)
+
+    def _bump(self):
+        self.clear()
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, None)
+
+    def invalidate(self):
+        """Descarta a tabela neste processo e nos demais."""
+        self._bump()
+        # De novo após o commit: um processo que recarregou no meio da
+        # transação pode ter compilado as linhas antigas com a geração nova
+        transaction.on_commit(self._bump)
+
+
+table = RolePermissionTable()
+
+
+def role_permissions(role_id):
+    return table.for_role(role_id)
+
+
+class RolePermissionBackend(ModelBackend):
+    def get_role_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return EMPTY
+        return table.for_role(user_obj.role_id)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        perms = self.get_role_permissions(user_obj, obj)
+        if settings.ROLE_PERMISSIONS_ONLY:
+            return perms
+        return perms | super().get_all_permissions(user_obj, obj)
+
+    def has_perm(self, user_obj, perm, obj=None):
+        # A role resolve a maioria dos casos sem tocar em grupos/permissões individuais
+        if perm in self.get_role_permissions(user_obj, obj):
+            return True
+        if settings.ROLE_PERMISSIONS_ONLY:
+            return False
+        return super().has_perm(user_obj, perm, obj)
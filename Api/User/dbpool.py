@@ -0,0 +1,61 @@
+# dbpool.py
+"""
+Estatísticas das conexões com o banco, por worker.
+
+Com DB_POOL (pool do psycopg 3) repassa os contadores do próprio pool: em
+uso, disponíveis, requests esperando, quantos já esperaram e o tempo total
+de espera. Sem pool informa quantas conexões o processo já abriu: com
+CONN_MAX_AGE funcionando, o número fica estável enquanto os requests sobem.
+"""
+import os
+import threading
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_opened = Counter()
+_lock = threading.Lock()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] += 1
+
+
+def _pool_stats(pool):
+    stats = pool.get_stats()
+    size = stats.get('pool_size', 0)
+    available = stats.get('pool_available', 0)
+    return {
+        'min_size': stats.get('pool_min'),
+        'max_size': stats.get('pool_max'),
+        'size': size,
+        'in_use': size - available,
+        'available': available,
+        'waiting': stats.get('requests_waiting', 0),
+        'requests': stats.get('requests_num', 0),
+        'requests_waited': stats.get('requests_queued', 0),
+        'wait_ms_total': stats.get('requests_wait_ms', 0),
+        'errors': stats.get('requests_errors', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+    }
+
+
+def stats():
+    result = {'pid': os.getpid(), 'databases': {}}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, 'pool', None)
+        entry = {
+            'vendor': connection.vendor,
+            'mode': 'pool' if pool else ('persistent' if connection.settings_dict.get('CONN_MAX_AGE') else 'per-request'),
+            'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE'),
+            'connections_opened': _opened[alias],
+        }
+        if pool:
+            entry['pool'] = _pool_stats(pool)
+        result['databases'][alias] = entry
+    return result
@@ -0,0 +1,112 @@
+# defaults.py
+"""
+Registro local ao processo do plano gratuito e das roles padrão.
+
+No cadastro o plano e a role são resolvidos daqui antes do INSERT, então cada
+usuário novo custa uma única instrução. A role vem das regras por domínio
+(DomainRoleRule), compiladas em uma trie (domains.py). O registro é carregado
+na subida do worker (wsgi/asgi) ou no primeiro uso e recarregado quando a
+geração de direitos muda (signals de Plan/Role chamam
+entitlements.invalidate_all) ou quando as regras mudam (RULES_GENERATION_KEY).
+As gerações só chegam aos outros workers por um cache compartilhado; com o
+cache local (locmem) o registro é relido do banco depois de DEFAULTS_MAX_AGE
+segundos, o que limita por quanto tempo um plano apagado ainda é usado.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .domains import DomainTrie, compile_rules
+from .entitlements import GENERATION_KEY
+
+RULES_GENERATION_KEY = "defaults:domain-rules:generation"
+
+
+class DefaultsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._loaded_at = 0.0
+        self._free_plan_id = None
+        self._plans = {}
+        self._roles = {}
+        self._domains = DomainTrie()
+
+    def _current_generation(self):
+        shared = cache.get_many([GENERATION_KEY, RULES_GENERATION_KEY])
+        return shared.get(GENERATION_KEY, 0), shared.get(RULES_GENERATION_KEY, 0)
+
+    def load(self, generation=None):
+        from .models import DomainRoleRule, Plan, Role
+
+        if generation is None:
+            generation = self._current_generation()
+        plans = list(Plan.objects.order_by('pk').values_list('pk', 'name', 'is_free'))
+        roles = dict(Role.objects.values_list('name', 'pk'))
+        domains = compile_rules(DomainRoleRule.objects.values_list('domain', 'role_id', 'include_subdomains'))
+        with self._lock:
+            self._free_plan_id = next((pk for pk, _, is_free in plans if is_free), None)
+            self._plans = {name: pk for pk, name, _ in reversed(plans)}
+            self._roles = roles
+            self._domains = domains
+            self._generation = generation
+            self._loaded_at = time.monotonic()
+
+    def warm(self):
+        """Carrega o registro na subida; sem banco disponível fica para o primeiro uso."""
+        try:
+            self.load()
+        except Exception:
+            self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation = None
+
+    def _next_rules_generation(self):
+        self.invalidate()
+        try:
+            cache.incr(RULES_GENERATION_KEY)
+        except ValueError:
+            cache.set(RULES_GENERATION_KEY, 1, None)
+
+    def invalidate_rules(self):
+        """Regras de domínio mudaram: recompila neste processo e nos demais."""
+        self._next_rules_generation()
+        # De novo após o commit: um worker que recompilou no meio da transação
+        # do admin pode ter guardado as regras antigas com a geração nova
+        transaction.on_commit(self._next_rules_generation)
+
+    def _ensure_loaded(self):
+        generation = self._current_generation()
+        if generation != self._generation or time.monotonic() - self._loaded_at >= settings.DEFAULTS_MAX_AGE:
+            self.load(generation)
+
+    @property
+    def free_plan_id(self):
+        self._ensure_loaded()
+        return self._free_plan_id
+
+    def plan_id(self, name):
+        self._ensure_loaded()
+        return self._plans.get(name)
+
+    def role_id(self, name):
+        self._ensure_loaded()
+        return self._roles.get(name)
+
+    def role_for_email(self, email):
+        """Role da regra de domínio mais específica; None sem regra (admin define depois)."""
+        self._ensure_loaded()
+        return self._domains.lookup(email)
+
+    def defaults_for(self, email):
+        """(plan_id, role_id) padrão para um usuário novo com esse e-mail."""
+        self._ensure_loaded()
+        return self._free_plan_id, self._domains.lookup(email)
+
+
+registry = DefaultsRegistry()
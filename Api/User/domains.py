@@ -0,0 +1,125 @@
+# domains.py
+"""
+Regras de role por domínio de e-mail (DomainRoleRule) compiladas em uma trie.
+
+A trie é indexada pelos rótulos do domínio em ordem reversa ("dcc.ufba.br"
+vira br -> ufba -> dcc), então achar a regra de um e-mail custa um passo por
+rótulo do domínio, qualquer que seja o número de regras. Vale a regra mais
+específica: uma regra exata para "dcc.ufba.br" vence a de "ufba.br" com
+subdomínios.
+
+A trie é montada pelo registro de padrões (defaults.py), junto com planos e
+roles, e recompilada quando as regras mudam (signals.py). `reassign_roles`
+reaplica as regras aos usuários já cadastrados.
+"""
+import time
+
+from . import entitlements
+
+
+def normalize_domain(value):
+    """'@Dcc.UFBA.br.' -> 'dcc.ufba.br'; aceita também um e-mail completo."""
+    return (value or '').strip().lower().rpartition('@')[2].strip('.')
+
+
+class _Node:
+    # Valores das regras fora do dicionário de rótulos: nenhum rótulo (nem
+    # vazio, como em "a@gmail..com") colide com eles
+    __slots__ = ('children', 'exact', 'subtree')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.subtree = None
+
+
+class DomainTrie:
+    def __init__(self):
+        self._root = _Node()
+        self.size = 0
+
+    def add(self, domain, value, include_subdomains=True):
+        node = self._root
+        for label in reversed(normalize_domain(domain).split('.')):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _Node()
+            node = child
+        node.exact = value
+        if include_subdomains:
+            node.subtree = value
+        self.size += 1
+
+    def lookup(self, domain):
+        """Valor da regra mais específica para o domínio (ou e-mail); None sem regra."""
+        node = self._root
+        found = None
+        for label in reversed(normalize_domain(domain).split('.')):
+            node = node.children.get(label)
+            if node is None:
+                return found
+            if node.subtree is not None:
+                found = node.subtree
+        return node.exact if node.exact is not None else found
+
+
+def compile_rules(rows):
+    """Trie a partir de (domínio, role_id, inclui subdomínios)."""
+    trie = DomainTrie()
+    for domain, role_id, include_subdomains in rows:
+        trie.add(domain, role_id, include_subdomains)
+    return trie
+
+
+def reassign_roles(chunk_size=1000, overwrite=False, dry_run=False):
+    """
+    Reaplica as regras aos usuários existentes, em lotes por id.
+
+    Por padrão só mexe em quem não tem role ou tem uma role atribuída por
+    regra (roles definidas pelo admin, como "Administrador", ficam); com
+    `overwrite` qualquer role dá lugar à da regra. Usuários sem regra
+    correspondente não mudam.
+    """
+    from django.db import transaction
+
+    from .defaults import registry
+    from .models import CustomUser, DomainRoleRule
+
+    rule_roles = set(DomainRoleRule.objects.values_list('role_id', flat=True))
+    stats = {'checked': 0, 'changed': 0, 'chunks': 0}
+    started = time.perf_counter()
+    last = 0
+
+    while True:
+        rows = list(
+            CustomUser.objects.filter(pk__gt=last).order_by('pk').values_list('pk', 'email', 'role_id')[:chunk_size]
+        )
+        if not rows:
+            break
+        last = rows[-1][0]
+
+        changes = {}
+        for pk, email, role_id in rows:
+            if not overwrite and role_id is not None and role_id not in rule_roles:
+                continue
+            new_role_id = registry.role_for_email(email)
+            if new_role_id is not None and new_role_id != role_id:
+                changes.setdefault(new_role_id, []).append(pk)
+
+        user_ids = [pk for pks in changes.values() for pk in pks]
+        if user_ids and not dry_run:
+            with transaction.atomic():
+                for role_id, pks in changes.items():
+                    CustomUser.objects.filter(pk__in=pks).update(role_id=role_id)
+                # update() não dispara signals: invalida direitos e claims aqui
+                entitlements.bump_versions(user_ids)
+            entitlements.invalidate_many(user_ids)
+
+        stats['checked'] += len(rows)
+        stats['changed'] += len(user_ids)
+        stats['chunks'] += 1
+        if len(rows) < chunk_size:
+            break
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
@@ -0,0 +1,254 @@
+# entitlements.py
+"""
+Snapshot de direitos (plano, role e assinatura) por usuário.
+
+As permission classes consultam `get_entitlements(user)` em vez de navegar por
+`user.plan`, `user.role` e `user.subscription`, que são consultas lazy
+separadas. O snapshot fica em dois níveis:
+
+- LRU local ao processo (limitado por ENTITLEMENTS_LOCAL_SIZE, com TTL curto
+  ENTITLEMENTS_LOCAL_TTL, que limita quanto tempo outro processo pode ver um
+  snapshot já invalidado);
+- cache compartilhado do Django (CACHES['default']).
+
+Em regime permanente a autorização não faz nenhuma consulta ao banco. Os
+signals em signals.py invalidam o snapshot quando CustomUser, Plan, Role,
+Subscription ou SubscriptionPlan mudam.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+GENERATION_KEY = "entitlements:generation"
+
+
+class Entitlements(NamedTuple):
+    user_id: int
+    plan_id: Optional[int]
+    plan_name: Optional[str]
+    plan_is_free: bool
+    max_projects: int
+    max_users: int
+    max_storage_mb: int
+    role_id: Optional[int]
+    role_name: Optional[str]
+    subscription_plan: Optional[str]
+    subscription_valid_until: Optional[float]
+    subscription_active: bool
+
+    @property
+    def is_pro(self):
+        return self.plan_id is not None and not self.plan_is_free
+
+    def has_role(self, *names):
+        return self.role_name in names
+
+    def has_subscription(self, plan_name, at=None):
+        if not self.subscription_active or self.subscription_plan != plan_name:
+            return False
+        if self.subscription_valid_until is None:
+            return False
+        at = (at or now()).timestamp()
+        return self.subscription_valid_until > at
+
+
+class _LocalLRU:
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return snapshot
+
+    def set(self, user_id, snapshot):
+        with self._lock:
+            self._data[user_id] = (time.monotonic() + settings.ENTITLEMENTS_LOCAL_TTL, snapshot)
+            self._data.move_to_end(user_id)
+            while len(self._data) > settings.ENTITLEMENTS_LOCAL_SIZE:
+                self._data.popitem(last=False)
+
+    def pop(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = _LocalLRU()
+
+
+def _cache_key(user_id):
+    return f"entitlements:user:{user_id}"
+
+
+def load_entitlements(user_id):
+    """Monta o snapshot com uma única consulta (joins em plan, role e assinatura)."""
+    from .models import CustomUser
+
+    row = CustomUser.objects.filter(pk=user_id).values(
+        'plan_id', 'plan__name', 'plan__is_free', 'plan__max_projects',
+        'plan__max_users', 'plan__max_storage_mb', 'role_id', 'role__name',
+        'subscription__plan__name', 'subscription__valid_until', 'subscription__is_active',
+    ).first()
+    if row is None:
+        return None
+
+    valid_until = row['subscription__valid_until']
+    return Entitlements(
+        user_id=user_id,
+        plan_id=row['plan_id'],
+        plan_name=row['plan__name'],
+        plan_is_free=bool(row['plan__is_free']),
+        max_projects=row['plan__max_projects'] or 0,
+        max_users=row['plan__max_users'] or 0,
+        max_storage_mb=row['plan__max_storage_mb'] or 0,
+        role_id=row['role_id'],
+        role_name=row['role__name'],
+        subscription_plan=row['subscription__plan__name'],
+        subscription_valid_until=valid_until.timestamp() if valid_until else None,
+        subscription_active=bool(row['subscription__is_active']),
+    )
+
+
+def get_entitlements(user):
+    """Snapshot do usuário (ou de um id); None para anônimos ou inexistentes."""
+    user_id = getattr(user, 'pk', user)
+    if user_id is None:
+        return None
+
+    snapshot = _local.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    key = _cache_key(user_id)
+    shared = cache.get_many([GENERATION_KEY, key])
+    generation = shared.get(GENERATION_KEY, 0)
+    entry = shared.get(key)
+    if entry is not None and entry[0] == generation:
+        snapshot = Entitlements(*entry[1])
+    else:
+        snapshot = load_entitlements(user_id)
+        if snapshot is None:
+            return None
+        cache.set(key, (generation, tuple(snapshot)), settings.ENTITLEMENTS_CACHE_TIMEOUT)
+
+    _local.set(user_id, snapshot)
+    return snapshot
+
+
+# As invalidações rodam na hora e de novo após o commit: enquanto a transação
+# está aberta, um request concorrente pode reler os dados antigos e guardá-los
+# em cache por ENTITLEMENTS_CACHE_TIMEOUT.
+
+def _drop(user_ids):
+    for user_id in user_ids:
+        _local.pop(user_id)
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate(user_id):
+    """Descarta o snapshot de um usuário (local e compartilhado)."""
+    invalidate_many([user_id])
+
+
+def invalidate_many(user_ids):
+    """Versão em lote de invalidate(), para atualizações set-based."""
+    user_ids = list(user_ids)
+    _drop(user_ids)
+    transaction.on_commit(lambda: _drop(user_ids))
+
+
+def _next_generation():
+    _local.clear()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def invalidate_all():
+    """Descarta todos os snapshots, ex.: quando um Plan ou Role muda."""
+    _next_generation()
+    transaction.on_commit(_next_generation)
+
+
+def clear_local():
+    _local.clear()
+
+
+def _version_key(user_id):
+    return f"entitlements:version:{user_id}"
+
+
+def get_version(user_id):
+    """
+    (geração global, versão do usuário) atuais. A versão vem do cache
+    compartilhado; só em cache miss é lida do banco.
+    """
+    from .models import CustomUser
+
+    key = _version_key(user_id)
+    shared = cache.get_many([GENERATION_KEY, key])
+    generation = shared.get(GENERATION_KEY, 0)
+    version = shared.get(key)
+    if version is None:
+        version = CustomUser.objects.filter(pk=user_id).values_list(
+            'entitlement_version', flat=True).first()
+        if version is None:
+            return generation, None
+        cache.set(key, version, settings.ENTITLEMENTS_CACHE_TIMEOUT)
+    return generation, version
+
+
+def bump_version(user_id, instance=None):
+    """
+    Marca os claims já emitidos para o usuário como desatualizados. A versão
+    é um timestamp em microssegundos, então não precisa ser lida antes.
+    """
+    from .models import CustomUser
+
+    version = time.time_ns() // 1000
+    CustomUser.objects.filter(pk=user_id).update(entitlement_version=version)
+    if instance is not None:
+        instance.entitlement_version = version
+    _forget_versions([user_id])
+    return version
+
+
+def bump_versions(user_ids):
+    """bump_version() para vários usuários em um único UPDATE."""
+    from .models import CustomUser
+
+    user_ids = list(user_ids)
+    version = time.time_ns() // 1000
+    CustomUser.objects.filter(pk__in=user_ids).update(entitlement_version=version)
+    _forget_versions(user_ids)
+    return version
+
+
+def _forget_versions(user_ids):
+    keys = [_version_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # De novo após o commit: um request concorrente pode ter relido e posto
+    # em cache a versão anterior enquanto a transação estava aberta
+    transaction.on_commit(lambda: cache.delete_many(keys))
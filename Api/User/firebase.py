@@ -0,0 +1,195 @@
+# firebase.py
+"""
+Verificação local de ID tokens do Firebase.
+
+Os certificados públicos do Firebase ficam em cache no processo, respeitando
+o max-age do Cache-Control, e são renovados em background antes de expirar.
+Com as chaves em memória a verificação de um token RS256 não faz I/O.
+"""
+import json
+import re
+import threading
+import time
+import urllib.request
+
+import jwt
+from cryptography import x509
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class InvalidFirebaseToken(ValueError):
+    pass
+
+
+def parse_max_age(cache_control, default=3600):
+    match = _MAX_AGE_RE.search(cache_control or "")
+    return int(match.group(1)) if match else default
+
+
+class HttpCertificateSource:
+    """Busca os certificados (kid -> PEM) em uma URL, como o endpoint do Google."""
+
+    def __init__(self, url=GOOGLE_CERTS_URL, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        """Retorna (certificados, max_age em segundos)."""
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            certs = json.loads(response.read().decode())
+            max_age = parse_max_age(response.headers.get("Cache-Control"))
+        return certs, max_age
+
+
+class StaticCertificateSource:
+    """Fonte fixa de certificados, útil em testes."""
+
+    def __init__(self, certs, max_age=3600):
+        self.certs = certs
+        self.max_age = max_age
+
+    def fetch(self):
+        return dict(self.certs), self.max_age
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifica ID tokens do Firebase com as chaves públicas em cache.
+
+    `source` é qualquer objeto com `fetch()` retornando (certificados, max_age).
+    A renovação começa em background quando falta menos de `refresh_margin`
+    segundos para o cache expirar; um `kid` desconhecido força uma renovação
+    síncrona (no máximo uma a cada `min_refresh_interval` segundos).
+    """
+
+    def __init__(self, project_id, source=None, refresh_margin=300,
+                 min_refresh_interval=30, leeway=5):
+        if not project_id:
+            raise ValueError("FIREBASE_PROJECT_ID não configurado.")
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.source = source or HttpCertificateSource()
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self):
+        certs, max_age = self.source.fetch()
+        keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certs.items()
+        }
+        now = time.monotonic()
+        with self._lock:
+            self._keys = keys
+            self._expires_at = now + max_age
+            self._last_refresh = now
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Mantém as chaves atuais; a próxima verificação tenta de novo
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="firebase-certs-refresh", daemon=True).start()
+
+    def _get_key(self, kid):
+        now = time.monotonic()
+        if now >= self._expires_at:
+            try:
+                self.refresh()
+            except Exception:
+                # Sem rede: segue com as chaves antigas, se houver
+                if not self._keys:
+                    raise
+        elif now >= self._expires_at - self.refresh_margin:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_refresh >= self.min_refresh_interval:
+            # Chave rotacionada antes do cache expirar
+            self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise InvalidFirebaseToken("Token do Firebase assinado com chave desconhecida.")
+        return key
+
+    def verify(self, token):
+        """Valida assinatura e claims; retorna o payload com `uid` preenchido."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidFirebaseToken(f"Token do Firebase malformado: {e}")
+
+        if header.get("alg") != "RS256":
+            raise InvalidFirebaseToken("Token do Firebase deve usar RS256.")
+
+        key = self._get_key(header.get("kid"))
+        try:
+            claims = jwt.decode(
+                token,
+                key=key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidFirebaseToken(f"Token do Firebase inválido: {e}")
+
+        if not claims["sub"] or len(claims["sub"]) > 128:
+            raise InvalidFirebaseToken("Token do Firebase com 'sub' inválido.")
+        if claims.get("auth_time", 0) > time.time() + self.leeway:
+            raise InvalidFirebaseToken("Token do Firebase com 'auth_time' no futuro.")
+
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """Verificador compartilhado pelo processo, criado a partir das settings."""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                source = import_string(settings.FIREBASE_CERTS_SOURCE)(settings.FIREBASE_CERTS_URL)
+                _verifier = FirebaseTokenVerifier(settings.FIREBASE_PROJECT_ID, source)
+    return _verifier
+
+
+def reset_verifier():
+    global _verifier
+    with _verifier_lock:
+        _verifier = None
+
+
+def verify_id_token(token):
+    return get_verifier().verify(token)
@@ -0,0 +1,222 @@
+# importer.py
+"""
+Importação em massa de usuários (ex.: turmas de "Aluno UFBA").
+
+A entrada (CSV ou NDJSON, colunas email, name e opcionalmente password, role
+e plan) é lida em streaming e processada em lotes: as senhas são hasheadas em
+um pool de processos (só no comando import_users; o endpoint hasheia no
+próprio processo, sem fork de um worker web com threads), plano e role vêm
+do registro em memória (defaults.py) e cada lote é gravado com um único
+bulk_create. Erros por linha são acumulados no relatório sem abortar a
+importação.
+"""
+import codecs
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .defaults import registry
+
+
+def _hash_password(raw_password):
+    # Executado nos processos do pool; com spawn o Django precisa ser iniciado
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    return make_password(raw_password)
+
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, email, message):
+        self.errors.append({'line': line, 'email': email, 'error': message})
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_sec(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'skipped': self.skipped,
+            'failed': len(self.errors) - self.skipped,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 2),
+            'errors': self.errors,
+        }
+
+
+def _decode(lines):
+    """Aceita linhas em bytes (upload, request) ou str (arquivo texto)."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    if isinstance(first, bytes):
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        yield decoder.decode(first)
+        for line in lines:
+            yield decoder.decode(line)
+    else:
+        yield first.lstrip('\ufeff')
+        yield from lines
+
+
+def read_rows(lines, fmt='csv'):
+    """Gera (número da linha, dict) a partir de linhas CSV ou NDJSON."""
+    lines = _decode(lines)
+    if fmt == 'ndjson':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, ValueError(f"JSON inválido: {e}")
+                continue
+            yield number, row if isinstance(row, dict) else ValueError("Cada linha deve ser um objeto JSON.")
+    elif fmt == 'csv':
+        # Cabeçalho é a linha 1
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            yield number, row
+    else:
+        raise ValueError(f"Formato desconhecido: {fmt}")
+
+
+class UserImporter:
+    def __init__(self, chunk_size=1000, workers=None):
+        self.chunk_size = chunk_size
+        # workers=0 hasheia no próprio processo (útil em testes)
+        self.workers = workers
+
+    def build_user(self, row):
+        """Valida a linha e devolve (usuário sem senha, senha em texto ou None)."""
+        from .models import CustomUser
+
+        email = CustomUser.objects.normalize_email(str(row.get('email') or '').strip())
+        validate_email(email)
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ValidationError("Nome é obrigatório.")
+
+        plan_id, role_id = registry.defaults_for(email)
+        if row.get('plan'):
+            plan_id = registry.plan_id(row['plan'])
+            if plan_id is None:
+                raise ValidationError(f"Plano '{row['plan']}' não existe.")
+        if row.get('role'):
+            role_id = registry.role_id(row['role'])
+            if role_id is None:
+                raise ValidationError(f"Role '{row['role']}' não existe.")
+
+        user = CustomUser(email=email, name=name, plan_id=plan_id, role_id=role_id)
+        return user, str(row['password']) if row.get('password') else None
+
+    def run(self, rows):
+        report = ImportReport()
+        executor = ProcessPoolExecutor(self.workers) if self.workers != 0 else None
+        try:
+            seen = set()
+            rows = iter(rows)
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(chunk, seen, executor, report)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return report.finish()
+
+    def _import_chunk(self, chunk, seen, executor, report):
+        from .models import CustomUser
+
+        pending = []
+        for number, row in chunk:
+            report.total += 1
+            email = row.get('email') if isinstance(row, dict) else None
+            if isinstance(row, Exception):
+                report.error(number, email, str(row))
+                continue
+            try:
+                user, password = self.build_user(row)
+            except ValidationError as e:
+                report.error(number, email, "; ".join(e.messages))
+                continue
+            if user.email in seen:
+                report.error(number, user.email, "E-mail repetido no arquivo.")
+                continue
+            seen.add(user.email)
+            pending.append((number, user, password))
+
+        if not pending:
+            return
+
+        existing = set(CustomUser.objects.filter(
+            email__in=[user.email for _, user, _ in pending]).values_list('email', flat=True))
+        for number, user, _ in pending:
+            if user.email in existing:
+                report.skipped += 1
+                report.error(number, user.email, "E-mail já cadastrado.")
+        pending = [item for item in pending if item[1].email not in existing]
+
+        # Só senhas reais vão para o pool; sem senha o hash é inutilizável
+        with_password = [(user, password) for _, user, password in pending if password]
+        passwords = [password for _, password in with_password]
+        if executor is not None and passwords:
+            hashes = executor.map(_hash_password, passwords, chunksize=max(1, len(passwords) // 32))
+        else:
+            hashes = map(make_password, passwords)
+        for (user, _), encoded in zip(with_password, hashes):
+            user.password = encoded
+        for _, user, password in pending:
+            if not password:
+                user.set_unusable_password()
+
+        while pending:
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.bulk_create([user for _, user, _ in pending])
+            except IntegrityError as e:
+                # E-mails criados em paralelo desde a checagem: saem do lote
+                # com erro na linha e o restante é gravado de novo
+                taken = set(CustomUser.objects.filter(
+                    email__in=[user.email for _, user, _ in pending]).values_list('email', flat=True))
+                if not taken:
+                    self._chunk_failed(pending, e, report)
+                    return
+                for number, user, _ in pending:
+                    if user.email in taken:
+                        report.skipped += 1
+                        report.error(number, user.email, "E-mail já cadastrado.")
+                pending = [item for item in pending if item[1].email not in taken]
+            except DatabaseError as e:
+                self._chunk_failed(pending, e, report)
+                return
+            else:
+                report.created += len(pending)
+                return
+
+    def _chunk_failed(self, pending, error, report):
+        for number, user, _ in pending:
+            report.error(number, user.email, f"Erro ao gravar o lote: {error}")
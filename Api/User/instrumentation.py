@@ -0,0 +1,187 @@
+# instrumentation.py
+"""
+Métricas por view no formato texto do Prometheus (GET /metrics).
+
+O InstrumentationMiddleware registra, para cada request, a latência
+(histograma), o status, o tamanho da resposta e as queries feitas e o tempo
+gasto no banco (via `connection.execute_wrapper`). A view é identificada
+pelo nome da URL, então a cardinalidade fica limitada às rotas do projeto
+(URLs que não resolvem entram como `<unresolved>`).
+
+Agregação sem lock no caminho do request: cada thread escreve no próprio
+shard (um dicionário só dela); a leitura em /metrics soma os shards. Um
+scrape pode ver um request pela metade (contagem já somada, soma ainda
+não), o que é aceitável para contadores monotônicos. As métricas são por
+processo, como em /metrics/load/; o scrape também inclui o controle de
+admissão e as conexões com o banco.
+"""
+import bisect
+import threading
+
+from . import admission, dbpool
+
+# Limites superiores (segundos) dos buckets de latência
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = '<unresolved>'
+
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _new_shard(thread=None):
+    return {'thread': thread, 'requests': {}, 'views': {}}
+
+
+# Shards de threads que já terminaram (ex.: servidor com uma thread por conexão)
+_retired = _new_shard()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _new_shard(threading.current_thread())
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def record(view, method, status, seconds, queries=0, db_seconds=0.0, response_bytes=None):
+    """Registra um request no shard da thread atual."""
+    shard = _shard()
+    key = (view, method, str(status))
+    shard['requests'][key] = shard['requests'].get(key, 0) + 1
+
+    stats = shard['views'].get((view, method))
+    if stats is None:
+        stats = shard['views'][(view, method)] = {
+            'buckets': [0] * (len(BUCKETS) + 1), 'count': 0, 'sum': 0.0,
+            'queries': 0, 'db_seconds': 0.0, 'bytes': 0, 'sized': 0,
+        }
+    stats['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+    stats['count'] += 1
+    stats['sum'] += seconds
+    stats['queries'] += queries
+    stats['db_seconds'] += db_seconds
+    if response_bytes is not None:
+        stats['bytes'] += response_bytes
+        stats['sized'] += 1
+
+
+def _merge(into, shard):
+    for key, count in list(shard['requests'].items()):
+        into['requests'][key] = into['requests'].get(key, 0) + count
+    for key, stats in list(shard['views'].items()):
+        total = into['views'].get(key)
+        if total is None:
+            into['views'][key] = {**stats, 'buckets': list(stats['buckets'])}
+            continue
+        total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        for field in ('count', 'sum', 'queries', 'db_seconds', 'bytes', 'sized'):
+            total[field] += stats[field]
+
+
+def snapshot():
+    """Soma dos shards de todas as threads: (requests por status, estatísticas por view)."""
+    with _shards_lock:
+        for shard in [s for s in _shards if not s['thread'].is_alive()]:
+            _shards.remove(shard)
+            _merge(_retired, shard)
+        shards = [_retired, *_shards]
+        total = _new_shard()
+        for shard in shards:
+            _merge(total, shard)
+    return total['requests'], total['views']
+
+
+def reset():
+    with _shards_lock:
+        for shard in (_retired, *_shards):
+            shard['requests'].clear()
+            shard['views'].clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            self.lines.append(f"{name}{suffix}{_labels(labels) if labels else ''} {_number(value)}")
+
+
+def render():
+    """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+    requests, views = snapshot()
+    out = _Writer()
+
+    out.metric('http_requests_total', 'counter', "Requests por view, método e status.", [
+        ('', {'view': view, 'method': method, 'status': status}, count)
+        for (view, method, status), count in sorted(requests.items())
+    ])
+
+    duration = []
+    for (view, method), stats in sorted(views.items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), stats['buckets']):
+            cumulative += count
+            duration.append(('_bucket', {'view': view, 'method': method, 'le': bound}, cumulative))
+        duration.append(('_sum', {'view': view, 'method': method}, stats['sum']))
+        duration.append(('_count', {'view': view, 'method': method}, stats['count']))
+    out.metric('http_request_duration_seconds', 'histogram', "Latência dos requests.", duration)
+
+    out.metric('http_db_queries_total', 'counter', "Queries executadas pelos requests.", [
+        ('', {'view': view, 'method': method}, stats['queries']) for (view, method), stats in sorted(views.items())
+    ])
+    out.metric('http_db_duration_seconds_total', 'counter', "Tempo gasto no banco pelos requests.", [
+        ('', {'view': view, 'method': method}, stats['db_seconds'])
+        for (view, method), stats in sorted(views.items())
+    ])
+    sizes = []
+    for (view, method), stats in sorted(views.items()):
+        sizes.append(('_sum', {'view': view, 'method': method}, stats['bytes']))
+        sizes.append(('_count', {'view': view, 'method': method}, stats['sized']))
+    out.metric('http_response_size_bytes', 'summary', "Tamanho do corpo das respostas.", sizes)
+
+    limiters = admission.metrics()
+    for field, kind, help_text in (
+        ('limit', 'gauge', "Limite atual de requests simultâneos."),
+        ('inflight', 'gauge', "Requests em andamento."),
+        ('queue_depth', 'gauge', "Requests esperando vaga."),
+        ('admitted', 'counter', "Requests admitidos."),
+        ('rejected', 'counter', "Requests rejeitados."),
+    ):
+        name = f"admission_{field}" + ('_total' if kind == 'counter' else '')
+        out.metric(name, kind, help_text, [
+            ('', {'class': limiter}, snap[field]) for limiter, snap in sorted(limiters.items())
+        ])
+
+    databases = dbpool.stats()['databases']
+    out.metric('db_connections_opened_total', 'counter', "Conexões abertas pelo processo.", [
+        ('', {'alias': alias}, entry['connections_opened']) for alias, entry in sorted(databases.items())
+    ])
+    pools = {alias: entry['pool'] for alias, entry in databases.items() if 'pool' in entry}
+    if pools:
+        for field in ('size', 'in_use', 'available', 'waiting'):
+            out.metric(f'db_pool_{field}', 'gauge', f"Pool de conexões: {field}.", [
+                ('', {'alias': alias}, pool[field]) for alias, pool in sorted(pools.items())
+            ])
+        out.metric('db_pool_wait_seconds_total', 'counter', "Tempo total esperando conexão do pool.", [
+            ('', {'alias': alias}, pool['wait_ms_total'] / 1000) for alias, pool in sorted(pools.items())
+        ])
+
+    return '\n'.join(out.lines) + '\n'
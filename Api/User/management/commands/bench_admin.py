@@ -0,0 +1,58 @@
+import json
+
+from django.test import Client
+from django.urls import reverse
+
+from User.models import CustomUser, Role
+
+from .bench_directory import Command as DirectoryBenchCommand
+from .bench_http import analyze, throwaway_database
+
+
+class Command(DirectoryBenchCommand):
+    help = (
+        "Benchmark do changelist de usuários no admin: cria N usuários em um banco "
+        "de teste descartável e mede a lista, um filtro por role e a busca por prefixo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--samples', type=int, default=10, help="Requisições por cenário.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def run_all(self, options, admin):
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:User_customuser_changelist')
+        role = Role.objects.order_by('pk').first()
+        scenarios = [
+            ('lista', {}),
+            ('filtro por role', {'role__id__exact': role.pk} if role else {}),
+            ('busca por prefixo', {'q': 'bench-dir-4242'}),
+            ('página 100', {'p': 100}),
+        ]
+
+        def get(params):
+            response = client.get(url, params)
+            assert response.status_code == 200, response.status_code
+
+        return [
+            {'scenario': name, 'params': params, 'ms': self.timed(lambda: get(params), options['samples'])}
+            for name, params in scenarios
+        ]
+
+    def handle(self, *args, **options):
+        # Carga gravada e analisada antes de medir, como no bench_directory
+        with throwaway_database():
+            self.populate(options['users'])
+            admin = CustomUser.objects.create_superuser(email="bench-admin@exemplo.com", password=None, name="Bench")
+            analyze(CustomUser)
+            results = self.run_all(options, admin)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'users': options['users'], 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"{options['users']} usuários")
+        for r in results:
+            self.stdout.write(f"{r['scenario']:<20} {r['ms']:>9.3f} ms")
@@ -0,0 +1,80 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from User import dbpool
+from User.models import CustomUser
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de conexões: simula requests curtos (um SELECT por request) "
+        "abrindo uma conexão nova a cada request e reaproveitando conexões "
+        "(CONN_MAX_AGE ou DB_POOL, conforme o settings), e compara p50/p99."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def fake_request(self, fresh):
+        # Mesmo ciclo de vida de um request real: request_finished chama
+        # close_old_connections(), que respeita CONN_MAX_AGE / devolve ao pool
+        request_started.send(sender=self.__class__)
+        try:
+            CustomUser.objects.filter(pk=0).exists()
+        finally:
+            request_finished.send(sender=self.__class__)
+            if fresh:
+                connection.close()
+                if getattr(connection, 'pool', None):
+                    connection.close_pool()
+
+    def run_mode(self, total, fresh):
+        opened_before = dbpool.stats()['databases']['default']['connections_opened']
+        timings = []
+        for _ in range(total):
+            started = time.perf_counter()
+            self.fake_request(fresh)
+            timings.append((time.perf_counter() - started) * 1000)
+        opened = dbpool.stats()['databases']['default']['connections_opened'] - opened_before
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'connections_opened': opened,
+        }
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        configured = dbpool.stats()['databases']['default']['mode']
+        if configured == 'per-request':
+            # Sem DATABASE_URL (sqlite de fallback): liga o reuso só para o benchmark
+            settings_dict['CONN_MAX_AGE'] = 60
+            configured = 'persistent'
+        connection.close()
+
+        results = {
+            'vendor': connection.vendor,
+            'requests': options['requests'],
+            'new_connection_per_request': self.run_mode(options['requests'], fresh=True),
+            configured: self.run_mode(options['requests'], fresh=False),
+            'stats': dbpool.stats()['databases']['default'],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode in ('new_connection_per_request', configured):
+            r = results[mode]
+            self.stdout.write(
+                f"{mode:<28} p50 {r['p50_ms']:>8.3f} ms  p99 {r['p99_ms']:>8.3f} ms  "
+                f"{r['connections_opened']:>5} conexões abertas"
+            )
@@ -0,0 +1,110 @@
+import base64
+import json
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from User.models import CustomUser, Plan, Role
+from User.serializer import UserSerializer
+from User.views import UserDirectoryView
+
+from .bench_http import analyze, throwaway_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark do diretório de usuários: cria N usuários em um banco de teste "
+        "descartável e mede a latência de uma página em várias profundidades, com "
+        "cursor (keyset) e, para comparação, com OFFSET."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--samples', type=int, default=20, help="Requisições por profundidade.")
+        parser.add_argument('--depths', default="0,0.25,0.5,0.75,0.99",
+                            help="Profundidades relativas, separadas por vírgula.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def populate(self, total):
+        roles = list(Role.objects.values_list('pk', flat=True)) or [None]
+        plans = list(Plan.objects.values_list('pk', flat=True)) or [None]
+        password = make_password(None)
+        batch = 10000
+        for start in range(0, total, batch):
+            CustomUser.objects.bulk_create([
+                CustomUser(
+                    email=f"bench-dir-{i}@exemplo.com", name=f"Bench {i}", password=password,
+                    role_id=roles[i % len(roles)], plan_id=plans[i % len(plans)],
+                )
+                for i in range(start, min(start + batch, total))
+            ])
+
+    def timed(self, fn, samples):
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(timings), 3)
+
+    def run_all(self, options, admin):
+        factory = APIRequestFactory()
+        view = UserDirectoryView.as_view()
+        page_size = options['page_size']
+        ids = CustomUser.objects.order_by('id').values_list('id', flat=True)
+        total = ids.count()
+
+        def keyset(position):
+            params = {'page_size': page_size}
+            if position is not None:
+                params['cursor'] = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            request = factory.get('/api/users/directory/', params)
+            force_authenticate(request, user=admin)
+            response = view(request)
+            response.render()
+            assert response.status_code == 200, response.status_code
+
+        def offset(skip):
+            # Mesma consulta e serialização, paginando com OFFSET
+            page = CustomUser.objects.select_related('role', 'plan').order_by('id')[skip:skip + page_size]
+            json.dumps(UserSerializer(page, many=True).data, default=str)
+
+        results = []
+        for depth in [float(d) for d in options['depths'].split(',')]:
+            skip = min(int(total * depth), max(total - page_size, 0))
+            position = ids[skip - 1] if skip else None
+            results.append({
+                'depth': depth,
+                'offset_rows': skip,
+                'keyset_ms': self.timed(lambda: keyset(position), options['samples']),
+                'offset_ms': self.timed(lambda: offset(skip), options['samples']),
+            })
+        return results
+
+    def handle(self, *args, **options):
+        # A carga é gravada (commit) e analisada antes de medir: numa transação
+        # aberta o planejador não veria as estatísticas da tabela cheia
+        with throwaway_database():
+            started = time.perf_counter()
+            self.populate(options['users'])
+            populate_seconds = round(time.perf_counter() - started, 1)
+            admin_role, _ = Role.objects.get_or_create(name="Administrador")
+            admin = CustomUser.objects.create(email="bench-dir-admin@exemplo.com", name="Bench", role=admin_role)
+            analyze(CustomUser)
+            results = self.run_all(options, admin)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'users': options['users'], 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"{options['users']} usuários criados em {populate_seconds}s")
+        for r in results:
+            self.stdout.write(
+                f"profundidade {r['depth']:>5.2f} ({r['offset_rows']:>9} linhas)  "
+                f"keyset {r['keyset_ms']:>9.3f} ms/página  OFFSET {r['offset_ms']:>9.3f} ms/página"
+            )
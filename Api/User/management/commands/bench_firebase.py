@@ -0,0 +1,54 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from User.firebase import FirebaseTokenVerifier, HttpCertificateSource
+from User.standins import FirebaseKeyServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark da verificação local de ID tokens do Firebase, usando "
+        "um servidor de chaves local (sem rede)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0)
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        with FirebaseKeyServer("bench-project") as server:
+            verifier = FirebaseTokenVerifier("bench-project", HttpCertificateSource(server.url))
+            token = server.make_token(uid="bench", email="bench@exemplo.com")
+
+            # Primeira chamada busca os certificados; fica fora da medição
+            started = time.perf_counter()
+            verifier.verify(token)
+            cold_ms = (time.perf_counter() - started) * 1000
+
+            verifications = 0
+            started = time.perf_counter()
+            deadline = started + options['seconds']
+            while time.perf_counter() < deadline:
+                verifier.verify(token)
+                verifications += 1
+            elapsed = time.perf_counter() - started
+            fetches = server.requests
+
+        result = {
+            'cold_ms': round(cold_ms, 3),
+            'verifications': verifications,
+            'verifications_per_sec': round(verifications / elapsed, 2),
+            'us_per_verification': round(elapsed * 1e6 / verifications, 2),
+            'cert_fetches': fetches,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            f"primeira verificação: {result['cold_ms']} ms | "
+            f"{result['verifications_per_sec']} verificações/s | "
+            f"{result['us_per_verification']} µs/verificação | "
+            f"{result['cert_fetches']} busca(s) de certificados"
+        )
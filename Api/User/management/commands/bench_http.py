@@ -0,0 +1,315 @@
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from User import firebase
+from User.models import CustomUser
+from User.outbox import OutboxWorker
+from User.standins import FirebaseKeyServer, SMTPSink
+
+from .bench_db import percentile
+
+QUERIES_HEADER = 'X-Bench-Queries'
+PASSWORD = "senha-de-benchmark-123"
+EMAIL_DOMAIN = "bench.local"
+FIREBASE_PROJECT = "bench-project"
+
+# Cenário -> (método, nome da URL)
+SCENARIOS = {
+    'token': ('POST', 'token_obtain_pair'),
+    'refresh': ('POST', 'token_refresh'),
+    'signup': ('POST', 'create-user'),
+    'firebase_login': ('POST', 'firebase-login'),
+    'password_reset': ('POST', 'password_reset_request'),
+    'health': ('GET', 'health_check'),
+}
+
+
+class QueryCountingApp:
+    """Aplicação WSGI que devolve no header X-Bench-Queries as queries feitas pelo request."""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def counting_start_response(status, headers, exc_info=None):
+            # O Django chama start_response depois da view: a contagem já está completa
+            return start_response(status, [*headers, (QUERIES_HEADER, str(queries))], exc_info)
+
+        with connection.execute_wrapper(count):
+            return self.application(environ, counting_start_response)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def setup(self):
+        super().setup()
+        # Headers e corpo saem em escritas separadas: sem isso, Nagle + ACK
+        # atrasado somam ~40 ms a cada request na conexão keep-alive
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+
+class Fixtures:
+    """Dados dos cenários: usuários com senha conhecida e ID tokens do Firebase."""
+
+    def __init__(self, users, firebase_server):
+        encoded = make_password(PASSWORD)
+        self.users = []
+        for i in range(users):
+            user = CustomUser.objects.create_user(email=f"user{i}@{EMAIL_DOMAIN}", name=f"Bench {i}")
+            user.password = encoded
+            self.users.append(user)
+        CustomUser.objects.bulk_update(self.users, ['password'])
+        self.firebase_tokens = [
+            firebase_server.make_token(uid=f"fb{i}", email=f"firebase{i}@{EMAIL_DOMAIN}") for i in range(users)
+        ]
+        self._signups = itertools.count()
+
+    def body(self, scenario, i):
+        user = self.users[i % len(self.users)]
+        if scenario == 'token':
+            return {'email': user.email, 'password': PASSWORD}
+        if scenario == 'refresh':
+            # Com rotação cada refresh token vale uma vez: um novo por request (sem banco)
+            return {'refresh': str(RefreshToken.for_user(user))}
+        if scenario == 'signup':
+            n = next(self._signups)
+            return {'email': f"signup{n}@{EMAIL_DOMAIN}", 'name': f"Signup {n}", 'password': PASSWORD}
+        if scenario == 'firebase_login':
+            return {'firebase_token': self.firebase_tokens[i % len(self.firebase_tokens)]}
+        if scenario == 'password_reset':
+            return {'email': user.email}
+        return None
+
+
+def summarize(samples, elapsed):
+    """samples: [(status, latência em s, queries)] -> métricas do cenário."""
+    if not samples:
+        return {'requests': 0, 'errors': 0, 'rps': 0.0, 'status': {}}
+    latencies = [latency * 1000 for _, latency, _ in samples]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [s for s in samples if isinstance(s[0], int) and s[0] < 400]
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'rps': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries_per_request': round(sum(q for _, _, q in ok) / len(ok), 2) if ok else None,
+        'status': statuses,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressões em relação a um resultado anterior (mesmo formato JSON)."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous.get('requests') or not current.get('requests'):
+            continue
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        # Queries por request são determinísticas: qualquer aumento conta
+        if (current.get('queries_per_request') or 0) > (previous.get('queries_per_request') or 0):
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}")
+    return regressions
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """
+    Banco de teste descartável: resultados reproduzíveis e nada escrito no banco
+    real. No SQLite usa um arquivo (o banco em memória não aguenta escrita concorrente).
+    """
+    old_name = connection.settings_dict['NAME']
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def analyze(model):
+    """Atualiza as estatísticas do planejador depois da carga, como em produção."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE TABLE {table}" if connection.vendor == 'mysql' else f"ANALYZE {table}")
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga HTTP: sobe a aplicação localmente (banco de teste descartável, "
+        "Firebase e SMTP substituídos por stand-ins locais) e mede requests/s, "
+        "p50/p95/p99 e queries por request de cada endpoint, com N clientes simultâneos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), dest='scenarios',
+                            help="Cenário a rodar (repetível). Padrão: todos.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Clientes simultâneos.")
+        parser.add_argument('--duration', type=float, default=3.0, help="Segundos de medição por cenário.")
+        parser.add_argument('--warmup', type=int, default=5, help="Requests descartados antes de medir.")
+        parser.add_argument('--users', type=int, default=20, help="Usuários criados para os cenários.")
+        parser.add_argument('--rate-limit', action='store_true',
+                            help="Mantém o limite de tentativas (por padrão é desligado no benchmark).")
+        parser.add_argument('--output', help="Grava o resultado JSON neste arquivo.")
+        parser.add_argument('--baseline', help="JSON de uma execução anterior para comparar.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Piora aceita em rps/p95 contra o baseline (0.2 = 20%%).")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    @contextlib.contextmanager
+    def server(self):
+        httpd = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        httpd.set_app(QueryCountingApp(get_internal_wsgi_application()))
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield httpd.server_address[:2]
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def run_scenario(self, address, scenario, fixtures, options):
+        method, url_name = SCENARIOS[scenario]
+        path = reverse(url_name)
+        counter = itertools.count()
+
+        def client(deadline, limit=None):
+            conn = http.client.HTTPConnection(*address, timeout=30)
+            samples = []
+            try:
+                while time.perf_counter() < deadline and (limit is None or len(samples) < limit):
+                    body = fixtures.body(scenario, next(counter))
+                    payload = json.dumps(body).encode() if body is not None else None
+                    headers = {'Content-Type': 'application/json'} if payload else {}
+                    started = time.perf_counter()
+                    try:
+                        conn.request(method, path, body=payload, headers=headers)
+                        response = conn.getresponse()
+                        response.read()
+                        status = response.status
+                        queries = int(response.getheader(QUERIES_HEADER) or 0)
+                    except (OSError, http.client.HTTPException) as e:
+                        conn.close()
+                        status, queries = type(e).__name__, 0
+                    samples.append((status, time.perf_counter() - started, queries))
+            finally:
+                conn.close()
+            return samples
+
+        if options['warmup']:
+            client(time.perf_counter() + 30, limit=options['warmup'])
+
+        concurrency = options['concurrency']
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            deadline = started + options['duration']
+            futures = [pool.submit(client, deadline) for _ in range(concurrency)]
+            samples = [sample for future in futures for sample in future.result()]
+            elapsed = time.perf_counter() - started
+        return summarize(samples, elapsed)
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        results = {
+            'commit': current_commit(),
+            'vendor': connection.vendor,
+            'password_hasher': settings.PASSWORD_HASHERS[0].rsplit('.', 1)[-1],
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'scenarios': {},
+        }
+
+        with FirebaseKeyServer(FIREBASE_PROJECT) as key_server, SMTPSink() as sink, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'],
+            RATE_LIMIT_ENABLED=settings.RATE_LIMIT_ENABLED and options['rate_limit'],
+            FIREBASE_PROJECT_ID=FIREBASE_PROJECT,
+            FIREBASE_CERTS_URL=key_server.url,
+            FIREBASE_CERTS_SOURCE='User.firebase.HttpCertificateSource',
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=sink.host, EMAIL_PORT=sink.port, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+        ), throwaway_database():
+            firebase.reset_verifier()
+            try:
+                fixtures = Fixtures(options['users'], key_server)
+                with self.server() as address:
+                    for scenario in scenarios:
+                        results['scenarios'][scenario] = self.run_scenario(address, scenario, fixtures, options)
+                if 'password_reset' in scenarios:
+                    # Os e-mails enfileirados saem pelo worker, contra o SMTP local
+                    results['scenarios']['password_reset']['emails'] = OutboxWorker().drain()
+                    results['scenarios']['password_reset']['smtp_messages'] = len(sink.messages)
+            finally:
+                firebase.reset_verifier()
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                results['regressions'] = compare(results, json.load(f), options['tolerance'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for name, r in results['scenarios'].items():
+                if not r['requests']:
+                    self.stdout.write(f"{name:<16} sem requests")
+                    continue
+                queries = r['queries_per_request'] if r['queries_per_request'] is not None else '-'
+                self.stdout.write(
+                    f"{name:<16} {r['rps']:>9.2f} req/s  p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                    f"p99 {r['p99_ms']:>8.2f} ms  {queries:>5} queries/req  {r['errors']} erro(s)"
+                )
+            for regression in results.get('regressions', []):
+                self.stdout.write(self.style.ERROR(f"regressão: {regression}"))
+
+        if results.get('regressions'):
+            raise CommandError(f"{len(results['regressions'])} regressão(ões) em relação ao baseline.")
@@ -0,0 +1,99 @@
+import json
+import time
+
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+)
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from User.models import CustomUser
+from User.serializer import CustomTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark do login: mede logins/s por worker (verificação da "
+        "senha + emissão do par de tokens) para cada hasher suportado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0,
+                            help="Tempo de medição por hasher (padrão: 2s).")
+        parser.add_argument('--pbkdf2-iterations', type=int, default=PBKDF2PasswordHasher.iterations)
+        parser.add_argument('--argon2-time-cost', type=int, default=Argon2PasswordHasher.time_cost)
+        parser.add_argument('--argon2-memory-cost', type=int, default=Argon2PasswordHasher.memory_cost)
+        parser.add_argument('--bcrypt-rounds', type=int, default=BCryptSHA256PasswordHasher.rounds)
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def build_hashers(self, options):
+        # Subclasses com o custo pedido, sem depender de PASSWORD_HASHERS
+        return [
+            ('pbkdf2_sha256', f"iterations={options['pbkdf2_iterations']}", type(
+                'BenchPBKDF2', (PBKDF2PasswordHasher,), {'iterations': options['pbkdf2_iterations']})()),
+            ('argon2', f"time_cost={options['argon2_time_cost']} memory_cost={options['argon2_memory_cost']}", type(
+                'BenchArgon2', (Argon2PasswordHasher,), {
+                    'time_cost': options['argon2_time_cost'],
+                    'memory_cost': options['argon2_memory_cost'],
+                })()),
+            ('bcrypt_sha256', f"rounds={options['bcrypt_rounds']}", type(
+                'BenchBCrypt', (BCryptSHA256PasswordHasher,), {'rounds': options['bcrypt_rounds']})()),
+        ]
+
+    def bench(self, hasher, seconds, user):
+        password = "senha-de-benchmark-123"
+        encoded = hasher.encode(password, hasher.salt())
+
+        logins = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            if not hasher.verify(password, encoded):
+                raise RuntimeError("Falha ao verificar a senha de benchmark.")
+            refresh = CustomTokenObtainPairSerializer.get_token(user)
+            str(refresh)
+            str(refresh.access_token)
+            logins += 1
+        elapsed = time.perf_counter() - started
+        return logins, elapsed
+
+    def run_all(self, options, user):
+        results = []
+        for algorithm, params, hasher in self.build_hashers(options):
+            try:
+                logins, elapsed = self.bench(hasher, options['seconds'], user)
+            except ValueError as e:
+                # Biblioteca opcional (argon2-cffi / bcrypt) não instalada
+                results.append({'hasher': algorithm, 'params': params, 'error': str(e)})
+                continue
+            results.append({
+                'hasher': algorithm,
+                'params': params,
+                'logins': logins,
+                'logins_per_sec': round(logins / elapsed, 2),
+                'ms_per_login': round(elapsed * 1000 / logins, 3),
+            })
+        return results
+
+    def handle(self, *args, **options):
+        # Usuário temporário (desfeito no rollback); os claims de direitos do
+        # token ficam em cache após a primeira emissão
+        with transaction.atomic():
+            user = CustomUser.objects.create(email="bench-login@exemplo.com", name="Bench")
+            results = self.run_all(options, user)
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for r in results:
+            if 'error' in r:
+                self.stdout.write(self.style.WARNING(f"{r['hasher']:<15} indisponível: {r['error']}"))
+            else:
+                self.stdout.write(
+                    f"{r['hasher']:<15} {r['params']:<40} "
+                    f"{r['logins_per_sec']:>10.2f} logins/s  {r['ms_per_login']:>9.3f} ms/login"
+                )
@@ -0,0 +1,91 @@
+import json
+import statistics
+import time
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from User.models import CustomUser, OutboxEmail
+from User.outbox import OutboxWorker
+from User.standins import SMTPSink
+from User.views import PasswordResetRequestView
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark da fila de e-mails contra um SMTP local: envio síncrono (uma "
+        "conexão por e-mail, como era no request) x worker em lotes, e a "
+        "latência do POST de redefinição para e-mails existentes e inexistentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--smtp-delay-ms', type=float, default=1.0,
+                            help="Latência simulada do servidor SMTP por mensagem.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def bench_sync(self, sink, total):
+        started = time.perf_counter()
+        for i in range(total):
+            connection = get_connection(SMTP_BACKEND, host=sink.host, port=sink.port)
+            send_mail("Benchmark", "Corpo", None, [f"sync-{i}@exemplo.com"], connection=connection)
+        return time.perf_counter() - started
+
+    def bench_outbox(self, sink, total, batch_size):
+        OutboxEmail.objects.bulk_create([
+            OutboxEmail(to_email=f"fila-{i}@exemplo.com", subject="Benchmark", body="Corpo") for i in range(total)
+        ])
+        connection = get_connection(SMTP_BACKEND, host=sink.host, port=sink.port)
+        stats = OutboxWorker(batch_size=batch_size, connection=connection).drain()
+        return stats
+
+    def bench_request(self, samples=200):
+        factory = APIRequestFactory()
+        view = PasswordResetRequestView.as_view()
+        CustomUser.objects.create_user(email="existe@exemplo.com", name="Existe")
+
+        def timed(email):
+            timings = []
+            for _ in range(samples):
+                request = factory.post('/api/password-reset/', {'email': email}, format='json')
+                started = time.perf_counter()
+                view(request)
+                timings.append((time.perf_counter() - started) * 1000)
+            return round(statistics.median(timings), 3)
+
+        return {'existente_ms': timed("existe@exemplo.com"), 'inexistente_ms': timed("nao-existe@exemplo.com")}
+
+    def handle(self, *args, **options):
+        total = options['emails']
+        with SMTPSink(delay=options['smtp_delay_ms'] / 1000) as sink, transaction.atomic():
+            sync_seconds = self.bench_sync(sink, total)
+            sync_connections = sink.connections
+            stats = self.bench_outbox(sink, total, options['batch_size'])
+            request = self.bench_request()
+            transaction.set_rollback(True)
+
+        results = {
+            'emails': total,
+            'sync': {'emails_per_sec': round(total / sync_seconds, 1), 'smtp_connections': sync_connections},
+            'outbox': {
+                'emails_per_sec': round(stats['sent'] / stats['elapsed_seconds'], 1) if stats['elapsed_seconds'] else None,
+                'smtp_connections': sink.connections - sync_connections,
+                'batches': stats['batches'],
+            },
+            'password_reset_request': request,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"síncrono: {results['sync']['emails_per_sec']} e-mails/s ({sync_connections} conexões SMTP)\n"
+            f"fila:     {results['outbox']['emails_per_sec']} e-mails/s "
+            f"({results['outbox']['smtp_connections']} conexões SMTP, {stats['batches']} lotes)\n"
+            f"POST /api/password-reset/: {request['existente_ms']} ms (e-mail existente), "
+            f"{request['inexistente_ms']} ms (inexistente)"
+        )
@@ -0,0 +1,26 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from User.subscriptions import expire_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Desativa assinaturas vencidas em lotes curtos (opcionalmente volta os usuários ao plano gratuito)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.SUBSCRIPTION_SWEEP_CHUNK_SIZE)
+        parser.add_argument('--downgrade', action='store_true', default=settings.SUBSCRIPTION_SWEEP_DOWNGRADE,
+                            help="Move os usuários das assinaturas expiradas para o plano gratuito.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        stats = expire_subscriptions(chunk_size=options['chunk_size'], downgrade=options['downgrade'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['expired']} assinaturas expiradas, {stats['downgraded']} usuários no plano gratuito, "
+            f"{stats['chunks']} lote(s) em {stats['elapsed_seconds']}s (maior lote: {stats['max_chunk_ms']} ms)"
+        ))
@@ -0,0 +1,44 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from User.importer import UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Importa usuários em massa a partir de um arquivo CSV ou NDJSON ('-' lê da entrada padrão)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Padrão: deduzido pela extensão do arquivo (csv).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processos para hashear senhas (padrão: núcleos da máquina; 0 desliga o pool).")
+        parser.add_argument('--json', action='store_true', help="Relatório em JSON.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        importer = UserImporter(chunk_size=options['chunk_size'], workers=options['workers'])
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f"Não foi possível abrir {path}: {e}")
+        with stream:
+            report = importer.run(read_rows(stream, fmt))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report.as_dict(), indent=2, ensure_ascii=False))
+            return
+
+        for error in report.errors:
+            self.stderr.write(f"linha {error['line']} ({error['email']}): {error['error']}")
+        summary = report.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['created']} criados, {summary['skipped']} já existentes, "
+            f"{summary['failed']} com erro de {summary['total']} linhas "
+            f"em {summary['elapsed_seconds']}s ({summary['rows_per_sec']} linhas/s)"
+        ))
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from User.domains import reassign_roles
+
+
+class Command(BaseCommand):
+    help = "Reaplica as regras de role por domínio (DomainRoleRule) aos usuários já cadastrados, em lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--overwrite', action='store_true',
+                            help="Troca também roles que não vieram de regra (ex.: definidas pelo admin).")
+        parser.add_argument('--dry-run', action='store_true', help="Só conta, sem gravar.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        stats = reassign_roles(
+            chunk_size=options['chunk_size'], overwrite=options['overwrite'], dry_run=options['dry_run'],
+        )
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        verbo = "mudariam" if options['dry_run'] else "mudaram"
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['checked']} usuários conferidos, {stats['changed']} {verbo} de role, "
+            f"{stats['chunks']} lote(s) em {stats['elapsed_seconds']}s"
+        ))
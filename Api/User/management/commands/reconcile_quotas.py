@@ -0,0 +1,24 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from User.quotas import reconcile
+
+
+class Command(BaseCommand):
+    help = "Confere os contadores de cota (QuotaUsage) contra as contagens reais, em lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.QUOTA_RECONCILE_CHUNK_SIZE)
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        stats = reconcile(chunk_size=options['chunk_size'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['users']} usuários conferidos, {stats['corrected']} contadores corrigidos, "
+            f"{stats['created']} criados, {stats['chunks']} lote(s) em {stats['elapsed_seconds']}s"
+        ))
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from User.rollups import run_rollup
+
+
+class Command(BaseCommand):
+    help = "Agrega os ActivityEvent novos (desde a marca d'água) nas métricas diárias."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--safety-lag', type=float, default=None,
+                            help="Ignora eventos mais novos que N segundos (padrão: ROLLUP_SAFETY_LAG).")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        stats = run_rollup(chunk_size=options['chunk_size'], safety_lag=options['safety_lag'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['events']} eventos ({stats['late_events']} atrasados) em {stats['chunks']} lote(s), "
+            f"{stats['user_days']} usuário-dia, {len(stats['days'])} dia(s) "
+            f"em {stats['elapsed_seconds']}s"
+        ))
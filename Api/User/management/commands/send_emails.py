@@ -0,0 +1,37 @@
+import json
+import signal
+
+from django.core.management.base import BaseCommand
+
+from User.outbox import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Worker da fila de e-mails: envia os pendentes em lotes por uma conexão SMTP, com retentativas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Esvazia a fila uma vez e sai.")
+        parser.add_argument('--batch-size', type=int, default=None, help="Padrão: EMAIL_OUTBOX_BATCH_SIZE.")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Padrão: EMAIL_OUTBOX_POLL_INTERVAL.")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON (com --once).")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'])
+        if options['once']:
+            stats = worker.drain()
+            if options['json']:
+                self.stdout.write(json.dumps(stats, indent=2))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{stats['sent']} enviados, {stats['skipped']} ignorados, {stats['retried']} para retentar, "
+                    f"{stats['failed']} com falha definitiva em {stats['batches']} lote(s) ({stats['elapsed_seconds']}s)"
+                ))
+            return
+
+        # SIGTERM (docker stop / k8s) termina o lote atual e sai
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        self.stdout.write("Worker de e-mails iniciado.")
+        try:
+            worker.run(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,119 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = {
+    # Threads por worker: o controle de admissão (admission.py) e a E/S do
+    # banco aproveitam a concorrência dentro do processo
+    'wsgi': {'app': 'Api.wsgi:application', 'worker_class': 'gthread'},
+    'asgi': {'app': 'Api.asgi:application', 'worker_class': 'uvicorn.workers.UvicornWorker'},
+}
+
+
+def available_cpus():
+    """Núcleos que o processo pode usar (respeita affinity/cpuset do container)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers(mode, cpus):
+    # WSGI: 2 * núcleos + 1 (o hash de senha segura o GIL, então processos
+    # escalam melhor que threads); ASGI: um event loop por núcleo
+    return cpus * 2 + 1 if mode == 'wsgi' else cpus
+
+
+def gunicorn_options(options, cpus=None):
+    mode = options['mode']
+    cpus = cpus or available_cpus()
+    workers = options['workers'] or int(os.environ.get('WEB_CONCURRENCY') or default_workers(mode, cpus))
+    config = {
+        'bind': options['bind'],
+        'workers': workers,
+        'worker_class': MODES[mode]['worker_class'],
+        'preload_app': not options['no_preload'],
+        'max_requests': options['max_requests'],
+        'max_requests_jitter': options['max_requests_jitter'],
+        'timeout': options['timeout'],
+        'graceful_timeout': options['graceful_timeout'],
+        'keepalive': options['keepalive'],
+        'accesslog': '-',
+        'post_fork': post_fork,
+    }
+    if mode == 'wsgi':
+        config['threads'] = options['threads']
+    return config
+
+
+def post_fork(server, worker):
+    # Com preload o master só aquece os caches; as threads sobem em cada worker
+    from User import startup
+
+    startup.start_threads()
+
+
+class Command(BaseCommand):
+    help = "Sobe o servidor de produção (gunicorn) em modo WSGI (gthread) ou ASGI (uvicorn)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=sorted(MODES), default=os.environ.get('SERVE_MODE', 'wsgi'))
+        parser.add_argument('--bind', default=os.environ.get('SERVE_BIND', '0.0.0.0:8000'))
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Padrão: WEB_CONCURRENCY ou calculado pelos núcleos disponíveis.")
+        parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 4)),
+                            help="Threads por worker no modo WSGI.")
+        parser.add_argument('--max-requests', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS', 2000)),
+                            help="Recicla o worker após N requests (0 desliga).")
+        parser.add_argument('--max-requests-jitter', type=int, default=200)
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30)),
+                            help="Tempo para terminar os requests em andamento após SIGTERM.")
+        parser.add_argument('--keepalive', type=int, default=5)
+        parser.add_argument('--no-preload', action='store_true', help="Carrega a aplicação em cada worker.")
+        parser.add_argument('--print-config', action='store_true', help="Mostra a configuração e sai.")
+
+    def handle(self, *args, **options):
+        config = gunicorn_options(options)
+        if options['print_config']:
+            for key, value in config.items():
+                self.stdout.write(f"{key} = {getattr(value, '__name__', value)}")
+            return
+
+        try:
+            from gunicorn.app.base import BaseApplication
+            from gunicorn.util import import_app
+        except ImportError:
+            raise CommandError("gunicorn não está instalado (pip install gunicorn).")
+        if options['mode'] == 'asgi':
+            try:
+                import uvicorn.workers  # noqa: F401
+            except ImportError:
+                raise CommandError("O modo ASGI precisa do uvicorn (pip install uvicorn).")
+
+        app_uri = MODES[options['mode']]['app']
+
+        class Application(BaseApplication):
+            def load_config(self):
+                for key, value in config.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                if config['preload_app']:
+                    # Nenhuma thread no master: sobem em cada worker (post_fork)
+                    from User import startup
+
+                    startup.defer_threads()
+                app = import_app(app_uri)
+                if config['preload_app']:
+                    # O master não pode repassar sockets abertos aos workers
+                    from django.core.cache import caches
+                    from django.db import connections
+
+                    connections.close_all()
+                    caches.close_all()
+                return app
+
+        self.stdout.write(
+            f"Servindo {app_uri} em {config['bind']} com {config['workers']} worker(s) {config['worker_class']}")
+        Application().run()
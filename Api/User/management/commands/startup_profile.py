@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Executado em um processo novo: mede cada etapa do cold start de um worker
+STAGES_SCRIPT = r"""
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Api.settings')
+timings = {}
+started = last = time.perf_counter()
+
+def mark(name):
+    global last
+    now = time.perf_counter()
+    timings[name] = round((now - last) * 1000, 3)
+    last = now
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+mark('settings')
+django.setup()
+mark('django.setup')
+from django.urls import get_resolver
+get_resolver().url_patterns
+mark('urlconf')
+if %(wsgi)r:
+    import Api.wsgi
+    mark('wsgi')
+timings['total'] = round((time.perf_counter() - started) * 1000, 3)
+sys.stdout.write(json.dumps(timings))
+"""
+
+
+def measure_startup(wsgi=False, importtime=False):
+    """Sobe um processo Python novo; retorna (tempos por etapa em ms, linhas do -X importtime)."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', STAGES_SCRIPT % {'wsgi': wsgi}]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'Api.settings')}
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "falha na subida")
+    return json.loads(result.stdout), result.stderr.splitlines()
+
+
+def parse_importtime(lines):
+    """Linhas 'import time: self | cumulative | módulo' -> [(módulo, self_ms, cumulative_ms)]."""
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Mede o cold start (settings, django.setup, URLconf e opcionalmente o wsgi) e os imports mais caros."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help="Quantos módulos listar.")
+        parser.add_argument('--prefix', default=None, help="Só módulos com este prefixo (ex.: User.).")
+        parser.add_argument('--wsgi', action='store_true',
+                            help="Inclui Api.wsgi (aquecimento de caches e threads do worker).")
+        parser.add_argument('--json', action='store_true', help="Saída em JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            timings, stderr = measure_startup(wsgi=options['wsgi'], importtime=True)
+        except RuntimeError as e:
+            raise CommandError(f"Falha ao medir a subida: {e}")
+
+        modules = parse_importtime(stderr)
+        if options['prefix']:
+            modules = [m for m in modules if m[0].startswith(options['prefix'])]
+        modules = sorted(modules, key=lambda m: m[2], reverse=True)[:options['top']]
+        budget = settings.STARTUP_BUDGET_SECONDS * 1000
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'stages_ms': timings,
+                'budget_ms': budget,
+                'modules': [{'module': name, 'self_ms': s, 'cumulative_ms': c} for name, s, c in modules],
+            }, indent=2))
+            return
+
+        for stage, ms in timings.items():
+            self.stdout.write(f"{stage:<14} {ms:>10.1f} ms")
+        style = self.style.SUCCESS if timings['total'] <= budget else self.style.ERROR
+        self.stdout.write(style(f"orçamento      {budget:>10.1f} ms"))
+        self.stdout.write("\nImports mais caros (cumulativo / próprio):")
+        for name, self_ms, cumulative_ms in modules:
+            self.stdout.write(f"{cumulative_ms:>9.1f} ms {self_ms:>8.1f} ms  {name}")
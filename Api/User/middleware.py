@@ -0,0 +1,100 @@
+# middleware.py
+import contextlib
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from . import instrumentation, profiling
+from .admission import Rejected, get_controller
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentationMiddleware:
+    """
+    Mede cada request para o /metrics (instrumentation.py): latência, status,
+    tamanho da resposta e queries e tempo no banco. Fica no topo do
+    MIDDLEWARE para medir também os demais middlewares. Com PROFILING_ENABLED,
+    amostra a pilha dos requests sorteados e grava a dos lentos (profiling.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        db = {'queries': 0, 'seconds': 0.0}
+
+        def timed(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db['queries'] += 1
+                db['seconds'] += time.perf_counter() - started
+
+        token = profiling.get_profiler().begin() if profiling.should_profile() else None
+        started = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timed))
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            stacks = profiling.get_profiler().end(token) if token is not None else None
+
+        match = request.resolver_match
+        view = match.view_name if match else instrumentation.UNRESOLVED
+        instrumentation.record(
+            view, request.method, response.status_code, elapsed,
+            queries=db['queries'], db_seconds=db['seconds'],
+            response_bytes=None if response.streaming else len(response.content),
+        )
+        if stacks and elapsed * 1000 >= settings.PROFILING_SLOW_MS:
+            path = profiling.dump(stacks, view, elapsed)
+            logger.warning("Request lento (%s, %.0f ms): perfil em %s", view, elapsed * 1000, path)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Aplica o controle de admissão (admission.py) depois da resolução da URL,
+    antes da view: requests rejeitados não chegam a hashear senha nem a
+    consultar o banco. A vaga é liberada quando a resposta fica pronta.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            admitted = getattr(request, '_admission', None)
+            if admitted is not None:
+                limiter, started = admitted
+                limiter.release(started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.LOAD_SHEDDING_ENABLED:
+            return None
+        match = request.resolver_match
+        limiter = get_controller().limiter_for(request, match.url_name if match else None)
+        if limiter is None:
+            return None
+        try:
+            request._admission = (limiter, limiter.acquire())
+        except Rejected as e:
+            response = JsonResponse(
+                {'error': "Servidor sobrecarregado, tente novamente em instantes.", 'class': limiter.name},
+                status=e.status,
+            )
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        return None
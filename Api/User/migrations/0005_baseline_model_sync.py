@@ -0,0 +1,78 @@
+# Generated by Django 5.2 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0004_plan_customuser_plan'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    # Mudanças nos modelos do baseline (UserAnalytics, Role.permissions, índices de
+    # Subscription) que ficaram sem migração
+    operations = [
+        migrations.CreateModel(
+            name='UserAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_logins', models.IntegerField(default=0)),
+                ('last_login_date', models.DateTimeField(blank=True, null=True)),
+                ('active_days_count', models.IntegerField(default=0)),
+                ('avg_session_duration_minutes', models.FloatField(default=0)),
+                ('features_used', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='plan',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterModelOptions(
+            name='role',
+            options={'ordering': ['name']},
+        ),
+        migrations.AddField(
+            model_name='role',
+            name='permissions',
+            field=models.ManyToManyField(blank=True, to='auth.permission'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='is_superuser',
+            field=models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='User.plan'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='role',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='User.role'),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='valid_until',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['is_active', 'valid_until'], name='User_subscr_is_acti_9cf028_idx'),
+        ),
+        migrations.AddField(
+            model_name='useranalytics',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0005_baseline_model_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='entitlement_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-18 18:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0006_customuser_entitlement_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('dau', models.IntegerField(default=0)),
+                ('wau', models.IntegerField(default=0)),
+                ('mau', models.IntegerField(default=0)),
+                ('logins', models.IntegerField(default=0)),
+                ('sessions', models.IntegerField(default=0)),
+                ('avg_session_duration_minutes', models.FloatField(default=0)),
+                ('features_used', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('login', 'Login'), ('session', 'Sessão'), ('feature', 'Feature')], max_length=10)),
+                ('feature', models.CharField(blank=True, max_length=100)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('logins', models.IntegerField(default=0)),
+                ('sessions', models.IntegerField(default=0)),
+                ('session_seconds', models.FloatField(default=0)),
+                ('features_used', models.JSONField(default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'user'], name='User_userda_day_b5cf08_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_user_daily_activity')],
+            },
+        ),
+    ]
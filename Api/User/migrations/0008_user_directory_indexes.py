@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0007_activity_rollups'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['role', 'id'], name='User_custom_role_id_0c84d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['plan', 'id'], name='User_custom_plan_id_80dc49_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['is_active', 'id'], name='User_custom_is_acti_ca962c_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Índices para a busca por prefixo do admin (email/name__istartswith gera
+# UPPER(col::text) LIKE UPPER('x%')). Só PostgreSQL; CONCURRENTLY para não
+# travar a tabela de usuários, por isso a migração não é atômica.
+INDEXES = {
+    'user_email_upper_prefix_idx': 'email',
+    'user_name_upper_prefix_idx': 'name',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('User', 'CustomUser')._meta.db_table
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON "{table}" (UPPER("{column}"::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('User', '0008_user_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
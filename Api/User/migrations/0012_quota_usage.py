@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0011_revoked_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='quota_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('projects', models.IntegerField(default=0)),
+                ('users', models.IntegerField(default=0)),
+                ('storage_bytes', models.BigIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 19:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Regras iniciais de domínio; depois disso quem manda é o admin
+DEFAULT_RULES = [
+    ("ufba.br", "Aluno UFBA", True),
+    ("gmail.com", "Assinante", False),
+    ("gmail.com.br", "Assinante", False),
+]
+
+
+def seed_domain_rules(apps, schema_editor):
+    # Roda uma vez só; as roles podem ainda não existir (o post_migrate as cria
+    # depois), então são criadas aqui se preciso
+    Role = apps.get_model('User', 'Role')
+    DomainRoleRule = apps.get_model('User', 'DomainRoleRule')
+    DomainRoleRule.objects.bulk_create([
+        DomainRoleRule(
+            domain=domain, role=Role.objects.get_or_create(name=role_name)[0], include_subdomains=subdomains,
+        )
+        for domain, role_name, subdomains in DEFAULT_RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0012_quota_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainRoleRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=253, unique=True)),
+                ('include_subdomains', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='domain_rules', to='User.role')),
+            ],
+            options={
+                'ordering': ['domain'],
+            },
+        ),
+        migrations.RunPython(seed_domain_rules, migrations.RunPython.noop),
+    ]
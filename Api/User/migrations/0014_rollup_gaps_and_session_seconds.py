@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 19:49
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_session_seconds(apps, schema_editor):
+    # Dias já agregados: total reconstruído a partir da média gravada
+    DailyActivity = apps.get_model('User', 'DailyActivity')
+    DailyActivity.objects.update(session_seconds=F('avg_session_duration_minutes') * F('sessions') * 60)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0013_domain_role_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='session_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rollupwatermark',
+            name='gaps',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_session_seconds, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,12 @@ from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser, BaseUserManager, PermissionsMixin, Permission
 )
+from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from .domains import normalize_domain
 
 
 class Plan(models.Model):
@@ -33,6 +37,36 @@ class Role(models.Model):
         ordering = ['name']
 
 
+class DomainRoleRule(models.Model):
+    """
+    Role atribuída no cadastro conforme o domínio do e-mail. Com
+    `include_subdomains`, "ufba.br" vale também para "dcc.ufba.br"; a regra
+    mais específica vence. Editável no admin, sem deploy (domains.py).
+    """
+    domain = models.CharField(max_length=253, unique=True)
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='domain_rules')
+    include_subdomains = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def clean(self):
+        # Antes da validação de unicidade: "UFBA.br" com "ufba.br" já
+        # cadastrado vira erro de formulário, não IntegrityError
+        self.domain = normalize_domain(self.domain)
+        if not self.domain:
+            raise ValidationError({'domain': "Informe um domínio, ex.: ufba.br"})
+
+    def save(self, *args, **kwargs):
+        # Gravações fora do admin (shell, comandos) não passam por clean()
+        self.domain = normalize_domain(self.domain)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{'*.' if self.include_subdomains else ''}{self.domain} -> {self.role}"
+
+    class Meta:
+        ordering = ['domain']
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -59,8 +93,8 @@ class CustomUserManager(BaseUserManager):
 
     def create_user_with_firebase(self, firebase_token, **extra_fields):
         try:
-            from firebase_admin import auth as firebase_auth
-            decoded_token = firebase_auth.verify_id_token(firebase_token)
+            from .firebase import verify_id_token
+            decoded_token = verify_id_token(firebase_token)
             email = decoded_token.get('email')
             if not email:
                 raise ValueError("Token do Firebase não contém email.")
@@ -68,15 +102,12 @@ class CustomUserManager(BaseUserManager):
             uid = decoded_token.get('uid')
             name = extra_fields.get('name') or uid
 
+            # Senha inutilizável já no INSERT: o cadastro é uma única instrução
             user, created = self.get_or_create(
                 email=email,
-                defaults={'name': name, **extra_fields}
+                defaults={'name': name, 'password': make_password(None), **extra_fields}
             )
 
-            if created:
-                user.set_unusable_password()
-                user.save(using=self._db)
-
             return user
 
         except Exception as e:
@@ -91,15 +122,42 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
     role = models.ForeignKey('User.Role', on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
+    # Muda sempre que plano, role, assinatura ou status mudam; tokens emitidos
+    # com outra versão têm claims desatualizados (ver authentication.py)
+    entitlement_version = models.BigIntegerField(default=0, editable=False)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']
 
+    class Meta:
+        # Paginação por chave (id) com filtro no diretório de usuários
+        indexes = [
+            models.Index(fields=['role', 'id']),
+            models.Index(fields=['plan', 'id']),
+            models.Index(fields=['is_active', 'id']),
+        ]
+
     def __str__(self):
         return self.email
 
+    # Campos que entram no snapshot de direitos ou nos claims do JWT
+    ENTITLEMENT_ATTNAMES = ('plan_id', 'role_id', 'is_active', 'is_staff', 'is_superuser')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado lido do banco, para o post_save saber se plano/role/status mudaram
+        instance._entitlement_state = instance.entitlement_state()
+        return instance
+
+    def entitlement_state(self):
+        """Valores atuais dos campos de direitos; None se algum foi adiado (defer/only)."""
+        if any(name not in self.__dict__ for name in self.ENTITLEMENT_ATTNAMES):
+            return None
+        return tuple(self.__dict__[name] for name in self.ENTITLEMENT_ATTNAMES)
+
     @property
     def is_pro_user(self):
         return self.plan and not self.plan.is_free
@@ -142,4 +200,144 @@ class UserAnalytics(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Analytics - {self.user.email}"
\ No newline at end of file
+        return f"Analytics - {self.user.email}"
+
+class ActivityEvent(models.Model):
+    """Evento bruto de atividade (append-only); fonte das agregações diárias."""
+    LOGIN = 'login'
+    SESSION = 'session'
+    FEATURE = 'feature'
+    KIND_CHOICES = [(LOGIN, 'Login'), (SESSION, 'Sessão'), (FEATURE, 'Feature')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='activity_events')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    feature = models.CharField(max_length=100, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} - {self.user_id} - {self.created_at}"
+
+
+class UserDailyActivity(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_activity')
+    day = models.DateField()
+    logins = models.IntegerField(default=0)
+    sessions = models.IntegerField(default=0)
+    session_seconds = models.FloatField(default=0)
+    features_used = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_user_daily_activity'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.day}"
+
+
+class DailyActivity(models.Model):
+    """Métricas globais pré-calculadas por dia (lidas pelos dashboards)."""
+    day = models.DateField(unique=True)
+    dau = models.IntegerField(default=0)
+    wau = models.IntegerField(default=0)
+    mau = models.IntegerField(default=0)
+    logins = models.IntegerField(default=0)
+    sessions = models.IntegerField(default=0)
+    # Total das sessões: os rollups somam a ele e derivam a média, sem reler o dia
+    session_seconds = models.FloatField(default=0)
+    avg_session_duration_minutes = models.FloatField(default=0)
+    features_used = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+
+    def __str__(self):
+        return str(self.day)
+
+
+class RollupWatermark(models.Model):
+    """Último ActivityEvent já agregado por cada rollup."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    # Intervalos de ids abaixo da marca ainda não vistos: [início, fim, visto em (epoch)]
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Fila de e-mails transacionais (ver outbox.py). O request só insere a
+    linha; o worker `send_emails` renderiza e envia em lotes.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+    STATUS_CHOICES = [(PENDING, 'Pendente'), (SENT, 'Enviado'), (FAILED, 'Falhou'), (SKIPPED, 'Ignorado')]
+
+    RAW = 'raw'
+    PASSWORD_RESET = 'password_reset'
+    KIND_CHOICES = [(RAW, 'Texto pronto'), (PASSWORD_RESET, 'Redefinição de senha')]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, default=RAW)
+    to_email = models.EmailField()
+    from_email = models.EmailField(blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} -> {self.to_email} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """
+    JTI de refresh token revogado: usado na rotação (o token antigo morre ao
+    gerar o novo) ou revogado explicitamente. A tabela é a fonte da verdade;
+    cada worker mantém um índice compacto em memória (revocation.py). Linhas
+    vencidas (expires_at no passado) podem ser apagadas.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class QuotaUsage(models.Model):
+    """
+    Uso materializado das cotas do plano (Plan.max_projects, max_users e
+    max_storage_mb). Os contadores mudam com UPDATE ... SET col = col + n
+    quando os recursos rastreados são criados ou apagados (quotas.py) e são
+    conferidos periodicamente contra as contagens reais. Usuário sem linha
+    não usa nada.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='quota_usage',
+    )
+    projects = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+    storage_bytes = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.projects} projetos, {self.users} usuários, {self.storage_bytes} bytes"
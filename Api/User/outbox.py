@@ -0,0 +1,186 @@
+# outbox.py
+"""
+Fila de e-mails transacionais no banco (OutboxEmail).
+
+O request só chama `enqueue` / `enqueue_password_reset` (um INSERT, sem SMTP
+e sem consultar se o usuário existe, então o tempo de resposta não revela
+nada). O worker (`manage.py send_emails`) reserva lotes de linhas
+pendentes, renderiza e envia tudo por uma única conexão SMTP. Falhas voltam
+para a fila com backoff exponencial até EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+O backend de e-mail (smtplib, pacote email) só é importado pelo worker;
+os requests que apenas enfileiram não pagam esse custo na subida.
+
+Enquanto um lote está sendo enviado, as linhas ficam "arrendadas"
+(next_attempt_at empurrado por EMAIL_OUTBOX_LEASE segundos): outros workers
+não as pegam, e se o worker morrer elas voltam sozinhas para a fila.
+"""
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import CustomUser, OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(to_email, subject, body, from_email=''):
+    return OutboxEmail.objects.create(to_email=to_email, subject=subject, body=body, from_email=from_email)
+
+
+def enqueue_password_reset(email):
+    """O link é gerado só no envio; e-mails sem conta ativa são ignorados pelo worker."""
+    return OutboxEmail.objects.create(kind=OutboxEmail.PASSWORD_RESET, to_email=email)
+
+
+def render_password_reset(message, users):
+    user = users.get(message.to_email)
+    if user is None:
+        return None
+    token = default_token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    reset_link = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}"
+    return "Redefinição de senha", f"Use este link para redefinir sua senha: {reset_link}"
+
+
+def backoff_delay(attempts, base=None, maximum=None):
+    base = settings.EMAIL_OUTBOX_BACKOFF if base is None else base
+    maximum = settings.EMAIL_OUTBOX_BACKOFF_MAX if maximum is None else maximum
+    return min(base * 2 ** max(attempts - 1, 0), maximum)
+
+
+class OutboxWorker:
+    def __init__(self, batch_size=None, max_attempts=None, lease=None, connection=None):
+        self.batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        self.max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+        self.lease = settings.EMAIL_OUTBOX_LEASE if lease is None else lease
+        from django.core.mail import get_connection
+
+        # Backend de e-mail reutilizado entre lotes (padrão: EMAIL_BACKEND)
+        self.connection = connection or get_connection(fail_silently=False)
+        self._stop = threading.Event()
+
+    def claim(self):
+        """Reserva o próximo lote de pendentes (SKIP LOCKED onde o banco suporta)."""
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if ids:
+                OutboxEmail.objects.filter(id__in=ids).update(
+                    next_attempt_at=now + datetime.timedelta(seconds=self.lease))
+        return list(OutboxEmail.objects.filter(id__in=ids).order_by('id')) if ids else []
+
+    def _users_for(self, messages):
+        emails = [m.to_email for m in messages if m.kind == OutboxEmail.PASSWORD_RESET]
+        if not emails:
+            return {}
+        return {user.email: user for user in CustomUser.objects.filter(email__in=emails, is_active=True)}
+
+    def render(self, message, users):
+        if message.kind == OutboxEmail.PASSWORD_RESET:
+            return render_password_reset(message, users)
+        return message.subject, message.body
+
+    def send_batch(self, messages):
+        """Envia o lote por uma conexão; retorna (enviados, ignorados, [(mensagem, erro)])."""
+        import smtplib
+
+        from django.core.mail import EmailMessage
+
+        sent, skipped, failures = [], [], []
+        users = self._users_for(messages)
+        try:
+            self.connection.open()
+        except Exception as e:
+            return sent, skipped, [(message, e) for message in messages]
+        try:
+            for message in messages:
+                try:
+                    rendered = self.render(message, users)
+                    if rendered is None:
+                        skipped.append(message.id)
+                        continue
+                    subject, body = rendered
+                    EmailMessage(
+                        subject, body, message.from_email or settings.DEFAULT_FROM_EMAIL, [message.to_email],
+                        connection=self.connection,
+                    ).send()
+                    sent.append(message.id)
+                except Exception as e:
+                    failures.append((message, e))
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError)):
+                        # Conexão caiu no meio do lote: reabre para as próximas
+                        self.connection.close()
+                        self.connection.open()
+        except Exception as e:
+            done = set(sent) | set(skipped) | {m.id for m, _ in failures}
+            failures += [(m, e) for m in messages if m.id not in done]
+        finally:
+            self.connection.close()
+        return sent, skipped, failures
+
+    def record(self, sent, skipped, failures):
+        now = timezone.now()
+        stats = {'sent': len(sent), 'skipped': len(skipped), 'retried': 0, 'failed': 0}
+        if sent:
+            OutboxEmail.objects.filter(id__in=sent).update(status=OutboxEmail.SENT, sent_at=now, last_error='')
+        if skipped:
+            OutboxEmail.objects.filter(id__in=skipped).update(status=OutboxEmail.SKIPPED)
+        for message, error in failures:
+            message.attempts += 1
+            message.last_error = str(error)[:1000]
+            if message.attempts >= self.max_attempts:
+                message.status = OutboxEmail.FAILED
+                stats['failed'] += 1
+            else:
+                message.next_attempt_at = now + datetime.timedelta(seconds=backoff_delay(message.attempts))
+                stats['retried'] += 1
+        if failures:
+            OutboxEmail.objects.bulk_update(
+                [message for message, _ in failures], ['attempts', 'last_error', 'status', 'next_attempt_at'])
+            logger.warning("Falha ao enviar %d e-mail(s): %s", len(failures), failures[0][1])
+        return stats
+
+    def drain(self, max_batches=None):
+        """Envia lotes até a fila (já vencida) esvaziar; retorna contagens e tempo gasto."""
+        totals = {'sent': 0, 'skipped': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+        started = time.perf_counter()
+        while max_batches is None or totals['batches'] < max_batches:
+            messages = self.claim()
+            if not messages:
+                break
+            for key, value in self.record(*self.send_batch(messages)).items():
+                totals[key] += value
+            totals['batches'] += 1
+        totals['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return totals
+
+    def run(self, poll_interval=None):
+        """Loop do worker; para com stop()."""
+        poll_interval = settings.EMAIL_OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+        while not self._stop.is_set():
+            try:
+                stats = self.drain()
+            except Exception:
+                logger.exception("Falha ao processar a fila de e-mails")
+                stats = {'batches': 0}
+            finally:
+                close_old_connections()
+            if not stats['batches']:
+                self._stop.wait(poll_interval)
+
+    def stop(self):
+        self._stop.set()
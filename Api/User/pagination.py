@@ -0,0 +1,71 @@
+# pagination.py
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+class UserDirectoryPagination(CursorPagination):
+    """
+    Paginação por chave em `id`: cada página é `WHERE id > cursor ORDER BY id
+    LIMIT n`, com o mesmo custo no início e no fim da tabela (sem OFFSET).
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def estimated_table_rows(model, using='default'):
+    """Estimativa de linhas da tabela pelo planner do PostgreSQL (reltuples); None nos demais bancos."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1: tabela ainda não analisada
+    return row[0] if row and row[0] >= 0 else None
+
+
+def estimated_query_rows(queryset):
+    """Linhas estimadas pelo EXPLAIN do PostgreSQL para a consulta; None nos demais bancos."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator para tabelas grandes: evita o COUNT(*) exato.
+
+    Sem filtros usa a estimativa do catálogo (reltuples). Com filtros conta
+    no máximo `exact_limit + 1` linhas; só acima disso recorre ao EXPLAIN.
+    Fora do PostgreSQL a contagem continua exata.
+    """
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        capped = queryset.order_by()[:self.exact_limit + 1].count()
+        if capped <= self.exact_limit:
+            return capped
+        estimate = estimated_query_rows(queryset)
+        return max(estimate, capped) if estimate is not None else queryset.count()
@@ -4,18 +4,35 @@ from django.http import JsonResponse
 
 from rest_framework.permissions import BasePermission
 
+from .entitlements import get_entitlements
+
+# Plano, role e assinatura vêm do snapshot de direitos (entitlements.py),
+# que em regime permanente não consulta o banco.
+
+def _entitlements(request):
+    # None para anônimos e para usuários sem linha (ex.: apagados com token ainda válido)
+    return request.user.is_authenticated and get_entitlements(request.user)
+
+
+class IsAdminRole(BasePermission):
+    def has_permission(self, request, view):
+        entitlements = _entitlements(request)
+        return bool(entitlements) and entitlements.has_role('Administrador')
+
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.is_admin
 
 class IsProUser(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.is_pro_user
+        entitlements = _entitlements(request)
+        return bool(entitlements) and entitlements.is_pro
 
 class CanManageTeam(BasePermission):
     def has_permission(self, request, view):
         allowed_roles = ["Administrador", "Gestor"]
-        return request.user.is_authenticated and request.user.role.name in allowed_roles
+        entitlements = _entitlements(request)
+        return bool(entitlements) and entitlements.has_role(*allowed_roles)
 
 class IsOwnerOrAdmin(BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -24,8 +41,8 @@ class IsOwnerOrAdmin(BasePermission):
 def require_plan(plan_name):
     def decorator(view_func):
         def _wrapped_view(request, *args, **kwargs):
-            subscription = getattr(request.user, 'subscription', None)
-            if subscription and subscription.plan.name == plan_name and subscription.valid_until > now():
+            entitlements = _entitlements(request)
+            if entitlements and entitlements.has_subscription(plan_name, now()):
                 return view_func(request, *args, **kwargs)
             return JsonResponse({'error': 'Acesso restrito ao plano requerido.'}, status=403)
         return _wrapped_view
@@ -0,0 +1,113 @@
+# profiling.py
+"""
+Profiler por amostragem para requests lentos (opt-in: PROFILING_ENABLED).
+
+Uma thread do processo lê, a cada PROFILING_INTERVAL_MS, a pilha das threads
+que estão atendendo requests sorteados (PROFILING_SAMPLE_RATE) via
+`sys._current_frames()`; o código da view não é instrumentado e o custo fica
+na thread de amostragem. Quando o request passa de PROFILING_SLOW_MS, as
+pilhas vão para PROFILING_DIR no formato "collapsed" (uma linha
+`modulo.funcao;modulo.funcao N` por pilha), aceito por flamegraph.pl,
+speedscope e inferno.
+"""
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    name = f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+    return name.replace(';', ':')
+
+
+def collapse(frame):
+    """Pilha a partir de `frame`, da raiz para a folha, separada por ';'."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Iniciada sob demanda: também depois do fork do gunicorn
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for ident, stacks in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[collapse(frame)] += 1
+
+    def begin(self):
+        """Passa a amostrar a thread atual; retorna o token para `end`."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = Counter()
+            self._ensure_thread()
+        self._wake.set()
+        return ident
+
+    def end(self, token):
+        """Para de amostrar; retorna as pilhas coletadas (Counter pilha -> amostras)."""
+        with self._lock:
+            return self._active.pop(token, Counter())
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler(settings.PROFILING_INTERVAL_MS / 1000)
+    return _profiler
+
+
+def should_profile():
+    return settings.PROFILING_ENABLED and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+_dumps = itertools.count()
+
+
+def dump(stacks, view, seconds, directory=None):
+    """Grava as pilhas no formato collapsed; retorna o caminho do arquivo."""
+    directory = directory or settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    safe_view = ''.join(c if c.isalnum() or c in '-_' else '_' for c in view)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_view}-{int(seconds * 1000)}ms-{os.getpid()}-{next(_dumps)}"
+    path = os.path.join(directory, f"{name}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
@@ -0,0 +1,316 @@
+# quotas.py
+"""
+Cotas do plano (projetos, usuários e armazenamento) com uso materializado.
+
+Em vez de um COUNT(*)/SUM por request protegido, o uso de cada usuário fica
+em QuotaUsage (uma linha por usuário, chave = user_id). Os modelos que
+consomem cota são ligados a um recurso com `track()`, normalmente no
+AppConfig.ready() do app dono do modelo:
+
+    quotas.track('projects', Project)
+    quotas.track('storage', Arquivo, size_field='tamanho_bytes')
+
+Criação e exclusão ajustam o contador com um UPDATE atômico (F()), então
+requests simultâneos não perdem incrementos. Os limites vêm do snapshot de
+direitos (entitlements.py) e o uso de uma leitura pela chave primária:
+conferir qualquer uma das três cotas custa uma consulta indexada.
+
+`check()` só lê: dois requests simultâneos podem passar juntos pelo último
+lugar. Para recursos rastreados, `reserve()` separa a quantidade com um
+UPDATE condicional (só passa se couber no limite) enquanto a view cria o
+objeto, e `release()` a devolve no fim; é o que o decorator limit_quota faz.
+
+Os contadores podem divergir (update()/delete() em massa não disparam
+signals, mudança de tamanho de um arquivo já criado); `reconcile()` os
+confere contra as contagens reais em lotes, via comando reconcile_quotas
+(cron) ou pelo agendador do worker (QUOTA_RECONCILE_INTERVAL > 0).
+"""
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import entitlements
+from .models import CustomUser, QuotaUsage
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_LOCK_KEY = "quotas:reconcile-lock"
+
+
+class Resource(NamedTuple):
+    column: str
+    limit_field: str
+    unit: int
+    label: str
+
+
+RESOURCES = {
+    'projects': Resource('projects', 'max_projects', 1, "projetos"),
+    'users': Resource('users', 'max_users', 1, "usuários"),
+    'storage': Resource('storage_bytes', 'max_storage_mb', 1024 * 1024, "armazenamento"),
+}
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, resource, used, limit):
+        self.resource = resource
+        self.used = used
+        self.limit = limit
+        super().__init__(f"Limite de {RESOURCES[resource].label} atingido para seu plano.")
+
+
+class Tracker(NamedTuple):
+    model: type
+    user_field: str
+    size_field: Optional[str]
+
+    def amount(self, instance):
+        return (getattr(instance, self.size_field) or 0) if self.size_field else 1
+
+    def user_id(self, instance):
+        return getattr(instance, f"{self.user_field}_id")
+
+
+_trackers = {}
+
+
+def _on_save(resource):
+    def receiver(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            tracker = _trackers[resource]
+            adjust(tracker.user_id(instance), resource, tracker.amount(instance))
+    return receiver
+
+
+def _on_delete(resource):
+    def receiver(sender, instance, **kwargs):
+        tracker = _trackers[resource]
+        adjust(tracker.user_id(instance), resource, -tracker.amount(instance))
+    return receiver
+
+
+def track(resource, model, user_field='user', size_field=None):
+    """
+    Liga criação/exclusão de `model` ao contador `resource`. Cada instância
+    conta 1 ou, com `size_field`, o valor desse campo (para 'storage', em bytes).
+    """
+    if resource not in RESOURCES:
+        raise ValueError(f"Recurso de cota desconhecido: {resource}")
+    untrack(resource)
+    _trackers[resource] = Tracker(model, user_field, size_field)
+    # Referências fortes: as funções são criadas aqui e não ficam em outro lugar
+    post_save.connect(_on_save(resource), sender=model, weak=False, dispatch_uid=f"quotas:{resource}")
+    post_delete.connect(_on_delete(resource), sender=model, weak=False, dispatch_uid=f"quotas:{resource}")
+
+
+def untrack(resource):
+    tracker = _trackers.pop(resource, None)
+    if tracker is not None:
+        post_save.disconnect(sender=tracker.model, dispatch_uid=f"quotas:{resource}")
+        post_delete.disconnect(sender=tracker.model, dispatch_uid=f"quotas:{resource}")
+
+
+def is_tracked(resource):
+    return resource in _trackers
+
+
+def adjust(user_id, resource, amount):
+    """Soma `amount` (negativo na exclusão) ao contador, sem passar de zero para baixo."""
+    if user_id is None or not amount:
+        return
+    column = RESOURCES[resource].column
+    change = {column: Greatest(F(column) + amount, 0)}
+    if QuotaUsage.objects.filter(pk=user_id).update(**change):
+        return
+    try:
+        with transaction.atomic():
+            QuotaUsage.objects.create(user_id=user_id, **{column: max(amount, 0)})
+    except IntegrityError:
+        # Outro request criou a linha primeiro
+        QuotaUsage.objects.filter(pk=user_id).update(**change)
+
+
+def usage(user):
+    """Uso atual por recurso (na unidade do contador), com uma consulta pela chave primária."""
+    user_id = getattr(user, 'pk', user)
+    columns = [resource.column for resource in RESOURCES.values()]
+    row = QuotaUsage.objects.filter(pk=user_id).values_list(*columns).first()
+    return dict(zip(RESOURCES, row or [0] * len(columns)))
+
+
+def limits(user):
+    """Limites do plano por recurso, sem consulta em regime permanente; None sem plano."""
+    snapshot = entitlements.get_entitlements(user)
+    if snapshot is None or snapshot.plan_id is None:
+        return None
+    return {name: getattr(snapshot, resource.limit_field) * resource.unit for name, resource in RESOURCES.items()}
+
+
+def check(user, resource, amount=1):
+    """Levanta QuotaExceeded se `amount` a mais ultrapassar o limite do plano."""
+    plan_limits = limits(user)
+    if plan_limits is None:
+        return
+    used = usage(user)[resource]
+    if used + amount > plan_limits[resource]:
+        raise QuotaExceeded(resource, used, plan_limits[resource])
+
+
+def reserve(user, resource, amount=1):
+    """
+    Soma `amount` ao contador só se couber no limite do plano, em um único
+    UPDATE condicional; levanta QuotaExceeded se não couber. False quando não
+    há limite (sem plano) e nada foi reservado.
+    """
+    plan_limits = limits(user)
+    if plan_limits is None:
+        return False
+    user_id = getattr(user, 'pk', user)
+    column = RESOURCES[resource].column
+    limit = plan_limits[resource]
+    fits = QuotaUsage.objects.filter(pk=user_id, **{f"{column}__lte": limit - amount})
+    if fits.update(**{column: F(column) + amount}):
+        return True
+    if amount <= limit and not QuotaUsage.objects.filter(pk=user_id).exists():
+        try:
+            with transaction.atomic():
+                QuotaUsage.objects.create(user_id=user_id, **{column: amount})
+            return True
+        except IntegrityError:
+            # Outro request criou a linha primeiro
+            if fits.update(**{column: F(column) + amount}):
+                return True
+    raise QuotaExceeded(resource, usage(user_id)[resource], limit)
+
+
+def release(user, resource, amount=1):
+    """Devolve uma reserva feita com `reserve()`."""
+    adjust(getattr(user, 'pk', user), resource, -amount)
+
+
+def _actual_usage(user_ids):
+    actual = {user_id: {} for user_id in user_ids}
+    for resource, tracker in _trackers.items():
+        total = Sum(tracker.size_field) if tracker.size_field else Count('pk')
+        rows = (
+            tracker.model._default_manager
+            .filter(**{f"{tracker.user_field}_id__in": user_ids})
+            .values_list(f"{tracker.user_field}_id")
+            .annotate(total=total)
+            .order_by()
+        )
+        column = RESOURCES[resource].column
+        for user_id, value in rows:
+            actual[user_id][column] = value or 0
+    return actual
+
+
+def reconcile(chunk_size=1000):
+    """Confere os contadores dos recursos rastreados contra as contagens reais."""
+    stats = {'users': 0, 'corrected': 0, 'created': 0, 'chunks': 0}
+    started = time.perf_counter()
+    columns = [RESOURCES[resource].column for resource in _trackers]
+    if not columns:
+        stats['elapsed_seconds'] = 0.0
+        return stats
+
+    last = 0
+    while True:
+        user_ids = list(
+            CustomUser.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            break
+        last = user_ids[-1]
+        now = timezone.now()
+
+        with transaction.atomic():
+            # Trava as linhas do lote antes de contar: ajustes concorrentes esperam
+            stored = {
+                row.pk: row for row in QuotaUsage.objects.select_for_update().filter(pk__in=user_ids)
+            }
+            actual = _actual_usage(user_ids)
+            to_update, to_create = [], []
+            for user_id in user_ids:
+                counts = {column: actual[user_id].get(column, 0) for column in columns}
+                row = stored.get(user_id)
+                if row is None:
+                    if any(counts.values()):
+                        to_create.append(QuotaUsage(user_id=user_id, reconciled_at=now, **counts))
+                    continue
+                if any(getattr(row, column) != value for column, value in counts.items()):
+                    for column, value in counts.items():
+                        setattr(row, column, value)
+                    row.reconciled_at = now
+                    to_update.append(row)
+            QuotaUsage.objects.bulk_update(to_update, [*columns, 'reconciled_at'])
+            # A linha pode ter sido criada por um adjust() depois da leitura acima
+            QuotaUsage.objects.bulk_create(
+                to_create, update_conflicts=True, unique_fields=['user'], update_fields=[*columns, 'reconciled_at'],
+            )
+
+        stats['users'] += len(user_ids)
+        stats['corrected'] += len(to_update)
+        stats['created'] += len(to_create)
+        stats['chunks'] += 1
+        if len(user_ids) < chunk_size:
+            break
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+class QuotaReconciler:
+    """
+    Agendador opcional dentro do processo (QUOTA_RECONCILE_INTERVAL > 0).
+    Um lock no cache compartilhado evita que vários workers confiram juntos.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        interval = settings.QUOTA_RECONCILE_INTERVAL
+        if not cache.add(RECONCILE_LOCK_KEY, True, timeout=max(1, int(interval))):
+            return None
+        try:
+            stats = reconcile(chunk_size=settings.QUOTA_RECONCILE_CHUNK_SIZE)
+            if stats['corrected'] or stats['created']:
+                logger.info("Contadores de cota corrigidos: %s", stats)
+            return stats
+        except Exception:
+            logger.exception("Falha ao conferir os contadores de cota")
+            return None
+        finally:
+            close_old_connections()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.run()
+
+    def start(self):
+        interval = settings.QUOTA_RECONCILE_INTERVAL
+        if (self._thread is not None and self._thread.is_alive()) or interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="quota-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+reconciler = QuotaReconciler()
+
+
+def start():
+    reconciler.start()
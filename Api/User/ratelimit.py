@@ -0,0 +1,247 @@
+# ratelimit.py
+"""
+Limite de tentativas com janela deslizante (login, redefinição de senha).
+
+Cada chave (escopo + tipo + valor, ex.: login/email/ana@...) guarda só dois
+contadores: o da janela atual e o da anterior. A contagem estimada é
+`anterior * (1 - fração decorrida) + atual`, O(1) em tempo e memória.
+Toda tentativa conta, inclusive as rejeitadas: quem insiste continua
+bloqueado.
+
+Backends (RATE_LIMIT_BACKEND):
+- `local`: dicionário em memória por processo;
+- `cache`: o cache compartilhado (CACHES['default'], ex.: Redis). Os
+  contadores de todos os tipos de chave de uma checagem (ip, email...) vão
+  juntos: com o backend Redis do Django, um pipeline (INCR + EXPIRE por
+  chave) faz uma única ida ao servidor; nos demais caches é um `incr` por
+  tipo. O contador da janela anterior, que não muda mais, é lido uma vez
+  (get_many) e memorizado no processo.
+
+O IP vem do `get_ident` do DRF: confiar em X-Forwarded-For exige
+NUM_PROXIES igual ao número de proxies na frente da aplicação (o padrão, 0,
+usa REMOTE_ADDR), senão o cliente troca o cabeçalho e escapa do limite.
+
+Nas views DRF basta declarar `throttle_classes = [SlidingWindowThrottle]` e
+`throttle_scope`; os limites ficam em RATE_LIMITS. O throttle roda em
+`initial()`, antes do corpo da view: nada de hash de senha nem de consulta
+ao banco para quem já passou do limite.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])\w*$')
+
+
+def parse_rate(rate):
+    """'5/m' -> (5, 60); '10/15m' -> (10, 900); '3/hour' -> (3, 3600)."""
+    match = RATE_RE.match(rate.strip())
+    if not match:
+        raise ValueError(f"Limite inválido: {rate!r} (use ex.: '5/m', '10/15m', '3/h').")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * UNITS[unit]
+
+
+class LocalBackend:
+    """Contadores em memória do processo, com teto de chaves (LRU)."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, window_index, window):
+        with self._lock:
+            index, current, previous = self._data.pop(key, (window_index, 0, 0))
+            if index != window_index:
+                previous = current if index == window_index - 1 else 0
+                current = 0
+            current += 1
+            self._data[key] = (window_index, current, previous)
+            if len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+        return current, previous
+
+    def hit_many(self, entries):
+        return [self.hit(*entry) for entry in entries]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheBackend:
+    """Contadores no cache compartilhado do Django."""
+
+    def __init__(self, memo_size=10000):
+        self.memo_size = memo_size
+        self._previous = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _incr(self, key, ttl):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, ttl):
+                return 1
+            return cache.incr(key)
+
+    def _previous_counts(self, keys):
+        with self._lock:
+            known = {key: self._previous[key] for key in keys if key in self._previous}
+        missing = [key for key in keys if key not in known]
+        if missing:
+            fetched = cache.get_many(missing)
+            with self._lock:
+                for key in missing:
+                    known[key] = self._previous[key] = fetched.get(key, 0)
+                while len(self._previous) > self.memo_size:
+                    self._previous.popitem(last=False)
+        return known
+
+    def _redis(self):
+        from django.core.cache.backends.redis import RedisCache
+
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        return backend if isinstance(backend, RedisCache) else None
+
+    def hit_many(self, entries):
+        """[(chave, janela_atual, duração)] -> [(atual, anterior)], em lote."""
+        current_keys = [f"{key}:{window_index}" for key, window_index, _ in entries]
+        previous_keys = [f"{key}:{window_index - 1}" for key, window_index, _ in entries]
+        backend = self._redis()
+        if backend is None:
+            currents = [
+                self._incr(current_key, ttl=int(window * 2) + 1)
+                for current_key, (_, _, window) in zip(current_keys, entries)
+            ]
+            previous = self._previous_counts(previous_keys)
+        else:
+            with self._lock:
+                missing = [key for key in previous_keys if key not in self._previous]
+            # Uma ida ao Redis: INCR/EXPIRE de cada contador e os anteriores ainda não memorizados
+            pipe = backend._cache.get_client(write=True).pipeline(transaction=False)
+            for current_key, (_, _, window) in zip(current_keys, entries):
+                redis_key = backend.make_and_validate_key(current_key)
+                pipe.incr(redis_key)
+                pipe.expire(redis_key, int(window * 2) + 1)
+            if missing:
+                pipe.mget([backend.make_and_validate_key(key) for key in missing])
+            replies = pipe.execute()
+            currents = [int(reply) for reply in replies[0:2 * len(entries):2]]
+            fetched = dict(zip(missing, replies[-1] if missing else []))
+            with self._lock:
+                for key in missing:
+                    self._previous[key] = int(fetched.get(key) or 0)
+                previous = {key: self._previous.get(key, 0) for key in previous_keys}
+                while len(self._previous) > self.memo_size:
+                    self._previous.popitem(last=False)
+        return [(current, previous[key]) for current, key in zip(currents, previous_keys)]
+
+    def hit(self, key, window_index, window):
+        return self.hit_many([(key, window_index, window)])[0]
+
+    def clear(self):
+        with self._lock:
+            self._previous.clear()
+
+
+BACKENDS = {'local': LocalBackend, 'cache': CacheBackend}
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = settings.RATE_LIMIT_BACKEND
+                _backend = (BACKENDS.get(name) or import_string(name))()
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+def check_many(entries, now=None):
+    """
+    Registra uma tentativa em cada (chave, limite, janela) de uma vez;
+    retorna (permitida em todas, segundos até a próxima janela da que barrou).
+    """
+    now = time.time() if now is None else now
+    windows = [(key, int(now // window), window) for key, _, window in entries]
+    allowed, retry_after = True, None
+    for (_, limit, window), (_, window_index, _), (current, previous) in zip(
+            entries, windows, get_backend().hit_many(windows)):
+        elapsed = now - window_index * window
+        if previous * (1 - elapsed / window) + current > limit:
+            allowed = False
+            retry_after = max(retry_after or 0, max(1, math.ceil(window - elapsed)))
+    return allowed, retry_after
+
+
+def check(key, limit, window, now=None):
+    """Registra uma tentativa; retorna (permitida, segundos até a próxima janela)."""
+    allowed, retry_after = check_many([(key, limit, window)], now)
+    if retry_after is None:
+        elapsed = (time.time() if now is None else now) % window
+        retry_after = max(1, math.ceil(window - elapsed))
+    return allowed, retry_after
+
+
+def client_ip(request, throttle):
+    return throttle.get_ident(request)
+
+
+def request_email(request, throttle):
+    email = request.data.get('email') if hasattr(request.data, 'get') else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def request_user(request, throttle):
+    user = getattr(request, 'user', None)
+    return str(user.pk) if user is not None and user.is_authenticated else None
+
+
+KEY_FUNCTIONS = {'ip': client_ip, 'email': request_email, 'user': request_user}
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttle DRF para `view.throttle_scope`, com um limite por tipo de chave:
+
+        RATE_LIMITS = {'login': {'ip': '600/m', 'email': '10/15m'}}
+    """
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not settings.RATE_LIMIT_ENABLED:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        entries = []
+        for kind, rate in settings.RATE_LIMITS.get(scope, {}).items():
+            value = KEY_FUNCTIONS[kind](request, self)
+            if value is None:
+                continue
+            digest = hashlib.sha1(value.encode()).hexdigest()
+            entries.append((f"rl:{scope}:{kind}:{digest}", *parse_rate(rate)))
+        if not entries:
+            return True
+        # Todos os tipos de chave em uma só ida ao backend
+        allowed, self.retry_after = check_many(entries)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
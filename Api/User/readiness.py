@@ -0,0 +1,153 @@
+# readiness.py
+"""
+Readiness com verificações em segundo plano.
+
+Uma thread por worker roda, a cada READINESS_INTERVAL segundos, um round trip
+no banco (SELECT 1), a checagem de migrações pendentes (até a primeira vez
+que não houver nenhuma) e um set/get no cache. O probe (`GET /health/ready/`)
+só lê o último resultado: nenhum acesso ao banco ou ao cache por probe, não
+importa quantos kubelets perguntem. O resultado vale até ficar velho (a thread parou): aí o worker
+responde "not ready" até voltar a checar.
+
+No desligamento o pod passa a responder "not ready" antes de os workers
+pararem, para o balanceador tirá-lo de rotação: o preStop do Kubernetes cria
+READINESS_DRAIN_FILE, que todos os workers do pod enxergam na rodada
+seguinte, e espera o probe falhar antes do SIGTERM. `drain()` faz o mesmo só
+no processo atual.
+
+Liveness (`GET /health/live/` e `/health/`) não depende de nada externo:
+banco fora do ar não é motivo para reiniciar o pod.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "readiness:probe"
+
+
+def check_database():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except Exception:
+        # Conexão quebrada: descarta para a próxima rodada reconectar
+        connection.close()
+        raise
+
+
+_migrations_applied = False
+
+
+def check_migrations():
+    global _migrations_applied
+    # O código (e suas migrações) não muda dentro do processo: aplicadas uma
+    # vez, não há por que montar o grafo de migrações a cada rodada
+    if _migrations_applied:
+        return
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connection)
+    pending = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if pending:
+        raise RuntimeError(f"{len(pending)} migração(ões) pendente(s), ex.: {pending[0][0]}")
+    _migrations_applied = True
+
+
+def check_cache():
+    token = str(time.monotonic())
+    cache.set(CACHE_KEY, token, timeout=60)
+    if cache.get(CACHE_KEY) != token:
+        raise RuntimeError("o valor gravado não foi lido de volta")
+
+
+CHECKS = {
+    'database': check_database,
+    'migrations': check_migrations,
+    'cache': check_cache,
+}
+
+
+class ReadinessMonitor:
+    def __init__(self, checks=None, interval=None):
+        self.checks = CHECKS if checks is None else checks
+        self.interval = settings.READINESS_INTERVAL if interval is None else interval
+        self.draining = False
+        self._result = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_checks(self):
+        """Roda as verificações agora e guarda o resultado."""
+        results = {}
+        for name, check in self.checks.items():
+            started = time.perf_counter()
+            try:
+                check()
+                results[name] = {'ok': True}
+            except Exception as e:
+                results[name] = {'ok': False, 'error': str(e) or type(e).__name__}
+            results[name]['ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if settings.READINESS_DRAIN_FILE and os.path.exists(settings.READINESS_DRAIN_FILE):
+            self.drain()
+        # Troca atômica da referência: o probe nunca vê um resultado pela metade
+        self._result = (time.monotonic(), all(r['ok'] for r in results.values()), results)
+        return self._result
+
+    def status(self):
+        """Último resultado, sem I/O: (pronto, corpo da resposta)."""
+        if self.draining:
+            return False, {'status': 'draining'}
+        result = self._result
+        if result is None:
+            return False, {'status': 'starting'}
+        checked_at, ok, checks = result
+        age = time.monotonic() - checked_at
+        if age > self.interval * 3 + settings.READINESS_STALE_GRACE:
+            return False, {'status': 'stale', 'age_seconds': round(age, 3), 'checks': checks}
+        return ok, {'status': 'ready' if ok else 'not ready', 'age_seconds': round(age, 3), 'checks': checks}
+
+    def drain(self):
+        if not self.draining:
+            logger.info("Worker %s em drenagem: readiness passa a responder 503", os.getpid())
+        self.draining = True
+
+    def _run(self):
+        while True:
+            try:
+                self.run_checks()
+            finally:
+                close_old_connections()
+            if self._stop.wait(self.interval):
+                connection.close()
+                return
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="readiness-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if timeout and self._thread is not None:
+            self._thread.join(timeout)
+
+
+monitor = ReadinessMonitor()
+
+
+def start():
+    monitor.start()
+
+
+def status():
+    return monitor.status()
@@ -0,0 +1,233 @@
+# revocation.py
+"""
+Índice de refresh tokens revogados, em memória, por worker.
+
+A fonte da verdade é a tabela RevokedToken. Cada worker mantém um filtro de
+Bloom com os JTIs ainda não vencidos (~1,2 byte por token com 0,1% de falso
+positivo, contra dezenas de bytes por JTI num set): um JTI fora do filtro
+certamente não foi revogado e o refresh segue sem consulta; só os prováveis
+acertos são confirmados no banco.
+
+O filtro é montado a partir da tabela no primeiro uso (ou em `warm()`, na
+subida do worker) e sincronizado de forma incremental, por id, a cada
+REVOCATION_SYNC_INTERVAL segundos; cada rodada relê as linhas da rodada
+anterior, para não perder um INSERT que fez commit fora de ordem. Bloom não
+remove itens, então a cada REVOCATION_REBUILD_INTERVAL o filtro é refeito só
+com os tokens não vencidos, e as linhas vencidas são apagadas.
+
+Sync e rebuild rodam em uma thread por worker (`start()`, chamado no
+wsgi/asgi e de novo no post_fork do gunicorn); o request só lê o filtro.
+Sem a thread (runserver, comandos, testes) o request que encontra o filtro
+vencido o atualiza, como antes.
+
+Na rotação, o INSERT do JTI antigo (com `jti` único) é o que garante que um
+refresh token só gera um novo par uma vez, mesmo com dois requests
+simultâneos usando o mesmo token.
+"""
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Hashing duplo (Kirsch-Mitzenmacher): k posições a partir de um só digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+
+class RevocationIndex:
+    def __init__(self):
+        self._bloom = None
+        self._watermark = 0
+        self._previous_watermark = 0
+        self._built_at = 0.0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.probable_hits = 0
+        self.confirmed_hits = 0
+
+    def rebuild(self):
+        """Refaz o filtro com os tokens não vencidos e apaga as linhas vencidas."""
+        agora = timezone.now()
+        RevokedToken.objects.filter(expires_at__lt=agora).delete()
+        rows = RevokedToken.objects.filter(expires_at__gte=agora).values_list('id', 'jti')
+        # Folga para crescer até o próximo rebuild sem degradar o falso positivo
+        bloom = BloomFilter(max(settings.REVOCATION_BLOOM_CAPACITY, rows.count() * 2),
+                            settings.REVOCATION_BLOOM_ERROR_RATE)
+        watermark = 0
+        for pk, jti in rows.iterator(chunk_size=10000):
+            bloom.add(jti)
+            watermark = max(watermark, pk)
+        with self._lock:
+            self._bloom = bloom
+            self._watermark = self._previous_watermark = watermark
+            self._built_at = self._synced_at = time.monotonic()
+
+    def sync(self):
+        """Acrescenta ao filtro os JTIs revogados desde a rodada anterior (inclusive por outros workers)."""
+        rows = list(
+            RevokedToken.objects.filter(pk__gt=self._previous_watermark).order_by('pk').values_list('id', 'jti')
+        )
+        with self._lock:
+            for _, jti in rows:
+                self._bloom.add(jti)
+            self._previous_watermark = self._watermark
+            self._watermark = max(self._watermark, rows[-1][0] if rows else 0)
+            self._synced_at = time.monotonic()
+
+    def _due(self):
+        agora = time.monotonic()
+        if self._bloom is None or agora - self._built_at >= settings.REVOCATION_REBUILD_INTERVAL:
+            return self.rebuild
+        if agora - self._synced_at >= settings.REVOCATION_SYNC_INTERVAL:
+            return self.sync
+        return None
+
+    def refresh(self, blocking=True):
+        """Roda o sync ou o rebuild que estiver vencido; uma thread por vez."""
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return
+        try:
+            action = self._due()
+            if action is not None:
+                action()
+        finally:
+            self._refresh_lock.release()
+
+    def _ensure_fresh(self):
+        # Com a thread rodando o request não toca na tabela, exceto para
+        # montar o filtro pela primeira vez (não há com o que responder)
+        if self._bloom is not None and self._thread is not None and self._thread.is_alive():
+            return
+        if self._due() is None:
+            return
+        # Uma thread atualiza; as outras seguem com o filtro atual (se já existir)
+        self.refresh(blocking=self._bloom is None)
+
+    def _run(self):
+        # Intervalo 0 (sync a cada request) não vira um laço sem pausa
+        while not self._stop.wait(max(settings.REVOCATION_SYNC_INTERVAL, 1.0)):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Falha ao sincronizar o índice de tokens revogados")
+            finally:
+                close_old_connections()
+        connection.close()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if timeout and self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_revoked(self, jti):
+        self._ensure_fresh()
+        if jti not in self._bloom:
+            return False
+        # Provável acerto (revogado ou falso positivo): o banco decide
+        self.probable_hits += 1
+        revoked = RevokedToken.objects.filter(jti=jti).exists()
+        self.confirmed_hits += revoked
+        return revoked
+
+    def revoke(self, jti, expires_at):
+        """Grava a revogação; False se o JTI já estava revogado (token reutilizado)."""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        finally:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        return True
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            'entries': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else 0,
+            'bytes': bloom.nbytes if bloom else 0,
+            'probable_hits': self.probable_hits,
+            'confirmed_hits': self.confirmed_hits,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self.probable_hits = self.confirmed_hits = 0
+
+
+index = RevocationIndex()
+
+
+def warm():
+    """Monta o índice na subida; sem banco (ou sem migração) fica para o primeiro uso."""
+    try:
+        index.rebuild()
+    except Exception:
+        logger.warning("Índice de tokens revogados não carregado na subida", exc_info=True)
+        index.reset()
+
+
+def start():
+    index.start()
+
+
+def is_revoked(jti):
+    return index.is_revoked(jti)
+
+
+def revoke_token(token):
+    """Revoga um RefreshToken do simplejwt; False se já estava revogado."""
+    expires_at = datetime.datetime.fromtimestamp(token['exp'], tz=datetime.timezone.utc)
+    return index.revoke(token[api_settings.JTI_CLAIM], expires_at)
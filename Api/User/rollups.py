@@ -0,0 +1,302 @@
+# rollups.py
+"""
+Agregação incremental de ActivityEvent em métricas diárias.
+
+Cada execução processa só os eventos com id acima da marca d'água
+(RollupWatermark), em lotes. Para cada lote, em uma transação:
+
+- soma logins, sessões e features em UserDailyActivity (usuário x dia);
+- soma o lote em DailyActivity (DAU/WAU/MAU, sessões, features) dos dias
+  afetados, como incrementos, sem reler os dias inteiros;
+- recalcula active_days_count e avg_session_duration_minutes de UserAnalytics
+  a partir de UserDailyActivity, que passa a ser a fonte da verdade;
+- avança a marca d'água.
+
+Eventos mais novos que ROLLUP_SAFETY_LAG segundos ficam para a próxima
+execução. Como uma transação longa (ex.: o flush do buffer de analytics) pode
+fazer commit de ids menores depois que a marca passou, os ids pulados ficam
+registrados na marca e são relidos nas execuções seguintes, como o
+revocation.sync relê a rodada anterior, até aparecerem ou completarem
+ROLLUP_GAP_TIMEOUT segundos (rollback).
+"""
+import datetime
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .analytics import JSONIncrement
+from .models import ActivityEvent, DailyActivity, RollupWatermark, UserAnalytics, UserDailyActivity
+
+WATERMARK = 'daily_activity'
+
+
+def aggregate_events(events):
+    """Agrupa eventos (id, user_id, kind, feature, duration, created_at) por (usuário, dia)."""
+    per_user_day = defaultdict(lambda: {'logins': 0, 'sessions': 0, 'session_seconds': 0.0, 'features': Counter()})
+    for _, user_id, kind, feature, duration, created_at in events:
+        data = per_user_day[(user_id, timezone.localdate(created_at))]
+        if kind == ActivityEvent.LOGIN:
+            data['logins'] += 1
+        elif kind == ActivityEvent.SESSION:
+            data['sessions'] += 1
+            data['session_seconds'] += duration or 0
+        elif kind == ActivityEvent.FEATURE and feature:
+            data['features'][feature] += 1
+    return per_user_day
+
+
+def apply_user_days(per_user_day):
+    """Soma o lote em UserDailyActivity; devolve os (usuário, dia) que ainda não tinham linha."""
+    user_ids = {user_id for user_id, _ in per_user_day}
+    days = {day for _, day in per_user_day}
+    pks = {
+        (user_id, day): pk
+        for pk, user_id, day in UserDailyActivity.objects.filter(
+            user_id__in=user_ids, day__in=days).values_list('pk', 'user_id', 'day')
+    }
+
+    # Os rollups são serializados pela marca d'água: ninguém mais cria essas linhas
+    created = [key for key in per_user_day if key not in pks]
+    UserDailyActivity.objects.bulk_create([
+        UserDailyActivity(
+            user_id=user_id, day=day, logins=data['logins'], sessions=data['sessions'],
+            session_seconds=data['session_seconds'], features_used=dict(data['features']),
+        )
+        for (user_id, day), data in ((key, per_user_day[key]) for key in created)
+    ])
+
+    rows = []
+    for key, pk in pks.items():
+        data = per_user_day.get(key)
+        if data is None:
+            continue
+        row = UserDailyActivity(pk=pk)
+        row.logins = F('logins') + data['logins']
+        row.sessions = F('sessions') + data['sessions']
+        row.session_seconds = F('session_seconds') + data['session_seconds']
+        row.features_used = (JSONIncrement('features_used', data['features'])
+                             if data['features'] else F('features_used'))
+        rows.append(row)
+    UserDailyActivity.objects.bulk_update(rows, ['logins', 'sessions', 'session_seconds', 'features_used'])
+    return set(created)
+
+
+def refresh_daily(per_user_day, created):
+    """
+    Aplica o lote em DailyActivity como incrementos, com custo proporcional ao
+    lote e não ao DAU dos dias afetados. Dias ainda sem linha são calculados
+    por inteiro uma única vez; WAU/MAU dos dias já existentes (inclusive os 29
+    seguintes) sobem só pelos usuários que entram na janela com este lote.
+    """
+    if not per_user_day:
+        return
+    days = {day for _, day in per_user_day}
+    first, last = min(days), max(days)
+    existing = dict(DailyActivity.objects.filter(
+        day__gte=first, day__lte=last + datetime.timedelta(days=29)).values_list('day', 'pk'))
+    for day in sorted(days - existing.keys()):
+        _create_day(day)
+
+    deltas = defaultdict(lambda: {
+        'dau': 0, 'wau': 0, 'mau': 0, 'logins': 0, 'sessions': 0, 'session_seconds': 0.0, 'features': Counter(),
+    })
+    for (user_id, day), data in per_user_day.items():
+        if day in existing:
+            delta = deltas[day]
+            delta['dau'] += (user_id, day) in created
+            for field in ('logins', 'sessions', 'session_seconds'):
+                delta[field] += data[field]
+            delta['features'].update(data['features'])
+    for day, field in _window_entries(created, existing):
+        deltas[day][field] += 1
+    if not deltas:
+        return
+
+    rows = []
+    for day, delta in deltas.items():
+        row = DailyActivity(pk=existing[day])
+        for field in ('dau', 'wau', 'mau', 'logins', 'sessions', 'session_seconds'):
+            setattr(row, field, F(field) + delta[field])
+        row.features_used = (JSONIncrement('features_used', delta['features'])
+                             if delta['features'] else F('features_used'))
+        rows.append(row)
+    DailyActivity.objects.bulk_update(
+        rows, ['dau', 'wau', 'mau', 'logins', 'sessions', 'session_seconds', 'features_used'])
+    DailyActivity.objects.filter(pk__in=[row.pk for row in rows], sessions__gt=0).update(
+        avg_session_duration_minutes=F('session_seconds') / F('sessions') / 60.0)
+
+
+def _window_entries(created, existing):
+    """
+    (dia, 'wau'|'mau') para cada usuário que passa a contar na janela de um
+    dia já existente por causa dos (usuário, dia) criados neste lote.
+    """
+    new_days = defaultdict(set)
+    for user_id, day in created:
+        new_days[user_id].add(day)
+    if not new_days:
+        return
+    first = min(day for days in new_days.values() for day in days)
+    last = max(day for days in new_days.values() for day in days)
+    previous_days = defaultdict(set)
+    for user_id, day in UserDailyActivity.objects.filter(
+        user_id__in=new_days, day__gt=first - datetime.timedelta(days=30), day__lt=last + datetime.timedelta(days=30),
+    ).values_list('user_id', 'day'):
+        if (user_id, day) not in created:
+            previous_days[user_id].add(day)
+
+    for window, field in ((7, 'wau'), (30, 'mau')):
+        span = datetime.timedelta(days=window - 1)
+        for user_id, days in new_days.items():
+            previous = previous_days[user_id]
+            targets = {target for target in existing if any(day <= target <= day + span for day in days)}
+            for target in targets:
+                # Já contava se tinha atividade anterior dentro da janela
+                if not any(target - span <= day <= target for day in previous):
+                    yield target, field
+
+
+def _create_day(day):
+    rows = UserDailyActivity.objects.filter(day=day)
+    totals = rows.aggregate(
+        dau=Count('id'), logins=Sum('logins'), sessions=Sum('sessions'), seconds=Sum('session_seconds'),
+    )
+    features = Counter()
+    for used in rows.exclude(features_used={}).values_list('features_used', flat=True):
+        features.update(used)
+    sessions = totals['sessions'] or 0
+    seconds = totals['seconds'] or 0
+
+    DailyActivity.objects.update_or_create(day=day, defaults={
+        'dau': totals['dau'],
+        'wau': _distinct_users(day, 7),
+        'mau': _distinct_users(day, 30),
+        'logins': totals['logins'] or 0,
+        'sessions': sessions,
+        'session_seconds': seconds,
+        'avg_session_duration_minutes': seconds / sessions / 60 if sessions else 0,
+        'features_used': dict(features),
+    })
+
+
+def _distinct_users(day, window):
+    return UserDailyActivity.objects.filter(
+        day__gt=day - datetime.timedelta(days=window), day__lte=day,
+    ).values('user_id').distinct().count()
+
+
+def refresh_user_analytics(user_ids):
+    stats = (
+        UserDailyActivity.objects.filter(user_id__in=user_ids)
+        .values('user_id')
+        .annotate(days=Count('id'), sessions=Sum('sessions'), seconds=Sum('session_seconds'))
+    )
+    UserAnalytics.objects.bulk_create([UserAnalytics(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    pks = dict(UserAnalytics.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+
+    rows = []
+    for row in stats:
+        sessions = row['sessions'] or 0
+        rows.append(UserAnalytics(
+            pk=pks[row['user_id']],
+            active_days_count=row['days'],
+            avg_session_duration_minutes=(row['seconds'] or 0) / sessions / 60 if sessions else 0,
+        ))
+    UserAnalytics.objects.bulk_update(rows, ['active_days_count', 'avg_session_duration_minutes'])
+
+
+def _missing_ranges(last_id, ids):
+    """Intervalos [início, fim] de ids ausentes entre `last_id` e os ids lidos (em ordem)."""
+    ranges = []
+    expected = last_id + 1
+    for pk in ids:
+        if pk > expected:
+            ranges.append((expected, pk - 1))
+        expected = pk + 1
+    return ranges
+
+
+def _late_events(mark, now):
+    """
+    Eventos que fizeram commit depois que a marca passou por eles (buracos de
+    id das execuções anteriores). Buracos mais velhos que ROLLUP_GAP_TIMEOUT
+    são dados como rollback e esquecidos. Devolve (eventos, buracos restantes).
+    """
+    gaps = [gap for gap in mark.gaps if now - gap[2] < settings.ROLLUP_GAP_TIMEOUT]
+    if not gaps:
+        return [], gaps
+    query = Q()
+    for start, end, _ in gaps:
+        query |= Q(id__gte=start, id__lte=end)
+    events = list(
+        ActivityEvent.objects.filter(query).order_by('id')
+        .values_list('id', 'user_id', 'kind', 'feature', 'duration_seconds', 'created_at')
+    )
+    found = [event[0] for event in events]
+    remaining = []
+    for start, end, seen_at in gaps:
+        inside = [pk for pk in found if start <= pk <= end]
+        for gap_start, gap_end in _missing_ranges(start - 1, inside + [end + 1]):
+            remaining.append([gap_start, gap_end, seen_at])
+    return events, remaining
+
+
+def run_rollup(chunk_size=10000, safety_lag=None):
+    """Processa os eventos novos; retorna contagens e tempo gasto."""
+    safety_lag = settings.ROLLUP_SAFETY_LAG if safety_lag is None else safety_lag
+    cutoff = timezone.now() - datetime.timedelta(seconds=safety_lag)
+    started = time.perf_counter()
+    stats = {'events': 0, 'late_events': 0, 'chunks': 0, 'user_days': 0, 'days': set()}
+
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            now = time.time()
+            late, gaps = _late_events(mark, now)
+            events = list(
+                ActivityEvent.objects.filter(id__gt=mark.last_event_id)
+                .order_by('id')
+                .values_list('id', 'user_id', 'kind', 'feature', 'duration_seconds', 'created_at')[:chunk_size]
+            )
+            # Para no primeiro evento recente demais
+            for index, event in enumerate(events):
+                if event[5] > cutoff:
+                    events = events[:index]
+                    break
+            # Ids pulados podem ser transações ainda abertas: voltam a ser lidos
+            # nas próximas execuções até aparecerem ou vencerem
+            if events:
+                # Na primeira execução não há o que reler antes do primeiro evento
+                previous = mark.last_event_id or events[0][0] - 1
+                gaps += [[start, end, now] for start, end in _missing_ranges(
+                    previous, [event[0] for event in events])]
+
+            if late or events:
+                per_user_day = aggregate_events(late + events)
+                days = {day for _, day in per_user_day}
+                created = apply_user_days(per_user_day)
+                refresh_daily(per_user_day, created)
+                refresh_user_analytics({user_id for user_id, _ in per_user_day})
+                if events:
+                    mark.last_event_id = events[-1][0]
+            if late or events or gaps != mark.gaps:
+                mark.gaps = gaps
+                mark.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+            if not late and not events:
+                break
+
+        stats['events'] += len(late) + len(events)
+        stats['late_events'] += len(late)
+        stats['chunks'] += 1
+        stats['user_days'] += len(per_user_day)
+        stats['days'] |= days
+        if len(events) < chunk_size:
+            break
+
+    stats['days'] = sorted(str(day) for day in stats['days'])
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
@@ -1,19 +1,34 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
 from rest_framework.exceptions import AuthenticationFailed
 
 from django.contrib.auth import get_user_model
-from .models import CustomUser,Role
+from django.conf import settings
+from .models import CustomUser, Plan, Role
+from .authentication import entitlement_claims
+from . import analytics, revocation
+
+def set_user_claims(token, user):
+    # Adiciona claims personalizados ao token
+    token['email'] = user.email
+    token['name'] = user.name
+    token['is_staff'] = user.is_staff  # Adicione se necessário
+    token['is_superuser'] = user.is_superuser
+    # Claims de direitos usados pela StatelessJWTAuthentication
+    for claim, value in entitlement_claims(user).items():
+        token[claim] = value
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        # Adiciona claims personalizados ao token
-        token['email'] = user.email
-        token['name'] = user.name
-        token['is_staff'] = user.is_staff  # Adicione se necessário
+        set_user_claims(token, user)
         return token
 
     def validate(self, attrs):
@@ -22,7 +37,11 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not email or not password:
             raise AuthenticationFailed("Email e senha são obrigatórios")
 
-        # Autenticação usando email como USERNAME_FIELD
+        # Autenticação usando email como USERNAME_FIELD. As credenciais são
+        # verificadas uma única vez: o hash da senha é a parte mais cara do
+        # login, por isso não chamamos super().validate(), que autenticaria
+        # de novo. Se o hash salvo usa um hasher/custo diferente do primeiro
+        # item de PASSWORD_HASHERS, check_password() já regrava a senha.
         user = authenticate(
             request=self.context.get('request'),
             username=email,  # <-- Correção crucial: usa 'username' como parâmetro
@@ -35,10 +54,73 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not user.is_active:
             raise AuthenticationFailed("Esta conta está desativada")
 
-        # Adiciona o usuário ao contexto para o método get_token
-        attrs['user'] = user
-        return super().validate(attrs)
-    
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed("Conta inativa ou credenciais inválidas")
+
+        # Emite o par de tokens a partir do usuário já autenticado
+        self.user = user
+        refresh = self.get_token(user)
+        data = {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }
+
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+        analytics.record_login(user)
+
+        return data
+
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh com rotação (REFRESH_TOKEN_ROTATION): devolve um novo refresh
+    token e revoga o antigo. Tokens revogados são barrados pelo índice em
+    memória (revocation.py), que só consulta o banco em prováveis acertos.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if revocation.is_revoked(refresh[api_settings.JTI_CLAIM]):
+            raise TokenError("Token revogado")
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            try:
+                user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except get_user_model().DoesNotExist:
+                user = None
+            if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed("Conta inativa ou inexistente", "no_active_account")
+            # Claims do usuário lido agora: os do token antigo podem ter plano,
+            # role e versão de direitos desatualizados
+            set_user_claims(refresh, user)
+
+        data = {'access': str(refresh.access_token)}
+        if settings.REFRESH_TOKEN_ROTATION:
+            # O INSERT do JTI é atômico: dois refreshes com o mesmo token, só um passa
+            if not revocation.revoke_token(refresh):
+                raise TokenError("Token revogado")
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        try:
+            attrs['token'] = RefreshToken(attrs['refresh'])
+        except TokenError as e:
+            raise serializers.ValidationError({'refresh': str(e)})
+        return attrs
+
+    def save(self):
+        revocation.revoke_token(self.validated_data['token'])
+
 
 class CustomUserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)  # Oculta a senha na resposta
@@ -61,9 +143,15 @@ class RoleSerializer(serializers.ModelSerializer):
         model = Role
         fields = ['id', 'name']
 
+class PlanSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Plan
+        fields = ['id', 'name']
+
 class UserSerializer(serializers.ModelSerializer):
-    role = RoleSerializer()
+    role = RoleSerializer(read_only=True)
+    plan = PlanSerializer(read_only=True)
 
     class Meta:
         model = CustomUser
-        fields = ['id', 'email', 'name', 'role']
+        fields = ['id', 'email', 'name', 'is_active', 'role', 'plan']
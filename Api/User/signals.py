@@ -1,11 +1,11 @@
 from django.db.models.signals import post_migrate, post_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from .models import Role, Plan, CustomUser
+from .models import Role, Plan, CustomUser, DomainRoleRule
 
 @receiver(post_migrate)
 def create_roles_and_plans(sender, **kwargs):
-    if sender.label == "user":  # ajuste para o nome do app correto
+    if sender.label == "User":
         roles = ["Aluno UFBA", "Treinamento", "Eventos", "Administrador", "Assinante"]
         for role_name in roles:
             Role.objects.get_or_create(name=role_name)
@@ -20,43 +20,101 @@ def create_roles_and_plans(sender, **kwargs):
                 "description": plano["description"],
             })
 
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from .models import CustomUser, Plan, Role
+from .defaults import registry
+
+@receiver(pre_save, sender=CustomUser)
+def assign_default_plan_and_role(sender, instance, raw=False, **kwargs):
+    # Resolve plano e role antes do INSERT, a partir do registro em memória,
+    # para que o cadastro seja gravado em uma única instrução
+    if raw or not instance._state.adding:
+        return
+    if instance.plan_id is not None and instance.role_id is not None:
+        return
+
+    free_plan_id, role_id = registry.defaults_for(instance.email)
+
+    # Atribuir plano gratuito se não existir
+    if instance.plan_id is None:
+        instance.plan_id = free_plan_id
+
+    # Atribuir role conforme e-mail
+    if instance.role_id is None:
+        instance.role_id = role_id
+
+
+from django.db.models.signals import post_delete
+from . import entitlements
+from .models import Subscription, SubscriptionPlan
+
+# Campos de CustomUser que entram no snapshot de direitos ou nos claims do JWT
+ENTITLEMENT_FIELDS = {
+    'plan', 'plan_id', 'role', 'role_id', 'is_active', 'is_staff', 'is_superuser',
+}
+
 
 @receiver(post_save, sender=CustomUser)
-def assign_default_plan_and_role(sender, instance, created, **kwargs):
-    if created:
-        updated = False
-
-        # Atribuir plano gratuito se não existir
-        if not instance.plan:
-            try:
-                free_plan = Plan.objects.get(is_free=True)
-                instance.plan = free_plan
-                updated = True
-            except Plan.DoesNotExist:
-                print("Plano gratuito não encontrado.")
-
-        # Atribuir role conforme e-mail
-        if not instance.role:
-            email = instance.email.lower()
-            role_to_assign = None
-            try:
-                if "@ufba" in email:
-                    role_to_assign = Role.objects.get(name="Aluno UFBA")
-                elif email.endswith("@gmail.com") or email.endswith("@gmail.com.br"):
-                    role_to_assign = Role.objects.get(name="Assinante")
-                # Nenhuma outra role automática, admin define depois
-
-                if role_to_assign:
-                    instance.role = role_to_assign
-                    updated = True
-            except Role.DoesNotExist:
-                print("Role não encontrada.")
-
-        # Salva se houve alteração
-        if updated:
-            instance.save(update_fields=['plan', 'role'])
+def invalidate_user_entitlements(sender, instance, created, update_fields=None, **kwargs):
+    # Saves parciais que não mexem em plano/role (ex.: last_login) não invalidam
+    if update_fields is not None and not ENTITLEMENT_FIELDS.intersection(update_fields):
+        return
+    # Edição de perfil ou troca de senha com save() completo: nada mudou nos
+    # direitos, então os tokens emitidos continuam valendo. Sem o estado lido
+    # do banco (instância montada à mão ou com defer), invalida por garantia.
+    previous = getattr(instance, '_entitlement_state', None)
+    current = instance._entitlement_state = instance.entitlement_state()
+    if not created and previous is not None and previous == current:
+        return
+    entitlements.invalidate(instance.pk)
+    if not created:
+        # Usuário novo ainda não tem tokens emitidos
+        entitlements.bump_version(instance.pk, instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+def delete_user_entitlements(sender, instance, **kwargs):
+    entitlements.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlements(sender, instance, **kwargs):
+    entitlements.invalidate(instance.user_id)
+    entitlements.bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def invalidate_all_entitlements(sender, **kwargs):
+    entitlements.invalidate_all()
+
+
+from django.contrib.auth.models import Permission
+from django.db.models.signals import m2m_changed
+from . import backends
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_role_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        backends.table.invalidate()
+
+
+# Exclusões em cascata apagam linhas da tabela intermediária sem m2m_changed
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_role_permission_table(sender, **kwargs):
+    backends.table.invalidate()
 
 
+@receiver(post_save, sender=DomainRoleRule)
+@receiver(post_delete, sender=DomainRoleRule)
+def invalidate_domain_rules(sender, **kwargs):
+    registry.invalidate_rules()
@@ -0,0 +1,210 @@
+# standins.py
+"""
+Substitutos locais de serviços externos, para testes e benchmarks sem rede.
+"""
+import datetime
+import json
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+
+class FirebaseKeyServer:
+    """
+    Imita o endpoint de certificados do Google e emite ID tokens do Firebase
+    assinados com a chave local.
+
+        with FirebaseKeyServer("meu-projeto") as server:
+            source = HttpCertificateSource(server.url)
+            token = server.make_token(email="aluno@ufba.br")
+    """
+
+    def __init__(self, project_id, max_age=3600, host="127.0.0.1", port=0):
+        self.project_id = project_id
+        self.max_age = max_age
+        self.requests = 0
+        self._keys = {}
+        self.rotate()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(server.certificates()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={server.max_age}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def rotate(self):
+        """Gera um novo par de chaves e passa a assinar com ele."""
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.local")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        self.kid = uuid.uuid4().hex
+        self._keys[self.kid] = (key, cert.public_bytes(serialization.Encoding.PEM).decode())
+        return self.kid
+
+    def certificates(self):
+        return {kid: pem for kid, (_, pem) in self._keys.items()}
+
+    def make_token(self, uid="uid-local", email=None, expires_in=3600, **claims):
+        now = int(time.time())
+        payload = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "sub": uid,
+            "iat": now,
+            "auth_time": now,
+            "exp": now + expires_in,
+            **claims,
+        }
+        if email:
+            payload["email"] = email
+        key, _ = self._keys[self.kid]
+        return jwt.encode(payload, key, algorithm="RS256", headers={"kid": self.kid})
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SMTPSink:
+    """
+    Servidor SMTP mínimo que aceita e guarda as mensagens em memória.
+
+        with SMTPSink(delay=0.002) as sink:
+            connection = get_connection(EMAIL_BACKEND_SMTP, host=sink.host, port=sink.port)
+
+    `delay` simula a latência do servidor real por mensagem; destinatários em
+    `reject` recebem 550, para exercitar as retentativas.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, reject=()):
+        self.delay = delay
+        self.reject = set(reject)
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, *lines):
+                # Uma escrita por resposta (evita Nagle + ACK atrasado em multilinha)
+                self.wfile.write(b"".join(line.encode() + b"\r\n" for line in lines))
+
+            def handle(self):
+                with sink._lock:
+                    sink.connections += 1
+                self.reply("220 sink ESMTP")
+                mail_from, recipients = None, []
+                for raw in self.rfile:
+                    command = raw.decode(errors="replace").strip()
+                    verb = command[:4].upper()
+                    if verb == "EHLO":
+                        self.reply("250-sink", "250 8BITMIME")
+                    elif verb == "HELO":
+                        self.reply("250 sink")
+                    elif verb == "MAIL":
+                        mail_from, recipients = command.split(":", 1)[1].strip(" <>"), []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        address = command.split(":", 1)[1].strip(" <>")
+                        if address in sink.reject:
+                            self.reply("550 Mailbox unavailable")
+                        else:
+                            recipients.append(address)
+                            self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        for line in self.rfile:
+                            if line in (b".\r\n", b".\n"):
+                                break
+                            lines.append(line[1:] if line.startswith(b"..") else line)
+                        if sink.delay:
+                            time.sleep(sink.delay)
+                        with sink._lock:
+                            sink.messages.append((mail_from, recipients, b"".join(lines)))
+                        self.reply("250 OK")
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((host, port), Handler)
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
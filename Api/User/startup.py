@@ -0,0 +1,55 @@
+# startup.py
+"""
+Inicialização do processo web, chamada por Api/wsgi.py e Api/asgi.py.
+
+Duas etapas: `warm()` carrega os caches do processo (plano/role padrão,
+permissões das roles, índice de revogação) e `start_threads()` sobe as
+threads de fundo. Com preload (comando serve) o master só aquece, herdado
+pelos workers via fork, e as threads sobem em cada worker no post_fork:
+threads no master não sobrevivem ao fork e manteriam conexões abertas.
+"""
+_threads_deferred = False
+
+
+def defer_threads():
+    """Marca o processo como master com preload: `run()` só aquece."""
+    global _threads_deferred
+    _threads_deferred = True
+
+
+def warm():
+    # Carrega plano/role padrão antes do primeiro cadastro
+    from .defaults import registry
+
+    registry.warm()
+
+    # Permissões das roles compiladas para o backend de autorização
+    from . import backends
+
+    backends.table.warm()
+
+    # Índice de refresh tokens revogados (filtro de Bloom montado a partir do banco)
+    from . import revocation
+
+    revocation.warm()
+
+
+def start_threads():
+    from . import analytics, quotas, readiness, revocation, subscriptions
+
+    # Sincronização do índice de revogação, fora dos requests
+    revocation.start()
+    # Gravação dos eventos de analytics em lote
+    analytics.start()
+    # Agendador opcional de expiração de assinaturas (SUBSCRIPTION_SWEEP_INTERVAL)
+    subscriptions.start()
+    # Agendador opcional de conferência das cotas (QUOTA_RECONCILE_INTERVAL)
+    quotas.start()
+    # Verificações de readiness em segundo plano (GET /health/ready/)
+    readiness.start()
+
+
+def run():
+    warm()
+    if not _threads_deferred:
+        start_threads()
@@ -0,0 +1,126 @@
+# subscriptions.py
+"""
+Expiração de assinaturas em lote.
+
+As assinaturas ativas vencidas são percorridas em ordem de (valid_until, id)
+com paginação por chave, usando o índice (is_active, valid_until). Cada lote
+roda em uma transação curta com UPDATEs set-based: desativa as assinaturas
+e, opcionalmente, volta os usuários para o plano gratuito. Assim nenhuma
+expiração noturna segura a tabela inteira.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import entitlements
+from .defaults import registry
+from .models import CustomUser, Subscription
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = "subscriptions:sweep-lock"
+
+
+def expire_subscriptions(chunk_size=1000, downgrade=False, now=None):
+    """Desativa as assinaturas vencidas; retorna contagens e tempos."""
+    now = now or timezone.now()
+    free_plan_id = registry.free_plan_id if downgrade else None
+    stats = {'expired': 0, 'downgraded': 0, 'chunks': 0, 'max_chunk_ms': 0.0}
+    started = time.perf_counter()
+    last = None
+
+    while True:
+        chunk_started = time.perf_counter()
+        pending = Subscription.objects.filter(is_active=True, valid_until__lte=now)
+        if last is not None:
+            pending = pending.filter(
+                Q(valid_until__gt=last[0]) | Q(valid_until=last[0], id__gt=last[1])
+            )
+        rows = list(pending.order_by('valid_until', 'id').values_list('valid_until', 'id', 'user_id')[:chunk_size])
+        if not rows:
+            break
+        last = rows[-1][:2]
+        ids = [row[1] for row in rows]
+
+        with transaction.atomic():
+            # Refaz o filtro sob lock: a assinatura pode ter sido renovada desde
+            # a leitura, e só os donos das que de fato expiram são rebaixados
+            locked = list(Subscription.objects.select_for_update().filter(
+                id__in=ids, is_active=True, valid_until__lte=now,
+            ).values_list('id', 'user_id'))
+            user_ids = [user_id for _, user_id in locked]
+            expired = Subscription.objects.filter(id__in=[pk for pk, _ in locked]).update(is_active=False)
+            downgraded = 0
+            if free_plan_id is not None and user_ids:
+                downgraded = CustomUser.objects.filter(pk__in=user_ids).exclude(
+                    plan_id=free_plan_id).update(plan_id=free_plan_id)
+            # update() não dispara signals: invalida direitos e claims aqui
+            if user_ids:
+                entitlements.bump_versions(user_ids)
+        entitlements.invalidate_many(user_ids)
+
+        stats['expired'] += expired
+        stats['downgraded'] += downgraded
+        stats['chunks'] += 1
+        stats['max_chunk_ms'] = max(stats['max_chunk_ms'], round((time.perf_counter() - chunk_started) * 1000, 3))
+        if len(rows) < chunk_size:
+            break
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+class SubscriptionSweeper:
+    """
+    Agendador opcional dentro do processo (SUBSCRIPTION_SWEEP_INTERVAL > 0).
+    Um lock no cache compartilhado evita que vários workers varram juntos.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        interval = settings.SUBSCRIPTION_SWEEP_INTERVAL
+        if not cache.add(SWEEP_LOCK_KEY, True, timeout=max(1, int(interval))):
+            return None
+        try:
+            stats = expire_subscriptions(
+                chunk_size=settings.SUBSCRIPTION_SWEEP_CHUNK_SIZE,
+                downgrade=settings.SUBSCRIPTION_SWEEP_DOWNGRADE,
+            )
+            if stats['expired']:
+                logger.info("Assinaturas expiradas: %s", stats)
+            return stats
+        except Exception:
+            logger.exception("Falha ao expirar assinaturas")
+            return None
+        finally:
+            close_old_connections()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.sweep()
+
+    def start(self):
+        interval = settings.SUBSCRIPTION_SWEEP_INTERVAL
+        if (self._thread is not None and self._thread.is_alive()) or interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="subscription-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+sweeper = SubscriptionSweeper()
+
+
+def start():
+    sweeper.start()
@@ -1,6 +1,79 @@
 # tests/test_models.py
-from django.test import TestCase
-from .models import CustomUser
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import Client
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import DjangoModelPermissions
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import urls as user_urls
+from . import (
+    admission, analytics, backends, dbpool, entitlements, firebase, importer, instrumentation, outbox, profiling, quotas,
+    ratelimit, readiness, revocation, rollups, startup, subscriptions,
+)
+from .admission import AdaptiveLimiter, Rejected
+from .analytics import AnalyticsBuffer
+from .authentication import ClaimsUser, StatelessJWTAuthentication
+from .defaults import registry
+from .domains import DomainTrie, reassign_roles
+from .firebase import FirebaseTokenVerifier, HttpCertificateSource, InvalidFirebaseToken
+from .importer import UserImporter, read_rows
+from .management.commands import bench_http, serve, startup_profile
+from .models import (
+    ActivityEvent, CustomUser, DailyActivity, DomainRoleRule, OutboxEmail, Plan, QuotaUsage, RevokedToken, Role,
+    RollupWatermark, Subscription, SubscriptionPlan, UserAnalytics, UserDailyActivity,
+)
+from .outbox import OutboxWorker
+from .pagination import EstimatedCountPaginator
+from .permissions import CanManageTeam, IsAdminRole, IsProUser, require_plan
+from .rollups import run_rollup
+from .serializer import CustomTokenObtainPairSerializer
+from .standins import FirebaseKeyServer, SMTPSink
+from .subscriptions import expire_subscriptions
+from .utils.decorators import limit_projects, limit_quota
+
+
+class CacheResetMixin:
+    """Isola os caches de processo entre testes (o rollback não dispara signals)."""
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        entitlements.clear_local()
+        registry.invalidate()
+        ratelimit.reset_backend()
+        revocation.index.reset()
+        backends.table.clear()
+
 
 class UserModelTest(TestCase):
     def test_create_user(self):
@@ -11,4 +84,1708 @@ class UserModelTest(TestCase):
     def test_create_superuser(self):
         admin = CustomUser.objects.create_superuser(email="admin@exemplo.com", password="admin123")
         self.assertTrue(admin.is_staff)
-        self.assertTrue(admin.is_superuser)
\ No newline at end of file
+        self.assertTrue(admin.is_superuser)
+
+
+class CountingHasher(MD5PasswordHasher):
+    """Hasher barato que conta quantas verificações de senha foram feitas."""
+    algorithm = "counting_md5"
+    verify_calls = 0
+
+    def verify(self, password, encoded):
+        CountingHasher.verify_calls += 1
+        return super().verify(password, encoded)
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'User.tests.CountingHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+])
+class TokenObtainTest(TestCase):
+    def setUp(self):
+        CountingHasher.verify_calls = 0
+
+    def test_login_verifica_senha_uma_vez(self):
+        CustomUser.objects.create_user(email="login@exemplo.com", password="senha123", name="Login")
+        response = self.client.post(reverse('token_obtain_pair'), {
+            "email": "login@exemplo.com", "password": "senha123",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data)
+        self.assertIn("refresh", response.data)
+        self.assertEqual(CountingHasher.verify_calls, 1)
+
+    def test_login_converte_hash_antigo(self):
+        user = CustomUser.objects.create_user(email="antigo@exemplo.com", name="Antigo")
+        user.password = MD5PasswordHasher().encode("senha123", "salt")
+        user.save(update_fields=['password'])
+
+        response = self.client.post(reverse('token_obtain_pair'), {
+            "email": "antigo@exemplo.com", "password": "senha123",
+        })
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("counting_md5$"))
+
+    def test_login_invalido(self):
+        CustomUser.objects.create_user(email="login@exemplo.com", password="senha123", name="Login")
+        response = self.client.post(reverse('token_obtain_pair'), {
+            "email": "login@exemplo.com", "password": "errada",
+        })
+        self.assertEqual(response.status_code, 401)
+
+
+class FirebaseTokenVerifierTest(CacheResetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FirebaseKeyServer("projeto-teste", max_age=600).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def make_verifier(self, **kwargs):
+        return FirebaseTokenVerifier("projeto-teste", HttpCertificateSource(self.server.url), **kwargs)
+
+    def test_verifica_token_com_certificados_em_cache(self):
+        verifier = self.make_verifier()
+        before = self.server.requests
+        for _ in range(3):
+            claims = verifier.verify(self.server.make_token(uid="abc", email="a@ufba.br"))
+        self.assertEqual(claims["uid"], "abc")
+        self.assertEqual(claims["email"], "a@ufba.br")
+        self.assertEqual(self.server.requests - before, 1)
+
+    def test_rejeita_audiencia_errada(self):
+        verifier = FirebaseTokenVerifier("outro-projeto", HttpCertificateSource(self.server.url))
+        with self.assertRaises(InvalidFirebaseToken):
+            verifier.verify(self.server.make_token())
+
+    def test_rejeita_token_expirado(self):
+        verifier = self.make_verifier()
+        with self.assertRaises(InvalidFirebaseToken):
+            verifier.verify(self.server.make_token(expires_in=-60))
+
+    def test_kid_novo_forca_renovacao(self):
+        verifier = self.make_verifier(min_refresh_interval=0)
+        verifier.verify(self.server.make_token())
+        self.server.rotate()
+        self.assertEqual(verifier.verify(self.server.make_token(uid="novo"))["uid"], "novo")
+
+    def test_login_firebase_cria_usuario(self):
+        with self.settings(FIREBASE_PROJECT_ID="projeto-teste", FIREBASE_CERTS_URL=self.server.url):
+            firebase.reset_verifier()
+            try:
+                token = self.server.make_token(uid="uid-1", email="novo@ufba.br")
+                response = self.client.post(reverse('firebase-login'), {"firebase_token": token})
+            finally:
+                firebase.reset_verifier()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(CustomUser.objects.filter(email="novo@ufba.br").exists())
+
+
+class EntitlementsTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.premium = Plan.objects.create(name="Premium", is_free=False, max_projects=10)
+        self.gestor = Role.objects.create(name="Gestor")
+        self.user = CustomUser.objects.create_user(
+            email="pro@exemplo.com", password="senha123", name="Pro",
+            plan=self.premium, role=self.gestor,
+        )
+        self.request = SimpleNamespace(user=self.user)
+
+    def test_permissoes_sem_consultas_em_regime_permanente(self):
+        self.assertTrue(IsProUser().has_permission(self.request, None))
+        with self.assertNumQueries(0):
+            self.assertTrue(IsProUser().has_permission(self.request, None))
+            self.assertTrue(CanManageTeam().has_permission(self.request, None))
+
+    def test_cache_compartilhado_evita_banco(self):
+        entitlements.get_entitlements(self.user)
+        entitlements.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(entitlements.get_entitlements(self.user).max_projects, 10)
+
+    def test_mudanca_de_plano_invalida_snapshot(self):
+        self.assertTrue(IsProUser().has_permission(self.request, None))
+        self.premium.is_free = True
+        self.premium.save()
+        self.assertFalse(IsProUser().has_permission(self.request, None))
+
+    def test_mudanca_de_role_do_usuario_invalida_snapshot(self):
+        self.assertTrue(CanManageTeam().has_permission(self.request, None))
+        self.user.role = None
+        self.user.save()
+        self.assertFalse(CanManageTeam().has_permission(self.request, None))
+
+    def test_usuario_sem_linha_recebe_403_e_nao_500(self):
+        self.user.delete()
+        request = SimpleNamespace(user=self.user)
+        self.assertFalse(IsProUser().has_permission(request, None))
+        self.assertFalse(CanManageTeam().has_permission(request, None))
+        self.assertFalse(IsAdminRole().has_permission(request, None))
+
+    def test_snapshot_relido_antes_do_commit_e_descartado(self):
+        antigo = entitlements.get_entitlements(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.premium.is_free = True
+            self.premium.save()
+            # Leitura concorrente durante a transação guarda o plano antigo
+            entitlements._local.set(self.user.pk, antigo)
+        self.assertFalse(IsProUser().has_permission(self.request, None))
+
+    def test_require_plan_usa_assinatura_do_snapshot(self):
+        view = require_plan("Ouro")(lambda request: HttpResponse("ok"))
+        self.assertEqual(view(self.request).status_code, 403)
+
+        ouro = SubscriptionPlan.objects.create(name="Ouro", price=10)
+        Subscription.objects.create(
+            user=self.user, plan=ouro,
+            valid_until=timezone.now() + datetime.timedelta(days=1),
+        )
+        self.assertEqual(view(self.request).status_code, 200)
+        with self.assertNumQueries(0):
+            view(self.request)
+
+
+class StatelessJWTAuthenticationTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.plan = Plan.objects.create(name="Premium", is_free=False)
+        self.user = CustomUser.objects.create_user(
+            email="jwt@exemplo.com", password="senha123", name="JWT", plan=self.plan,
+        )
+
+    def test_claims_de_direitos_no_token(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        token = AccessToken(str(access))
+        self.assertEqual(token['plan_id'], self.plan.pk)
+        self.assertIn('ent_ver', token)
+
+    def test_usuario_montado_dos_claims_sem_consulta(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.email, "jwt@exemplo.com")
+        self.assertFalse(hasattr(user, '__dict__'))
+
+    def test_claims_desatualizados_carregam_usuario(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.user.plan = None
+        self.user.save()
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, CustomUser)
+        self.assertIsNone(user.plan_id)
+
+    def test_save_sem_mudanca_de_direitos_mantem_tokens(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.name = "Outro nome"
+        user.set_password("nova-senha-123")
+        with self.assertNumQueries(1):
+            user.save()
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertIsInstance(StatelessJWTAuthentication().authenticate(request)[0], ClaimsUser)
+
+    def test_versao_em_cache_descartada_apos_o_commit(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        user = CustomUser.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+            # Leitura concorrente antes do commit põe a versão antiga em cache
+            cache.set(f"entitlements:version:{user.pk}", AccessToken(str(access))['ent_ver'])
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertRaises(AuthenticationFailed):
+            StatelessJWTAuthentication().authenticate(request)
+
+    def test_mudanca_de_plano_global_desatualiza_claims(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.plan.is_free = True
+        self.plan.save()
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, CustomUser)
+
+
+class RolePermissionBackendTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.role = Role.objects.create(name="Gestor")
+        self.role.permissions.add(
+            Permission.objects.get(codename='view_customuser'),
+            Permission.objects.get(codename='add_customuser'),
+        )
+        self.user = CustomUser.objects.create_user(
+            email="gestor@exemplo.com", password="senha123", name="Gestor", role=self.role,
+        )
+
+    def test_permissao_da_role_sem_consultas(self):
+        self.assertTrue(self.user.has_perm('User.view_customuser'))
+        user = CustomUser.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('User.view_customuser'))
+            self.assertTrue(user.has_perms(['User.view_customuser', 'User.add_customuser']))
+
+    @override_settings(ROLE_PERMISSIONS_ONLY=True)
+    def test_drf_model_permissions_sem_consultas(self):
+        view = SimpleNamespace(queryset=CustomUser.objects.all())
+        factory = APIRequestFactory()
+        post, delete = factory.post("/"), factory.delete("/")
+        post.user = delete.user = self.user
+        DjangoModelPermissions().has_permission(post, view)
+        with self.assertNumQueries(0):
+            self.assertTrue(DjangoModelPermissions().has_permission(post, view))
+            self.assertFalse(DjangoModelPermissions().has_permission(delete, view))
+            self.assertTrue(self.user.has_module_perms('User'))
+
+    def test_m2m_changed_invalida_tabela(self):
+        self.assertFalse(self.user.has_perm('User.delete_customuser'))
+        self.role.permissions.add(Permission.objects.get(codename='delete_customuser'))
+        self.assertTrue(CustomUser.objects.get(pk=self.user.pk).has_perm('User.delete_customuser'))
+        self.role.permissions.clear()
+        self.assertFalse(CustomUser.objects.get(pk=self.user.pk).has_perm('User.view_customuser'))
+
+    def test_geracao_compartilhada_invalida_outros_processos(self):
+        self.assertEqual(backends.role_permissions(self.role.pk), {'User.view_customuser', 'User.add_customuser'})
+        # Outro processo mudou a role: só a geração no cache compartilhado muda aqui
+        with mock.patch.object(backends.table, 'invalidate'):
+            self.role.permissions.remove(Permission.objects.get(codename='add_customuser'))
+        cache.incr(backends.GENERATION_KEY)
+        with override_settings(ROLE_PERMISSIONS_LOCAL_TTL=0):
+            self.assertEqual(backends.role_permissions(self.role.pk), {'User.view_customuser'})
+
+    def test_sem_cache_compartilhado_recompila_depois_de_max_age(self):
+        self.assertEqual(backends.role_permissions(self.role.pk), {'User.view_customuser', 'User.add_customuser'})
+        # Outro worker mudou a role e a geração dele não chega aqui (locmem)
+        with mock.patch.object(backends.table, 'invalidate'):
+            self.role.permissions.remove(Permission.objects.get(codename='add_customuser'))
+        with override_settings(ROLE_PERMISSIONS_LOCAL_TTL=0):
+            self.assertEqual(backends.role_permissions(self.role.pk), {'User.view_customuser', 'User.add_customuser'})
+            backends.table._loaded_at -= settings.ROLE_PERMISSIONS_MAX_AGE
+            self.assertEqual(backends.role_permissions(self.role.pk), {'User.view_customuser'})
+
+    def test_permissoes_individuais_continuam_valendo(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='change_customuser'))
+        self.assertTrue(CustomUser.objects.get(pk=self.user.pk).has_perm('User.change_customuser'))
+        with override_settings(ROLE_PERMISSIONS_ONLY=True):
+            self.assertFalse(CustomUser.objects.get(pk=self.user.pk).has_perm('User.change_customuser'))
+
+    def test_claims_user_usa_permissoes_da_role(self):
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        user = ClaimsUser(AccessToken(str(access)))
+        backends.role_permissions(self.role.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('User.view_customuser'))
+            self.assertFalse(user.has_perm('User.delete_customuser'))
+            self.assertTrue(user.has_module_perms('User'))
+
+    def test_claims_user_superusuario_tem_todas_as_permissoes(self):
+        self.user.is_superuser = True
+        self.user.save()
+        access = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        user = ClaimsUser(AccessToken(str(access)))
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_superuser)
+            self.assertTrue(user.has_perm('User.delete_customuser'))
+            self.assertTrue(user.has_perms(['User.delete_customuser', 'auth.change_group']))
+            self.assertTrue(user.has_module_perms('auth'))
+
+
+class SignupDefaultsTest(CacheResetMixin, TestCase):
+    def test_plano_e_role_padrao_em_um_unico_insert(self):
+        registry.warm()
+        with self.assertNumQueries(1):
+            user = CustomUser.objects.create_user(email="aluno@ufba.br", password="senha123", name="Aluno")
+        user.refresh_from_db()
+        self.assertTrue(user.plan.is_free)
+        self.assertEqual(user.role.name, "Aluno UFBA")
+
+    def test_role_por_dominio(self):
+        gmail = CustomUser.objects.create_user(email="fulano@gmail.com", name="Fulano")
+        outro = CustomUser.objects.create_user(email="fulano@empresa.com", name="Fulano")
+        self.assertEqual(gmail.role.name, "Assinante")
+        self.assertIsNone(outro.role)
+
+    def test_registro_recarrega_quando_roles_mudam(self):
+        registry.warm()
+        Role.objects.filter(name="Assinante").delete()
+        assinante = Role.objects.create(name="Assinante")
+        DomainRoleRule.objects.create(domain="gmail.com", role=assinante, include_subdomains=False)
+        user = CustomUser.objects.create_user(email="novo@gmail.com", name="Novo")
+        self.assertEqual(user.role, assinante)
+
+    def test_sem_cache_compartilhado_rele_o_banco_depois_de_max_age(self):
+        registry.warm()
+        antigo = Plan.objects.get(is_free=True).pk
+        # Outro worker troca o plano gratuito; com locmem a geração dele não chega aqui
+        with mock.patch.object(entitlements, 'invalidate_all'):
+            novo = Plan.objects.create(name="Gratuito 2", is_free=True)
+            Plan.objects.filter(pk=antigo).delete()
+        self.assertEqual(registry.free_plan_id, antigo)
+        registry._loaded_at -= settings.DEFAULTS_MAX_AGE
+        user = CustomUser.objects.create_user(email="novo@empresa.com", name="Novo")
+        self.assertEqual(user.plan_id, novo.pk)
+
+    def test_cadastro_pela_api(self):
+        registry.warm()
+        with self.assertNumQueries(2):
+            # Validação de email único + INSERT
+            response = self.client.post(reverse('create-user'), {
+                "email": "api@ufba.br", "name": "API", "password": "senha123",
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CustomUser.objects.get(email="api@ufba.br").role.name, "Aluno UFBA")
+
+
+class DomainRoleRuleTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.aluno = Role.objects.get(name="Aluno UFBA")
+        self.eventos = Role.objects.get(name="Eventos")
+
+    def test_trie_escolhe_a_regra_mais_especifica(self):
+        trie = DomainTrie()
+        trie.add("ufba.br", "aluno")
+        trie.add("dcc.ufba.br", "dcc", include_subdomains=False)
+        trie.add("gmail.com", "assinante", include_subdomains=False)
+        self.assertEqual(trie.lookup("fulano@UFBA.br"), "aluno")
+        self.assertEqual(trie.lookup("fulano@ime.ufba.br"), "aluno")
+        self.assertEqual(trie.lookup("fulano@dcc.ufba.br"), "dcc")
+        self.assertEqual(trie.lookup("fulano@lab.dcc.ufba.br"), "aluno")
+        self.assertIsNone(trie.lookup("fulano@mail.gmail.com"))
+        self.assertIsNone(trie.lookup("fulano@br"))
+        self.assertIsNone(trie.lookup(""))
+
+    def test_rotulo_vazio_nao_quebra_o_cadastro(self):
+        trie = DomainTrie()
+        trie.add("com", "tld", include_subdomains=False)
+        trie.add("gmail.com", "assinante", include_subdomains=False)
+        self.assertIsNone(trie.lookup("a@gmail..com"))
+        DomainRoleRule.objects.create(domain="com", role=self.eventos, include_subdomains=False)
+        self.assertIsNone(CustomUser.objects.create_user(email="a@gmail..com", name="A").role)
+
+    def test_dominio_duplicado_com_outra_caixa_e_erro_de_validacao(self):
+        with self.assertRaises(ValidationError) as erro:
+            DomainRoleRule(domain="UFBA.br", role=self.eventos).full_clean()
+        self.assertIn('domain', erro.exception.message_dict)
+
+    def test_geracao_avanca_de_novo_apos_o_commit(self):
+        registry.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            DomainRoleRule.objects.create(domain="unifesp.br", role=self.eventos)
+            # Outro worker recompila no meio da transação, ainda sem a regra
+            with mock.patch.object(DomainRoleRule.objects, 'values_list', return_value=[]):
+                registry.load()
+            self.assertIsNone(registry.role_for_email("a@unifesp.br"))
+        self.assertEqual(registry.role_for_email("a@unifesp.br"), self.eventos.pk)
+
+    def test_regras_iniciais(self):
+        self.assertEqual(registry.role_for_email("a@ufba.br"), self.aluno.pk)
+        self.assertEqual(registry.role_for_email("a@gmail.com.br"), Role.objects.get(name="Assinante").pk)
+        self.assertIsNone(registry.role_for_email("a@empresa.com"))
+
+    def test_regras_apagadas_nao_voltam_no_migrate(self):
+        DomainRoleRule.objects.all().delete()
+        emit_post_migrate_signal(verbosity=0, interactive=False, db='default')
+        self.assertFalse(DomainRoleRule.objects.exists())
+
+    def test_nova_regra_vale_sem_deploy_e_sem_consultas(self):
+        registry.warm()
+        self.assertIsNone(registry.role_for_email("a@unifesp.br"))
+        DomainRoleRule.objects.create(domain="@UNIFESP.br", role=self.eventos)
+        self.assertEqual(DomainRoleRule.objects.get(role=self.eventos).domain, "unifesp.br")
+        registry.role_for_email("a@unifesp.br")
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.role_for_email("a@eppg.unifesp.br"), self.eventos.pk)
+        DomainRoleRule.objects.filter(role=self.eventos).delete()
+        self.assertIsNone(registry.role_for_email("a@unifesp.br"))
+
+    def test_reaplica_regras_aos_usuarios_existentes(self):
+        admin = Role.objects.get(name="Administrador")
+        sem_role = CustomUser.objects.create_user(email="a@unifesp.br", name="A")
+        por_regra = CustomUser.objects.create_user(email="b@unifesp.br", name="B", role=self.aluno)
+        pelo_admin = CustomUser.objects.create_user(email="c@unifesp.br", name="C", role=admin)
+        fora = CustomUser.objects.create_user(email="d@empresa.com", name="D")
+        DomainRoleRule.objects.create(domain="unifesp.br", role=self.eventos)
+        self.assertIsNone(entitlements.get_entitlements(sem_role).role_id)
+
+        self.assertEqual(reassign_roles(chunk_size=2, dry_run=True)['changed'], 2)
+        self.assertIsNone(CustomUser.objects.get(pk=sem_role.pk).role_id)
+        stats = reassign_roles(chunk_size=2)
+        self.assertEqual((stats['checked'], stats['changed'], stats['chunks']), (4, 2, 2))
+        roles = dict(CustomUser.objects.filter(
+            pk__in=[sem_role.pk, por_regra.pk, pelo_admin.pk, fora.pk]).values_list('pk', 'role_id'))
+        self.assertEqual(roles, {sem_role.pk: self.eventos.pk, por_regra.pk: self.eventos.pk,
+                                 pelo_admin.pk: admin.pk, fora.pk: None})
+        # update() não dispara signals: o snapshot precisa ter sido descartado
+        self.assertEqual(entitlements.get_entitlements(sem_role).role_name, "Eventos")
+
+        out = io.StringIO()
+        call_command('reassign_roles', '--overwrite', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['changed'], 1)
+        self.assertEqual(CustomUser.objects.get(pk=pelo_admin.pk).role, self.eventos)
+
+
+class UserImportTest(CacheResetMixin, TestCase):
+    CSV = (
+        "email,name,password,role\n"
+        "um@ufba.br,Um,senha123,\n"
+        "dois@empresa.com,Dois,,Eventos\n"
+        "sem-email,Tres,,\n"
+        "um@ufba.br,Um de novo,,\n"
+        "quatro@empresa.com,Quatro,,Inexistente\n"
+    )
+
+    def test_importa_csv_e_reporta_erros_por_linha(self):
+        report = UserImporter(chunk_size=2, workers=0).run(read_rows(self.CSV.splitlines(True), 'csv'))
+        self.assertEqual(report.total, 5)
+        self.assertEqual(report.created, 2)
+        self.assertEqual([e['line'] for e in report.errors], [4, 5, 6])
+
+        um = CustomUser.objects.get(email="um@ufba.br")
+        self.assertTrue(um.check_password("senha123"))
+        self.assertEqual(um.role.name, "Aluno UFBA")
+        self.assertTrue(um.plan.is_free)
+        dois = CustomUser.objects.get(email="dois@empresa.com")
+        self.assertFalse(dois.has_usable_password())
+        self.assertEqual(dois.role.name, "Eventos")
+
+    def test_ndjson_pula_emails_existentes(self):
+        CustomUser.objects.create_user(email="ja@exemplo.com", name="Já")
+        lines = [
+            b'{"email": "ja@exemplo.com", "name": "J\xc3\xa1"}\n',
+            b'{"email": "novo@exemplo.com", "name": "Novo"}\n',
+            b'nao e json\n',
+        ]
+        report = UserImporter(workers=0).run(read_rows(lines, 'ndjson'))
+        self.assertEqual((report.created, report.skipped, len(report.errors)), (1, 1, 2))
+
+    def test_email_criado_em_paralelo_nao_conta_como_criado(self):
+        real_make_password = importer.make_password
+
+        def hash_e_concorrente(raw_password):
+            # Outro request cadastra o e-mail depois da checagem do lote
+            if not CustomUser.objects.filter(email="corrida@exemplo.com").exists():
+                CustomUser.objects.create_user(email="corrida@exemplo.com", name="Outro")
+            return real_make_password(raw_password)
+
+        rows = [
+            (2, {'email': "corrida@exemplo.com", 'name': "Corrida", 'password': "senha123"}),
+            (3, {'email': "livre@exemplo.com", 'name': "Livre"}),
+        ]
+        with mock.patch.object(importer, 'make_password', side_effect=hash_e_concorrente):
+            report = UserImporter(workers=0).run(rows)
+        self.assertEqual((report.created, report.skipped), (1, 1))
+        self.assertEqual(report.errors, [{'line': 2, 'email': "corrida@exemplo.com", 'error': "E-mail já cadastrado."}])
+        self.assertEqual(CustomUser.objects.get(email="corrida@exemplo.com").name, "Outro")
+        self.assertTrue(CustomUser.objects.filter(email="livre@exemplo.com").exists())
+
+    def test_comando_import_users(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write(self.CSV)
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command('import_users', f.name, '--workers', '0', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['created'], 2)
+
+    def test_endpoint_somente_administradores(self):
+        url = reverse('import-users')
+        comum = CustomUser.objects.create_user(email="comum@exemplo.com", password="senha123", name="Comum")
+        self.client.force_login(comum)
+        response = self.client.post(url, self.CSV, content_type="text/csv")
+        self.assertEqual(response.status_code, 403)
+
+        admin = CustomUser.objects.create_user(
+            email="adm@exemplo.com", password="senha123", name="Adm",
+            role=Role.objects.get(name="Administrador"),
+        )
+        self.client.force_login(admin)
+        # Nada de pool de processos (fork) dentro do worker web
+        with mock.patch.object(importer, 'ProcessPoolExecutor') as pool:
+            response = self.client.post(url, self.CSV, content_type="text/csv")
+        pool.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+
+    @override_settings(USER_IMPORT_MAX_ROWS=4)
+    def test_endpoint_recusa_arquivo_acima_do_limite(self):
+        admin = CustomUser.objects.create_user(
+            email="adm@exemplo.com", password="senha123", name="Adm",
+            role=Role.objects.get(name="Administrador"),
+        )
+        self.client.force_login(admin)
+        antes = CustomUser.objects.count()
+        response = self.client.post(reverse('import-users'), self.CSV, content_type="text/csv")
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("import_users", response.data['error'])
+        # Nenhuma linha importada: o arquivo vai inteiro pelo comando
+        self.assertEqual(CustomUser.objects.count(), antes)
+
+
+class UserDirectoryTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('user-directory')
+        self.eventos = Role.objects.get(name="Eventos")
+        self.admin = CustomUser.objects.create_user(
+            email="adm@exemplo.com", name="Adm", role=Role.objects.get(name="Administrador"),
+        )
+        for i in range(6):
+            CustomUser.objects.create_user(
+                email=f"u{i}@exemplo.com", name=f"U{i}", role=self.eventos if i % 2 else None, is_active=i != 5,
+            )
+        self.client.force_login(self.admin)
+
+    def test_percorre_por_cursor_sem_n_mais_1(self):
+        emails = []
+        url = f"{self.url}?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            emails += [u['email'] for u in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(emails), 7)
+        self.assertEqual(emails, sorted(emails, key=lambda e: CustomUser.objects.get(email=e).pk))
+
+        self.client.get(self.url)
+        with self.assertNumQueries(3) as pequena:
+            self.client.get(f"{self.url}?page_size=2")
+        with self.assertNumQueries(len(pequena.captured_queries)):
+            self.client.get(f"{self.url}?page_size=7")
+
+    def test_filtros(self):
+        response = self.client.get(self.url, {'role': self.eventos.pk, 'is_active': 'false'})
+        self.assertEqual([u['email'] for u in response.data['results']], ["u5@exemplo.com"])
+        self.assertEqual(response.data['results'][0]['role']['name'], "Eventos")
+        self.assertEqual(self.client.get(self.url, {'plan': 'x'}).status_code, 400)
+
+    def test_etag_fraco_e_if_none_match(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        CustomUser.objects.filter(email="u0@exemplo.com").update(name="Outro")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_somente_administradores(self):
+        self.client.force_login(CustomUser.objects.get(email="u0@exemplo.com"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class CustomUserAdminTest(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(email="adm@exemplo.com", password="senha123", name="Adm")
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:User_customuser_changelist')
+
+    def criar(self, inicio, total):
+        eventos = Role.objects.get(name="Eventos")
+        CustomUser.objects.bulk_create([
+            CustomUser(email=f"u{i}@exemplo.com", name=f"U{i}", role=eventos, plan=Plan.objects.first())
+            for i in range(inicio, inicio + total)
+        ])
+
+    def test_lista_sem_n_mais_1(self):
+        self.criar(0, 3)
+        with CaptureQueriesContext(connection) as poucos:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.criar(3, 30)
+        with self.assertNumQueries(len(poucos.captured_queries)):
+            self.client.get(self.url)
+
+    def test_busca_por_prefixo(self):
+        self.criar(0, 3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'q': 'U1'})
+        self.assertEqual([u.email for u in response.context['cl'].result_list], ["u1@exemplo.com"])
+        self.assertFalse(any("LIKE '%" in q['sql'] or 'LIKE %' in q['sql'] for q in queries.captured_queries))
+
+    def test_paginator_limita_a_contagem_exata(self):
+        self.criar(0, 5)
+
+        class Pequeno(EstimatedCountPaginator):
+            exact_limit = 3
+
+        queryset = CustomUser.objects.filter(is_active=True).order_by('pk')
+        self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 6)
+        with CaptureQueriesContext(connection) as queries:
+            # Fora do PostgreSQL não há estimativa: cai na contagem exata
+            self.assertEqual(Pequeno(queryset, 2).count, 6)
+        self.assertIn('LIMIT 4', queries.captured_queries[0]['sql'])
+
+
+class EmailOutboxTest(TestCase):
+    def setUp(self):
+        CustomUser.objects.create_user(email="ana@exemplo.com", name="Ana")
+
+    def test_request_so_enfileira(self):
+        url = reverse('password_reset_request')
+        for email in ("ana@exemplo.com", "ninguem@exemplo.com"):
+            with self.assertNumQueries(1):
+                response = self.client.post(url, {'email': email}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.client.post(url, {'email': 'x'}, content_type='application/json').status_code, 400)
+
+        stats = OutboxWorker().drain()
+        self.assertEqual((stats['sent'], stats['skipped']), (1, 1))
+        self.assertEqual(mail.outbox[0].to, ["ana@exemplo.com"])
+        self.assertIn("/reset-password/", mail.outbox[0].body)
+        self.assertFalse(OutboxEmail.objects.filter(status=OutboxEmail.PENDING).exists())
+
+    def test_lote_em_uma_conexao_com_retentativas(self):
+        for email in ("a@exemplo.com", "recusa@exemplo.com", "b@exemplo.com"):
+            outbox.enqueue(email, "Assunto", "Corpo")
+
+        with SMTPSink(reject={"recusa@exemplo.com"}) as sink:
+            smtp = get_connection('django.core.mail.backends.smtp.EmailBackend', host=sink.host, port=sink.port)
+            worker = OutboxWorker(max_attempts=2, connection=smtp)
+            with self.assertLogs('User.outbox', 'WARNING') as logs:
+                stats = worker.drain()
+            self.assertIn("Falha ao enviar 1 e-mail(s)", logs.output[0])
+            self.assertEqual((stats['sent'], stats['retried']), (2, 1))
+            self.assertEqual(sink.connections, 1)
+            self.assertEqual(len(sink.messages), 2)
+
+            falha = OutboxEmail.objects.get(to_email="recusa@exemplo.com")
+            self.assertEqual((falha.status, falha.attempts), (OutboxEmail.PENDING, 1))
+            self.assertGreater(falha.next_attempt_at, timezone.now())
+            self.assertEqual(worker.drain()['batches'], 0)  # ainda no backoff
+
+            OutboxEmail.objects.filter(pk=falha.pk).update(next_attempt_at=timezone.now())
+            with self.assertLogs('User.outbox', 'WARNING') as logs:
+                self.assertEqual(worker.drain()['failed'], 1)
+            self.assertIn("Falha ao enviar 1 e-mail(s)", logs.output[0])
+        self.assertEqual(OutboxEmail.objects.get(pk=falha.pk).status, OutboxEmail.FAILED)
+
+
+class AdmissionControlTest(TestCase):
+    CONFIG = {
+        'auth': {'limit': 1, 'queue': 0, 'status': 429},
+        'read': {'limit': 4, 'queue': 4},
+        'health': {'limit': 1, 'queue': 0},
+    }
+
+    def setUp(self):
+        admission.reset_controller()
+        self.addCleanup(admission.reset_controller)
+
+    def test_fila_limitada_e_timeout(self):
+        limiter = AdaptiveLimiter('auth', limit=1, queue=1, timeout=0.01)
+        started = limiter.acquire()
+        with self.assertRaises(Rejected) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.reason, "tempo de espera esgotado")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(limiter.snapshot()['queue_depth'], 0)
+        limiter.release(started)
+        limiter.release(limiter.acquire())
+        self.assertEqual(limiter.snapshot()['rejected'], 1)
+
+    def test_limite_adaptativo_pela_latencia(self):
+        limiter = AdaptiveLimiter('read', limit=10, min_limit=2, max_limit=12, target_ms=50)
+        limiter.release(limiter.acquire() - 1)  # 1s: acima do alvo
+        self.assertAlmostEqual(limiter.limit, 9)
+        for _ in range(50):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 12)
+
+    def test_middleware_rejeita_auth_sem_afetar_health(self):
+        with override_settings(LOAD_SHEDDING=self.CONFIG):
+            auth = admission.get_controller().limiters['auth']
+            started = auth.acquire()
+            response = self.client.post(reverse('token_obtain_pair'), {'email': 'a@exemplo.com', 'password': 'x'})
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            self.assertEqual(self.client.get(reverse('health_check')).status_code, 200)
+            auth.release(started)
+
+            with override_settings(METRICS_TOKEN="token-metricas"):
+                metrics = self.client.get(reverse('load-metrics'), HTTP_AUTHORIZATION="Bearer token-metricas").json()
+            self.assertEqual(metrics['auth']['rejected'], 1)
+            self.assertEqual(metrics['health']['inflight'], 1)  # o próprio request
+
+
+@override_settings(PASSWORD_HASHERS=['User.tests.CountingHasher'])
+class RateLimitTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        CountingHasher.verify_calls = 0
+        CustomUser.objects.create_user(email="ana@exemplo.com", password="senha123", name="Ana")
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate("5/m"), (5, 60))
+        self.assertEqual(ratelimit.parse_rate("10/15m"), (10, 900))
+        self.assertEqual(ratelimit.parse_rate("3/hour"), (3, 3600))
+        with self.assertRaises(ValueError):
+            ratelimit.parse_rate("muitos")
+
+    @override_settings(RATE_LIMIT_BACKEND='local')
+    def test_janela_deslizante(self):
+        self.assertTrue(ratelimit.check("k", 2, 10, now=100)[0])
+        self.assertTrue(ratelimit.check("k", 2, 10, now=101)[0])
+        allowed, retry_after = ratelimit.check("k", 2, 10, now=102)
+        self.assertEqual((allowed, retry_after), (False, 8))
+        # Metade da janela seguinte: 3 * 0.5 + 1 > 2
+        self.assertFalse(ratelimit.check("k", 2, 10, now=115)[0])
+        # Quase no fim: 2 * 0.1 + 1 <= 2 (a anterior agora é a que teve 2 tentativas)
+        self.assertTrue(ratelimit.check("k", 2, 10, now=129)[0])
+
+    def login(self, email):
+        return self.client.post(reverse('token_obtain_pair'), {"email": email, "password": "errada"})
+
+    def test_login_rejeitado_antes_do_hash_e_do_banco(self):
+        for backend in ('local', 'cache'):
+            with self.subTest(backend=backend), override_settings(
+                    RATE_LIMIT_BACKEND=backend, RATE_LIMITS={'login': {'email': '2/m'}}):
+                ratelimit.reset_backend()
+                cache.clear()
+                CountingHasher.verify_calls = 0
+                self.assertEqual(self.login("ana@exemplo.com").status_code, 401)
+                self.assertEqual(self.login("ana@exemplo.com").status_code, 401)
+                with self.assertNumQueries(0):
+                    response = self.login("ANA@exemplo.com")
+                self.assertEqual(response.status_code, 429)
+                self.assertIn('Retry-After', response)
+                self.assertEqual(CountingHasher.verify_calls, 2)
+                # Outro e-mail não é afetado
+                self.assertEqual(self.login("bia@exemplo.com").status_code, 401)
+
+    @override_settings(RATE_LIMITS={'password_reset': {'ip': '1/h'}})
+    def test_redefinicao_por_ip(self):
+        url = reverse('password_reset_request')
+        self.assertEqual(self.client.post(url, {'email': 'ana@exemplo.com'}).status_code, 200)
+        response = self.client.post(url, {'email': 'bia@exemplo.com'}, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+    def test_nat_do_campus_nao_bloqueia_logins_de_contas_diferentes(self):
+        url = reverse('token_obtain_pair')
+        for n in range(60):
+            response = self.client.post(url, {"email": f"aluno{n}@ufba.br", "password": "errada"},
+                                        REMOTE_ADDR="200.128.0.1")
+            self.assertNotEqual(response.status_code, 429)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': '2/m'}})
+    def test_x_forwarded_for_forjado_nao_escapa_do_limite_por_ip(self):
+        url = reverse('token_obtain_pair')
+        for n in range(3):
+            response = self.client.post(url, {"email": f"x{n}@exemplo.com", "password": "errada"},
+                                        HTTP_X_FORWARDED_FOR=f"10.0.0.{n}")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': '30/m', 'email': '10/15m'}})
+    def test_cache_redis_uma_ida_por_checagem(self):
+        ratelimit.reset_backend()
+        pipelines = []
+
+        class Pipeline:
+            def __init__(self, store):
+                self.store, self.ops = store, []
+                pipelines.append(self)
+
+            def incr(self, key):
+                self.ops.append(('incr', key))
+
+            def expire(self, key, ttl):
+                self.ops.append(('expire', key))
+
+            def mget(self, keys):
+                self.ops.append(('mget', keys))
+
+            def execute(self):
+                replies = []
+                for op, arg in self.ops:
+                    if op == 'incr':
+                        self.store[arg] = self.store.get(arg, 0) + 1
+                        replies.append(self.store[arg])
+                    elif op == 'expire':
+                        replies.append(True)
+                    else:
+                        replies.append([self.store.get(key) for key in arg])
+                return replies
+
+        store = {}
+        redis = mock.Mock(spec=RedisCache)
+        redis.make_and_validate_key.side_effect = lambda key: f":1:{key}"
+        redis._cache.get_client.return_value.pipeline.side_effect = lambda transaction: Pipeline(store)
+        with mock.patch.object(ratelimit, 'caches', {'default': redis}):
+            for _ in range(11):
+                response = self.login("ana@exemplo.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(pipelines), 11)
+        # ip e email: um INCR/EXPIRE cada, e o MGET das janelas anteriores só na primeira
+        self.assertEqual([op for op, _ in pipelines[0].ops], ['incr', 'expire', 'incr', 'expire', 'mget'])
+        self.assertEqual([op for op, _ in pipelines[1].ops], ['incr', 'expire', 'incr', 'expire'])
+
+
+class DatabaseMetricsTest(TestCase):
+    def test_metricas_por_worker(self):
+        staff = CustomUser.objects.create_user(email="staff@exemplo.com", name="Staff", is_staff=True)
+        self.client.force_login(staff)
+        data = self.client.get(reverse('db-metrics')).json()
+        default = data['databases']['default']
+        self.assertEqual(default['vendor'], connection.vendor)
+        self.assertIsInstance(default['connections_opened'], int)
+        self.assertNotIn('pool', default)
+
+    def test_estatisticas_do_pool(self):
+        pool = SimpleNamespace(get_stats=lambda: {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+            'requests_waiting': 3, 'requests_num': 50, 'requests_queued': 7, 'requests_wait_ms': 120,
+        })
+        stats = dbpool._pool_stats(pool)
+        self.assertEqual((stats['in_use'], stats['waiting'], stats['requests_waited']), (3, 3, 7))
+        self.assertEqual(stats['wait_ms_total'], 120)
+
+
+class ServeCommandTest(TestCase):
+    OPTIONS = {
+        'mode': 'wsgi', 'bind': '0.0.0.0:8000', 'workers': None, 'threads': 4, 'max_requests': 2000,
+        'max_requests_jitter': 200, 'timeout': 30, 'graceful_timeout': 30, 'keepalive': 5, 'no_preload': False,
+    }
+
+    def test_workers_pelos_nucleos(self):
+        with mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('WEB_CONCURRENCY', None)
+            wsgi = serve.gunicorn_options(self.OPTIONS, cpus=4)
+            asgi = serve.gunicorn_options({**self.OPTIONS, 'mode': 'asgi'}, cpus=4)
+        self.assertEqual((wsgi['workers'], wsgi['worker_class'], wsgi['threads']), (9, 'gthread', 4))
+        self.assertEqual((asgi['workers'], asgi['worker_class']), (4, 'uvicorn.workers.UvicornWorker'))
+        self.assertNotIn('threads', asgi)
+        self.assertTrue(wsgi['preload_app'])
+
+    def test_post_fork_reinicia_as_threads(self):
+        modulos = (analytics, quotas, readiness, revocation, subscriptions)
+        patches = [mock.patch.object(modulo, 'start') for modulo in modulos]
+        starts = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        serve.post_fork(None, None)
+        for start in starts:
+            start.assert_called_once_with()
+
+    def test_preload_so_aquece_no_master(self):
+        modulos = (analytics, quotas, readiness, revocation, subscriptions)
+        patches = [mock.patch.object(modulo, 'start') for modulo in modulos]
+        patches += [mock.patch.object(startup, 'warm'), mock.patch.object(startup, '_threads_deferred', False)]
+        mocks = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        starts, warm = mocks[:len(modulos)], mocks[len(modulos)]
+
+        startup.defer_threads()
+        startup.run()
+        warm.assert_called_once_with()
+        for start in starts:
+            start.assert_not_called()
+
+    def test_web_concurrency_e_opcao_explicita(self):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '5'}):
+            self.assertEqual(serve.gunicorn_options(self.OPTIONS, cpus=4)['workers'], 5)
+            self.assertEqual(serve.gunicorn_options({**self.OPTIONS, 'workers': 2}, cpus=4)['workers'], 2)
+
+
+class InstrumentationTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset()
+
+    @override_settings(METRICS_TOKEN="token-metricas")
+    def test_metricas_exigem_token_ou_staff(self):
+        for name in ('metrics', 'load-metrics', 'db-metrics'):
+            url = reverse(name)
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer outro").status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer token-metricas").status_code, 200)
+        comum = CustomUser.objects.create_user(email="comum@exemplo.com", name="Comum")
+        self.client.force_login(comum)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        comum.is_staff = True
+        comum.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        with override_settings(METRICS_TOKEN=""):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    def test_metricas_prometheus_por_view(self):
+        self.client.get(reverse('health_check'))
+        self.client.get('/nao-existe/')
+        self.client.post(reverse('password_reset_request'), {'email': "ana@exemplo.com"})
+
+        with override_settings(METRICS_TOKEN="token-metricas"):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION="Bearer token-metricas")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = set(response.content.decode().splitlines())
+        self.assertIn('http_requests_total{view="health_check",method="GET",status="200"} 1', lines)
+        self.assertIn('http_requests_total{view="<unresolved>",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{view="health_check",method="GET"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="health_check",method="GET",le="+Inf"} 1', lines)
+        self.assertIn('http_response_size_bytes_sum{view="health_check",method="GET"} 2', lines)
+        # O enfileiramento do e-mail é um único INSERT
+        self.assertIn('http_db_queries_total{view="password_reset_request",method="POST"} 1', lines)
+        self.assertIn('admission_rejected_total{class="auth"} 0', lines)
+
+    def test_shards_de_threads_encerradas_continuam_somados(self):
+        thread = threading.Thread(target=instrumentation.record, args=('x', 'GET', 200, 0.02))
+        thread.start()
+        thread.join()
+        instrumentation.record('x', 'GET', 200, 0.2, queries=3)
+        requests, views = instrumentation.snapshot()
+        self.assertEqual(requests[('x', 'GET', '200')], 2)
+        self.assertEqual((views[('x', 'GET')]['count'], views[('x', 'GET')]['queries']), (2, 3))
+
+
+def funcao_lenta_de_teste(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class SamplingProfilerTest(TestCase):
+    def test_amostra_a_thread_e_grava_formato_collapsed(self):
+        profiler = profiling.SamplingProfiler(interval=0.001)
+        token = profiler.begin()
+        funcao_lenta_de_teste(0.1)
+        stacks = profiler.end(token)
+        self.assertTrue(any(stack.endswith('User.tests.funcao_lenta_de_teste') for stack in stacks), stacks)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = profiling.dump(stacks, 'admin:index', 0.1, directory=directory)
+            self.assertIn('admin_index-100ms', os.path.basename(path))
+            with open(path, encoding='utf-8') as f:
+                first = f.readline()
+        stack, count = first.rsplit(' ', 1)
+        self.assertIn(';', stack)
+        self.assertGreater(int(count), 0)
+
+
+class ReadinessTest(TestCase):
+    def setUp(self):
+        self.monitor = readiness.monitor
+        self.addCleanup(setattr, self.monitor, '_result', None)
+        self.addCleanup(setattr, self.monitor, 'draining', False)
+        self.monitor._result, self.monitor.draining = None, False
+        self.url = reverse('readiness')
+
+    def test_probe_le_o_resultado_em_cache(self):
+        self.assertEqual(self.client.get(self.url).json()['status'], 'starting')
+        self.assertEqual(self.client.get(reverse('liveness')).status_code, 200)
+
+        self.monitor.run_checks()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'ready')
+        self.assertEqual(set(body['checks']), {'database', 'migrations', 'cache'})
+        self.assertTrue(all(check['ok'] for check in body['checks'].values()))
+
+    def test_falha_e_resultado_velho(self):
+        def banco_fora():
+            raise ConnectionError("conexão recusada")
+
+        monitor = readiness.ReadinessMonitor(checks={'database': banco_fora, 'cache': lambda: None}, interval=1)
+        monitor.run_checks()
+        ready, body = monitor.status()
+        self.assertFalse(ready)
+        self.assertEqual(body['checks']['database']['error'], "conexão recusada")
+
+        monitor.checks = {'cache': lambda: None}
+        checked_at, ok, checks = monitor.run_checks()
+        self.assertTrue(monitor.status()[0])
+        monitor._result = (checked_at - 60, ok, checks)
+        self.assertEqual(monitor.status(), (False, {'status': 'stale', 'age_seconds': mock.ANY, 'checks': checks}))
+
+    def test_migracoes_aplicadas_nao_sao_conferidas_de_novo(self):
+        self.addCleanup(setattr, readiness, '_migrations_applied', False)
+        readiness._migrations_applied = False
+        with mock.patch('django.db.migrations.executor.MigrationExecutor') as executor:
+            executor.return_value.migration_plan.return_value = [(SimpleNamespace(name="0099_nova"), False)]
+            with self.assertRaises(RuntimeError):
+                readiness.check_migrations()
+            executor.return_value.migration_plan.return_value = []
+            readiness.check_migrations()
+            readiness.check_migrations()
+        self.assertEqual(executor.call_count, 2)
+
+    def test_arquivo_de_drenagem_tira_o_worker_de_rotacao(self):
+        with tempfile.TemporaryDirectory() as directory:
+            drain_file = os.path.join(directory, 'draining')
+            with override_settings(READINESS_DRAIN_FILE=drain_file):
+                self.monitor.run_checks()
+                self.assertEqual(self.client.get(self.url).status_code, 200)
+                open(drain_file, 'w').close()
+                self.monitor.run_checks()
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.json()), (503, {'status': 'draining'}))
+
+
+class RefreshRotationTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('token_refresh')
+        self.user = CustomUser.objects.create_user(email="rot@exemplo.com", name="Rot")
+        self.refresh = str(CustomTokenObtainPairSerializer.get_token(self.user))
+
+    def test_rotacao_e_reuso_do_token_antigo(self):
+        response = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        novo = response.json()['refresh']
+        self.assertNotEqual(novo, self.refresh)
+        self.assertIn('access', response.json())
+
+        self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 401)
+        self.assertEqual(self.client.post(self.url, {'refresh': novo}).status_code, 200)
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=3600)
+    def test_token_valido_nao_consulta_as_revogacoes(self):
+        revocation.index.rebuild()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 200)
+        leituras = [q['sql'] for q in context.captured_queries
+                    if 'revokedtoken' in q['sql'].lower() and not q['sql'].startswith('INSERT')]
+        self.assertEqual(leituras, [])
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=0)
+    def test_revogacao_feita_por_outro_worker_chega_no_sync(self):
+        revocation.index.rebuild()
+        token = RefreshToken(self.refresh)
+        RevokedToken.objects.create(jti=token['jti'], expires_at=timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 401)
+        self.assertEqual(revocation.index.stats()['confirmed_hits'], 1)
+
+    def test_refresh_reemite_claims_de_direitos(self):
+        premium = Plan.objects.get(name="Premium")
+        self.user.plan = premium
+        self.user.save()
+        self.user.refresh_from_db()
+        response = self.client.post(self.url, {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        for token in (AccessToken(response.json()['access']), RefreshToken(response.json()['refresh'])):
+            self.assertEqual(token['plan_id'], premium.pk)
+            self.assertEqual(token['ent_ver'], self.user.entitlement_version)
+        # Os claims novos passam pela autenticação sem claims, sem cair no banco
+        with override_settings(JWT_STATELESS_AUTH=True):
+            request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.plan_id, premium.pk)
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=0)
+    def test_com_a_thread_rodando_o_request_nao_sincroniza(self):
+        revocation.index.rebuild()
+        thread = mock.Mock(**{'is_alive.return_value': True})
+        with mock.patch.object(revocation.index, '_thread', thread), \
+                mock.patch.object(revocation.index, 'sync') as sync:
+            self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 200)
+            sync.assert_not_called()
+            revocation.index.refresh()
+            sync.assert_called_once()
+
+    def test_logout_revoga_o_refresh_token(self):
+        response = self.client.post(reverse('token_revoke'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.client.post(self.url, {'refresh': self.refresh}).status_code, 401)
+        self.assertEqual(self.client.post(reverse('token_revoke'), {'refresh': "lixo"}).status_code, 400)
+
+    def test_filtro_de_bloom(self):
+        bloom = revocation.BloomFilter(capacity=2000, error_rate=0.001)
+        revogados = [f"jti-{i}" for i in range(2000)]
+        for jti in revogados:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in revogados))
+        falsos = sum(f"outro-{i}" in bloom for i in range(20000))
+        self.assertLess(falsos, 60)
+        self.assertLess(bloom.nbytes, 4000)
+
+
+class HttpBenchTest(TestCase):
+    def test_conta_queries_por_request(self):
+        def app(environ, start_response):
+            CustomUser.objects.count()
+            CustomUser.objects.exists()
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+
+        headers = {}
+        bench_http.QueryCountingApp(app)({}, lambda status, h, exc_info=None: headers.update(h))
+        self.assertEqual(headers[bench_http.QUERIES_HEADER], '2')
+
+    def test_resumo_e_comparacao_com_baseline(self):
+        samples = [(200, 0.010, 1)] * 95 + [(200, 0.050, 1)] * 4 + [(503, 0.001, 0)]
+        summary = bench_http.summarize(samples, elapsed=2.0)
+        self.assertEqual((summary['requests'], summary['errors'], summary['rps']), (100, 1, 50.0))
+        self.assertEqual((summary['p50_ms'], summary['p99_ms']), (10.0, 50.0))
+        self.assertEqual((summary['queries_per_request'], summary['status']), (1.0, {'200': 99, '503': 1}))
+
+        baseline = {'scenarios': {'token': summary}}
+        self.assertEqual(bench_http.compare({'scenarios': {'token': summary}}, baseline, 0.2), [])
+        worse = {**summary, 'rps': 30.0, 'queries_per_request': 2.0}
+        regressions = bench_http.compare({'scenarios': {'token': worse}}, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+
+
+class StartupTest(TestCase):
+    def test_subida_a_frio_dentro_do_orcamento(self):
+        timings, _ = startup_profile.measure_startup(wsgi=False)
+        self.assertLess(timings['total'], settings.STARTUP_BUDGET_SECONDS * 1000, timings)
+
+    def test_settings_sem_efeitos_colaterais(self):
+        # Processo novo: nada de print nem de criação de diretórios ao importar o settings
+        script = (
+            "import os\n"
+            "def proibido(*a, **k): raise AssertionError('efeito colateral no import do settings')\n"
+            "os.makedirs = os.mkdir = proibido\n"
+            "import Api.settings\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, "")
+
+    def test_parse_importtime(self):
+        lines = [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        450 |   User.outbox",
+        ]
+        self.assertEqual(startup_profile.parse_importtime(lines), [("User.outbox", 0.12, 0.45)])
+
+
+class AnalyticsBufferTest(TestCase):
+    def setUp(self):
+        self.buffer = AnalyticsBuffer(size=100)
+        self.user = CustomUser.objects.create_user(email="an@exemplo.com", name="An")
+
+    def test_flush_agrega_eventos_em_lote(self):
+        ontem = timezone.now() - datetime.timedelta(days=1)
+        hoje = timezone.now()
+        for at in (ontem, hoje, hoje):
+            self.buffer.append((analytics.LOGIN, self.user.pk, at, None))
+        for feature in ("api", "api", "admin"):
+            self.buffer.append((analytics.FEATURE, self.user.pk, hoje, feature))
+
+        self.assertEqual(self.buffer.flush(), 6)
+        row = UserAnalytics.objects.get(user=self.user)
+        self.assertEqual(row.total_logins, 3)
+        # Dias ativos vêm só do rollup
+        self.assertEqual(row.active_days_count, 0)
+        self.assertEqual(row.last_login_date, hoje)
+        self.assertEqual(row.features_used, {"api": 2, "admin": 1})
+
+        self.buffer.append((analytics.LOGIN, self.user.pk, hoje, None))
+        self.buffer.append((analytics.FEATURE, self.user.pk, hoje, "api"))
+        with self.assertNumQueries(7):
+            # savepoint, usuários, eventos, INSERT ignorado, ids, UPDATE em lote, release
+            self.buffer.flush()
+        row.refresh_from_db()
+        self.assertEqual(row.total_logins, 4)
+        self.assertEqual(row.features_used, {"api": 3, "admin": 1})
+
+    def test_buffer_limitado_descarta_os_mais_antigos(self):
+        small = AnalyticsBuffer(size=2)
+        for _ in range(5):
+            small.append((analytics.LOGIN, self.user.pk, timezone.now(), None))
+        self.assertEqual((len(small), small.dropped), (2, 3))
+
+    def test_flush_com_falha_devolve_os_eventos_ao_buffer(self):
+        for feature in ("a", "b"):
+            self.buffer.append((analytics.FEATURE, self.user.pk, timezone.now(), feature))
+        with mock.patch.object(self.buffer, '_apply', side_effect=DatabaseError("banco fora")), \
+                self.assertLogs('User.analytics', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual((len(self.buffer), self.buffer.dropped), (2, 0))
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(UserAnalytics.objects.get(user=self.user).features_used, {"a": 1, "b": 1})
+
+    def test_eventos_devolvidos_respeitam_o_limite(self):
+        small = AnalyticsBuffer(size=3)
+        for feature in ("a", "b"):
+            small.append((analytics.FEATURE, self.user.pk, timezone.now(), feature))
+
+        def chegam_mais_e_falha(events, per_user):
+            for feature in ("c", "d"):
+                small.append((analytics.FEATURE, self.user.pk, timezone.now(), feature))
+            raise DatabaseError("banco fora")
+
+        with mock.patch.object(small, '_apply', side_effect=chegam_mais_e_falha), \
+                self.assertLogs('User.analytics', 'ERROR'):
+            small.flush()
+        self.assertEqual([event[3] for event in small.drain()], ["b", "c", "d"])
+        self.assertEqual(small.dropped, 1)
+
+    def test_login_registra_evento(self):
+        analytics.buffer.drain()
+        CustomUser.objects.create_user(email="ev@exemplo.com", password="senha123", name="Ev")
+        self.client.post(reverse('token_obtain_pair'), {"email": "ev@exemplo.com", "password": "senha123"})
+        self.assertEqual(analytics.buffer.flush(), 1)
+        self.assertEqual(UserAnalytics.objects.get(user__email="ev@exemplo.com").total_logins, 1)
+
+
+class RollupAnalyticsTest(TestCase):
+    def setUp(self):
+        self.ana = CustomUser.objects.create_user(email="ana@exemplo.com", name="Ana")
+        self.bia = CustomUser.objects.create_user(email="bia@exemplo.com", name="Bia")
+        self.hoje = timezone.localdate()
+        self.ontem = self.hoje - datetime.timedelta(days=1)
+
+    def event(self, user, kind, day, **kwargs):
+        at = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        return ActivityEvent.objects.create(user=user, kind=kind, created_at=at, **kwargs)
+
+    def test_flush_e_rollup_nao_disputam_os_dias_ativos(self):
+        buffer = AnalyticsBuffer(size=100)
+
+        def flush_e_rollup(kind, day, value=None):
+            at = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+            buffer.append((kind, self.ana.pk, at, value))
+            buffer.flush()
+            dias_apos_flush = UserAnalytics.objects.get(user=self.ana).active_days_count
+            run_rollup(safety_lag=0)
+            return dias_apos_flush, UserAnalytics.objects.get(user=self.ana).active_days_count
+
+        self.assertEqual(flush_e_rollup(analytics.LOGIN, self.ontem), (0, 1))
+        self.assertEqual(flush_e_rollup(analytics.FEATURE, self.hoje, "api"), (1, 2))
+        # Primeiro login de um dia que o rollup já contou: o valor não muda
+        self.assertEqual(flush_e_rollup(analytics.LOGIN, self.hoje), (2, 2))
+
+    def test_rollup_incremental_por_marca_dagua(self):
+        self.event(self.ana, ActivityEvent.LOGIN, self.ontem)
+        self.event(self.ana, ActivityEvent.SESSION, self.ontem, duration_seconds=600)
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje)
+        self.event(self.bia, ActivityEvent.FEATURE, self.hoje, feature="api")
+        self.event(self.bia, ActivityEvent.SESSION, self.hoje, duration_seconds=1200)
+
+        stats = run_rollup(chunk_size=2, safety_lag=0)
+        self.assertEqual((stats['events'], stats['chunks']), (5, 3))
+
+        dia = DailyActivity.objects.get(day=self.hoje)
+        self.assertEqual((dia.dau, dia.wau, dia.mau), (2, 2, 2))
+        self.assertEqual(dia.features_used, {"api": 1})
+        self.assertEqual(DailyActivity.objects.get(day=self.ontem).dau, 1)
+
+        ana = UserAnalytics.objects.get(user=self.ana)
+        self.assertEqual(ana.active_days_count, 2)
+        self.assertEqual(ana.avg_session_duration_minutes, 10)
+
+        # Nada novo: nenhuma linha reprocessada
+        self.assertEqual(run_rollup(safety_lag=0)['events'], 0)
+
+        self.event(self.bia, ActivityEvent.FEATURE, self.hoje, feature="api")
+        run_rollup(safety_lag=0)
+        self.assertEqual(DailyActivity.objects.get(day=self.hoje).features_used, {"api": 2})
+        self.assertEqual(UserDailyActivity.objects.get(user=self.bia, day=self.hoje).features_used, {"api": 2})
+
+    def test_evento_com_commit_atrasado_entra_na_execucao_seguinte(self):
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje)
+        atrasado = self.event(self.bia, ActivityEvent.LOGIN, self.hoje)
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje)
+        # Transação do id do meio ainda aberta: invisível para o rollup
+        ActivityEvent.objects.filter(pk=atrasado.pk).delete()
+        self.assertEqual(run_rollup(safety_lag=0)['events'], 2)
+        self.assertEqual(RollupWatermark.objects.get().gaps[0][:2], [atrasado.pk, atrasado.pk])
+
+        atrasado.save(force_insert=True)
+        stats = run_rollup(safety_lag=0)
+        self.assertEqual((stats['events'], stats['late_events']), (1, 1))
+        self.assertEqual(RollupWatermark.objects.get().gaps, [])
+        self.assertEqual(DailyActivity.objects.get(day=self.hoje).dau, 2)
+
+    @override_settings(ROLLUP_GAP_TIMEOUT=0)
+    def test_buraco_vencido_e_dado_como_rollback(self):
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje)
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje).delete()
+        self.event(self.ana, ActivityEvent.LOGIN, self.hoje)
+        run_rollup(safety_lag=0)
+        run_rollup(safety_lag=0)
+        self.assertEqual(RollupWatermark.objects.get().gaps, [])
+
+    def test_incrementos_batem_com_o_recalculo_completo(self):
+        users = [self.ana, self.bia, CustomUser.objects.create_user(email="caio@exemplo.com", name="Caio")]
+        for offset in (12, 9, 3, 0, 5, 1, 12, 0, 3):
+            for index, user in enumerate(users[:1 + offset % 3]):
+                day = self.hoje - datetime.timedelta(days=offset + index)
+                self.event(user, ActivityEvent.LOGIN, day)
+                self.event(user, ActivityEvent.SESSION, day, duration_seconds=60 * (offset + 1))
+                self.event(user, ActivityEvent.FEATURE, day, feature="api" if offset % 2 else "admin")
+            run_rollup(chunk_size=4, safety_lag=0)
+
+        campos = ('day', 'dau', 'wau', 'mau', 'logins', 'sessions', 'session_seconds', 'features_used')
+        incremental = list(DailyActivity.objects.order_by('day').values_list(*campos))
+        for day in DailyActivity.objects.values_list('day', flat=True):
+            rollups._create_day(day)
+        self.assertEqual(incremental, list(DailyActivity.objects.order_by('day').values_list(*campos)))
+        medias = DailyActivity.objects.values_list('avg_session_duration_minutes', 'session_seconds', 'sessions')
+        for media, seconds, sessions in medias:
+            self.assertAlmostEqual(media, seconds / sessions / 60)
+
+    def test_eventos_recentes_esperam_a_proxima_execucao(self):
+        ActivityEvent.objects.create(user=self.ana, kind=ActivityEvent.LOGIN)
+        self.assertEqual(run_rollup(safety_lag=60)['events'], 0)
+        self.assertEqual(run_rollup(safety_lag=0)['events'], 1)
+
+    def test_flush_do_buffer_grava_eventos_brutos(self):
+        buffer = AnalyticsBuffer(size=10)
+        buffer.append((analytics.SESSION, self.ana.pk, timezone.now(), 300))
+        buffer.append((analytics.FEATURE, self.ana.pk, timezone.now(), "api"))
+        buffer.flush()
+        self.assertEqual(
+            sorted(ActivityEvent.objects.values_list('kind', 'feature', 'duration_seconds')),
+            [("feature", "api", None), ("session", "", 300.0)],
+        )
+
+
+class ExpireSubscriptionsTest(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.premium = Plan.objects.create(name="Premium", is_free=False)
+        self.ouro = SubscriptionPlan.objects.create(name="Ouro", price=10)
+        agora = timezone.now()
+        self.vencidos = []
+        for i in range(5):
+            user = CustomUser.objects.create_user(email=f"v{i}@exemplo.com", name=f"V{i}", plan=self.premium)
+            Subscription.objects.create(user=user, plan=self.ouro, valid_until=agora - datetime.timedelta(hours=i + 1))
+            self.vencidos.append(user)
+        self.em_dia = CustomUser.objects.create_user(email="ok@exemplo.com", name="Ok", plan=self.premium)
+        Subscription.objects.create(user=self.em_dia, plan=self.ouro, valid_until=agora + datetime.timedelta(days=1))
+
+    def test_expira_em_lotes_e_rebaixa_para_o_plano_gratuito(self):
+        user = self.vencidos[0]
+        self.assertTrue(entitlements.get_entitlements(user).subscription_active)
+
+        stats = expire_subscriptions(chunk_size=2, downgrade=True)
+        self.assertEqual((stats['expired'], stats['downgraded'], stats['chunks']), (5, 5, 3))
+        self.assertEqual(Subscription.objects.filter(is_active=True).get().user, self.em_dia)
+        self.assertEqual(
+            set(CustomUser.objects.filter(plan=self.premium).values_list('pk', flat=True)), {self.em_dia.pk},
+        )
+
+        # update() não dispara signals: o snapshot em cache precisa ter sido descartado
+        snapshot = entitlements.get_entitlements(user)
+        self.assertFalse(snapshot.subscription_active)
+        self.assertTrue(snapshot.plan_is_free)
+
+        self.assertEqual(expire_subscriptions()['expired'], 0)
+
+    def test_renovada_entre_a_leitura_e_a_escrita_nao_rebaixa(self):
+        renovado = self.vencidos[0]
+        versao = CustomUser.objects.get(pk=renovado.pk).entitlement_version
+        atomic = subscriptions.transaction.atomic
+
+        def renova_e_abre_transacao(*args, **kwargs):
+            # Pagamento confirmado depois da leitura do lote, antes do UPDATE
+            Subscription.objects.filter(user=renovado).update(valid_until=timezone.now() + datetime.timedelta(days=30))
+            return atomic(*args, **kwargs)
+
+        with mock.patch.object(subscriptions, 'transaction', SimpleNamespace(atomic=renova_e_abre_transacao)):
+            stats = expire_subscriptions(downgrade=True)
+        self.assertEqual((stats['expired'], stats['downgraded']), (4, 4))
+        renovado.refresh_from_db()
+        self.assertEqual(renovado.plan, self.premium)
+        self.assertEqual(renovado.entitlement_version, versao)
+        self.assertTrue(Subscription.objects.get(user=renovado).is_active)
+
+    def test_sem_downgrade_mantem_o_plano(self):
+        call_command('expire_subscriptions', '--json', stdout=io.StringIO())
+        self.assertFalse(Subscription.objects.filter(user=self.vencidos[0]).get().is_active)
+        self.assertEqual(CustomUser.objects.filter(plan=self.premium).count(), 6)
+
+
+class QuotaTest(CacheResetMixin, TestCase):
+    """ActivityEvent e UserDailyActivity fazem o papel de projetos e arquivos (não há esses modelos aqui)."""
+    def setUp(self):
+        super().setUp()
+        quotas.track('projects', ActivityEvent)
+        quotas.track('storage', UserDailyActivity, size_field='logins')
+        self.addCleanup(quotas.untrack, 'projects')
+        self.addCleanup(quotas.untrack, 'storage')
+        self.plan = Plan.objects.create(name="Básico", max_projects=2, max_storage_mb=1)
+        self.user = CustomUser.objects.create_user(email="cota@exemplo.com", name="Cota", plan=self.plan)
+
+    def criar_projeto(self):
+        return ActivityEvent.objects.create(user=self.user, kind=ActivityEvent.FEATURE)
+
+    def test_contadores_acompanham_criacao_e_exclusao(self):
+        projeto = self.criar_projeto()
+        self.criar_projeto()
+        UserDailyActivity.objects.create(user=self.user, day=datetime.date(2024, 1, 1), logins=512 * 1024)
+        self.assertEqual(quotas.usage(self.user), {'projects': 2, 'users': 0, 'storage': 512 * 1024})
+        projeto.delete()
+        self.assertEqual(quotas.usage(self.user)['projects'], 1)
+
+    def test_checagem_com_uma_consulta_indexada(self):
+        self.criar_projeto()
+        entitlements.get_entitlements(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            quotas.check(self.user, 'projects')
+            with self.assertRaises(quotas.QuotaExceeded):
+                quotas.check(self.user, 'storage', 2 * 1024 * 1024)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'].upper())
+        self.criar_projeto()
+        with self.assertRaises(quotas.QuotaExceeded) as erro:
+            quotas.check(self.user, 'projects')
+        self.assertEqual((erro.exception.used, erro.exception.limit), (2, 2))
+
+    def test_limit_projects_usa_contador(self):
+        contar = mock.Mock(return_value=0)
+        view = limit_projects(contar)(lambda request: HttpResponse("ok"))
+        request = SimpleNamespace(user=self.user)
+        self.assertEqual(view(request).status_code, 200)
+        self.criar_projeto()
+        self.criar_projeto()
+        resposta = view(request)
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(resposta.content.decode(), "Limite de projetos atingido para seu plano.")
+        contar.assert_not_called()
+
+    def test_requests_simultaneos_nao_passam_juntos_do_limite(self):
+        self.criar_projeto()
+        entitlements.get_entitlements(self.user)
+        respostas = []
+
+        @limit_quota('projects')
+        def criar(request):
+            if not respostas:
+                # Segundo request chega enquanto o primeiro ainda cria o projeto
+                respostas.append(criar(request).status_code)
+            self.criar_projeto()
+            return HttpResponse("ok")
+
+        self.assertEqual(criar(SimpleNamespace(user=self.user)).status_code, 200)
+        self.assertEqual(respostas, [403])
+        self.assertEqual(quotas.usage(self.user)['projects'], 2)
+        self.assertEqual(ActivityEvent.objects.filter(user=self.user).count(), 2)
+
+    def test_reserva_devolvida_quando_a_view_falha(self):
+        @limit_quota('projects')
+        def falha(request):
+            raise RuntimeError("erro na view")
+
+        with self.assertRaises(RuntimeError):
+            falha(SimpleNamespace(user=self.user))
+        self.assertEqual(quotas.usage(self.user)['projects'], 0)
+        self.assertTrue(quotas.reserve(self.user, 'projects', 2))
+        with self.assertRaises(quotas.QuotaExceeded):
+            quotas.reserve(self.user, 'projects')
+
+    def test_sem_plano_nao_ha_limite(self):
+        self.user.plan = None
+        self.user.save()
+        view = limit_quota('users', amount=50)(lambda request: HttpResponse("ok"))
+        self.assertEqual(view(SimpleNamespace(user=self.user)).status_code, 200)
+
+    def test_reconciliacao_corrige_divergencias(self):
+        self.criar_projeto()
+        outro = CustomUser.objects.create_user(email="outro@exemplo.com", name="Outro")
+        # Inserções em massa e update() não passam pelos signals
+        ActivityEvent.objects.bulk_create([ActivityEvent(user=outro, kind=ActivityEvent.LOGIN) for _ in range(3)])
+        QuotaUsage.objects.filter(pk=self.user.pk).update(projects=7)
+
+        stats = quotas.reconcile(chunk_size=1)
+        self.assertEqual((stats['users'], stats['corrected'], stats['created']), (2, 1, 1))
+        self.assertEqual(quotas.usage(self.user)['projects'], 1)
+        self.assertEqual(quotas.usage(outro)['projects'], 3)
+        self.assertIsNotNone(QuotaUsage.objects.get(pk=outro.pk).reconciled_at)
+        self.assertEqual(quotas.reconcile()['corrected'], 0)
+
+    def test_reconciliacao_com_linha_criada_durante_o_lote(self):
+        outro = CustomUser.objects.create_user(email="outro@exemplo.com", name="Outro")
+        ActivityEvent.objects.bulk_create([ActivityEvent(user=outro, kind=ActivityEvent.LOGIN) for _ in range(3)])
+        contar = quotas._actual_usage
+
+        def contar_e_concorrer(user_ids):
+            # adjust() de outro request cria a linha depois do SELECT ... FOR UPDATE
+            QuotaUsage.objects.get_or_create(user_id=outro.pk, defaults={'projects': 4})
+            return contar(user_ids)
+
+        with mock.patch.object(quotas, '_actual_usage', side_effect=contar_e_concorrer):
+            quotas.reconcile()
+        self.assertEqual(quotas.usage(outro)['projects'], 3)
+
+    def test_comando_reconcile_quotas(self):
+        out = io.StringIO()
+        call_command('reconcile_quotas', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['users'], 1)
+
+
+# Orçamento por nome de URL (User/urls.py): (máximo de queries, máximo de ms).
+# O teto de queries vale para todas as escalas: se crescer com o número de
+# usuários, é N+1. O tempo é folgado (SQLite em CI), só pega degradação grosseira.
+ENDPOINT_BUDGETS = {
+    'api-root': (0, 250),
+    'token_obtain_pair': (1, 500),
+    'firebase-login': (1, 500),
+    'token_refresh': (4, 250),  # usuário + INSERT do JTI rotacionado (SAVEPOINT/RELEASE no teste)
+    'token_revoke': (3, 250),
+    'create-user': (2, 500),
+    'import-users': (6, 1000),
+    'user-directory': (3, 500),
+    'health_check': (0, 250),
+    'liveness': (0, 250),
+    'readiness': (0, 250),
+    'load-metrics': (0, 250),
+    'db-metrics': (0, 250),
+    'metrics': (0, 250),
+    'password_reset_request': (1, 250),
+    'password_reset_confirm': (3, 500),
+}
+# 100k usuários levam alguns segundos para semear; QUERY_BUDGET_SCALES=10 acelera o ciclo local
+QUERY_BUDGET_SCALES = [int(n) for n in os.environ.get('QUERY_BUDGET_SCALES', '10,1000,100000').split(',')]
+
+
+def url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    RATE_LIMIT_ENABLED=False,
+    METRICS_TOKEN="token-orcamento",
+)
+class QueryBudgetTest(CacheResetMixin, TestCase):
+    PASSWORD = "senha-orcamento-123"
+    METRICS_TOKEN = "token-orcamento"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FirebaseKeyServer("projeto-teste", max_age=600).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        firebase.reset_verifier()
+        self.addCleanup(firebase.reset_verifier)
+        self.sequence = iter(range(10 ** 9))
+        self.user = CustomUser.objects.create_user(email="orcamento@exemplo.com", name="Orç", password=self.PASSWORD)
+        self.admin = CustomUser.objects.create_user(
+            email="adm-orcamento@exemplo.com", name="Adm", role=Role.objects.get(name="Administrador"),
+        )
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        self.firebase_token = self.server.make_token(uid="orcamento", email="firebase-orcamento@exemplo.com")
+
+    def seed(self, total):
+        """Completa a tabela até `total` usuários, com papéis e planos variados."""
+        roles, plans = list(Role.objects.all()), list(Plan.objects.all()) or [None]
+        missing = total - CustomUser.objects.count()
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f"semeado{n}@exemplo.com", name=f"Semeado {n}", password="!",
+                role=roles[n % len(roles)], plan=plans[n % len(plans)], is_active=n % 7 != 0,
+            )
+            for n in range(CustomUser.objects.count(), CustomUser.objects.count() + max(missing, 0))
+        ], batch_size=5000)
+
+    # Cada método prepara os dados fora da medição e devolve o request a medir
+    def request_api_root(self):
+        return lambda: self.client.get(reverse('api-root'))
+
+    def request_token_obtain_pair(self):
+        data = {'email': self.user.email, 'password': self.PASSWORD}
+        return lambda: self.client.post(reverse('token_obtain_pair'), data)
+
+    def request_firebase_login(self):
+        data = {'firebase_token': self.firebase_token}
+        return lambda: self.client.post(reverse('firebase-login'), data)
+
+    def request_token_refresh(self):
+        data = {'refresh': str(CustomTokenObtainPairSerializer.get_token(self.user))}
+        return lambda: self.client.post(reverse('token_refresh'), data)
+
+    def request_token_revoke(self):
+        data = {'refresh': str(CustomTokenObtainPairSerializer.get_token(self.user))}
+        return lambda: self.client.post(reverse('token_revoke'), data)
+
+    def request_create_user(self):
+        n = next(self.sequence)
+        data = {'email': f"novo{n}@exemplo.com", 'name': f"Novo {n}", 'password': self.PASSWORD}
+        return lambda: self.client.post(reverse('create-user'), data)
+
+    def request_import_users(self):
+        n = next(self.sequence)
+        body = f"email,name\nimportado{n}a@exemplo.com,A\nimportado{n}b@exemplo.com,B\n"
+        return lambda: self.admin_client.post(reverse('import-users'), body, content_type='text/csv')
+
+    def request_user_directory(self):
+        return lambda: self.admin_client.get(reverse('user-directory'))
+
+    def request_health_check(self):
+        return lambda: self.client.get(reverse('health_check'))
+
+    def request_liveness(self):
+        return lambda: self.client.get(reverse('liveness'))
+
+    def request_readiness(self):
+        readiness.monitor.run_checks()
+        return lambda: self.client.get(reverse('readiness'))
+
+    def request_load_metrics(self):
+        return lambda: self.client.get(reverse('load-metrics'), HTTP_AUTHORIZATION=f"Bearer {self.METRICS_TOKEN}")
+
+    def request_db_metrics(self):
+        return lambda: self.client.get(reverse('db-metrics'), HTTP_AUTHORIZATION=f"Bearer {self.METRICS_TOKEN}")
+
+    def request_metrics(self):
+        return lambda: self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=f"Bearer {self.METRICS_TOKEN}")
+
+    def request_password_reset_request(self):
+        return lambda: self.client.post(reverse('password_reset_request'), {'email': self.user.email})
+
+    def request_password_reset_confirm(self):
+        n = next(self.sequence)
+        user = CustomUser.objects.create_user(email=f"reset{n}@exemplo.com", name="Reset", password=self.PASSWORD)
+        url = reverse('password_reset_confirm', args=[
+            urlsafe_base64_encode(force_bytes(user.pk)), default_token_generator.make_token(user),
+        ])
+        return lambda: self.client.post(url, {'password': "nova-senha-456"})
+
+    def assert_within_budget(self, name, scale):
+        max_queries, max_ms = ENDPOINT_BUDGETS[name]
+        builder = getattr(self, f"request_{name.replace('-', '_')}")
+        builder()()  # aquecimento: caches de processo (registry, entitlements, verificador)
+        call = builder()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = call()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, f"{name}: {response.status_code} {response.content[:200]!r}")
+        if len(context) > max_queries or elapsed_ms > max_ms:
+            sql = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(context.captured_queries, 1))
+            self.fail(
+                f"{name} com {scale} usuários: {len(context)} queries (máximo {max_queries}), "
+                f"{elapsed_ms:.1f} ms (máximo {max_ms} ms)\n{sql}"
+            )
+
+    def test_todas_as_rotas_tem_orcamento(self):
+        self.assertEqual(set(url_names(user_urls.urlpatterns)), set(ENDPOINT_BUDGETS))
+
+    def test_orcamento_por_endpoint_em_cada_escala(self):
+        with self.settings(FIREBASE_PROJECT_ID="projeto-teste", FIREBASE_CERTS_URL=self.server.url):
+            for scale in QUERY_BUDGET_SCALES:
+                self.seed(scale)
+                for name in ENDPOINT_BUDGETS:
+                    with self.subTest(endpoint=name, users=scale):
+                        self.assert_within_budget(name, scale)
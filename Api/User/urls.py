@@ -2,12 +2,16 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from django.contrib import admin
 from django.conf import settings
-from .views import PasswordResetConfirmView, PasswordResetRequestView, health_check
+from .views import PasswordResetConfirmView, PasswordResetRequestView, health_check, readiness_check, load_metrics, db_metrics, prometheus_metrics
 
 from .views import (
     CustomTokenObtainPairView,
+    CustomTokenRefreshView,
+    TokenRevokeView,
     FirebaseLoginView,
     CustomUserCreateView,
+    UserImportView,
+    UserDirectoryView,
 )   
 
 
@@ -20,9 +24,17 @@ urlpatterns = [
     path('', include(router.urls)),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('firebase-login/', FirebaseLoginView.as_view(), name='firebase-login'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     path('api/users/', CustomUserCreateView.as_view(), name='create-user'),
+    path('api/users/import/', UserImportView.as_view(), name='import-users'),
+    path('api/users/directory/', UserDirectoryView.as_view(), name='user-directory'),
     path('health/', health_check, name='health_check'),
+    path('health/live/', health_check, name='liveness'),
+    path('health/ready/', readiness_check, name='readiness'),
+    path('metrics/load/', load_metrics, name='load-metrics'),
+    path('metrics/db/', db_metrics, name='db-metrics'),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('api/password-reset/', PasswordResetRequestView.as_view(), name='password_reset_request'),
     path('api/password-reset-confirm/<uidb64>/<token>/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
 ]
@@ -1,20 +1,97 @@
 
+import hmac
+
+from django.conf import settings
 from django.http import HttpResponseForbidden
 from functools import wraps
 
-def limit_projects(get_user_projects_count_func):
+from User import analytics, quotas
+
+def limit_quota(resource, amount=1):
+    """
+    Decorator que barra a view quando `amount` a mais de `resource`
+    ('projects', 'users' ou 'storage') ultrapassa o limite do plano do usuário.
+    O uso vem dos contadores materializados (User/quotas.py). Com o recurso
+    rastreado a cota fica reservada enquanto a view roda, então requests
+    simultâneos não passam juntos do limite.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+            if not quotas.is_tracked(resource):
+                try:
+                    quotas.check(request.user, resource, amount)
+                except quotas.QuotaExceeded as e:
+                    return HttpResponseForbidden(str(e))
+                return view_func(request, *args, **kwargs)
+            try:
+                held = quotas.reserve(request.user, resource, amount)
+            except quotas.QuotaExceeded as e:
+                return HttpResponseForbidden(str(e))
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                # O objeto criado pela view já entrou no contador pelo signal
+                if held:
+                    quotas.release(request.user, resource, amount)
+        return _wrapped_view
+    return decorator
+
+
+def limit_projects(get_user_projects_count_func=None):
     """
     Decorator que limita o número de projetos permitidos pelo plano do usuário.
-    `get_user_projects_count_func` deve ser uma função que retorna o número de projetos do usuário.
+    Com o modelo de projetos rastreado (quotas.track('projects', ...)) usa o
+    contador materializado; senão, `get_user_projects_count_func` deve ser uma
+    função que retorna o número de projetos do usuário.
     """
+    if get_user_projects_count_func is None or quotas.is_tracked('projects'):
+        return limit_quota('projects')
+
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             user = request.user
-            if user.is_authenticated and user.plan:
+            plan_limits = user.is_authenticated and quotas.limits(user)
+            if plan_limits:
                 current_count = get_user_projects_count_func(user)
-                if current_count >= user.plan.max_projects:
+                if current_count >= plan_limits['projects']:
                     return HttpResponseForbidden("Limite de projetos atingido para seu plano.")
             return view_func(request, *args, **kwargs)
         return _wrapped_view
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def track_feature(feature_name):
+    """
+    Decorator que registra o uso de uma feature em UserAnalytics.features_used.
+    O evento vai para o buffer de analytics e é gravado em lote depois.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                analytics.record_feature(request.user, feature_name)
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+def require_metrics_access(view_func):
+    """
+    Decorator das rotas de métricas (/metrics, /metrics/load/, /metrics/db/):
+    passa o scrape com `Authorization: Bearer <METRICS_TOKEN>` ou a sessão de
+    um usuário staff. Sem METRICS_TOKEN definido, só staff.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        token = settings.METRICS_TOKEN
+        scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip(), token):
+            return view_func(request, *args, **kwargs)
+        if request.user.is_authenticated and request.user.is_staff:
+            return view_func(request, *args, **kwargs)
+        return HttpResponseForbidden("Acesso às métricas restrito.")
+    return _wrapped_view
@@ -1,11 +1,22 @@
 from rest_framework_simplejwt.views import TokenObtainPairView,TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializer import CustomTokenObtainPairSerializer, CustomUserSerializer
+from .serializer import (
+    CustomTokenObtainPairSerializer,
+    CustomUserSerializer,
+    RotatingTokenRefreshSerializer,
+    TokenRevokeSerializer,
+    UserSerializer,
+)
+from .pagination import UserDirectoryPagination
+from .ratelimit import SlidingWindowThrottle
 from .models import CustomUser, Plan
+from .outbox import enqueue_password_reset
+from . import admission, analytics, dbpool, instrumentation, readiness
 
 from rest_framework.permissions import AllowAny
 
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 
 from rest_framework.views import APIView
 
@@ -15,25 +26,77 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
 from .permissions import IsAdminRole
+from .utils.decorators import require_metrics_access
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
+from django.utils.http import urlsafe_base64_decode
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_email
 from django.conf import settings
 from rest_framework import status, generics
 
 
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+
+import hashlib
+import json
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
 
 def health_check(request):
+    """Liveness: o processo responde. Não depende do banco nem do cache."""
     return HttpResponse("OK")
 
+
+def readiness_check(request):
+    """Readiness: último resultado das verificações em segundo plano (sem I/O no probe)."""
+    ready, body = readiness.status()
+    return JsonResponse(body, status=200 if ready else 503)
+
+
+@require_metrics_access
+def load_metrics(request):
+    """Vagas, profundidade das filas e rejeições do controle de admissão, por classe."""
+    return JsonResponse(admission.metrics())
+
+
+@require_metrics_access
+def db_metrics(request):
+    """Conexões abertas e, com DB_POOL, uso e esperas do pool deste worker."""
+    return JsonResponse(dbpool.stats())
+
+
+@require_metrics_access
+def prometheus_metrics(request):
+    """Métricas deste worker no formato texto do Prometheus."""
+    return HttpResponse(instrumentation.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Create your views here.
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'login'
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = RotatingTokenRefreshSerializer
+
+
+class TokenRevokeView(APIView):
+    """Revoga um refresh token (logout): ele deixa de gerar novos access tokens."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_205_RESET_CONTENT)
 
 
 class CustomUserCreateView(generics.CreateAPIView):
@@ -55,7 +118,8 @@ class FirebaseLoginView(APIView):
         try:
             # Cria ou obtém o usuário usando o token do Firebase
             user = User.objects.create_user_with_firebase(firebase_token)
-            print(f"Usuário autenticado com sucesso: {user.email}")  # Log da mensagem no console do Docker
+            analytics.record_login(user)
+            logger.info("Usuário autenticado com sucesso: %s", user.email)
 
             return Response({"message": "Usuário autenticado com sucesso.", "email": user.email})
 
@@ -72,6 +136,97 @@ class AdminOnlyView(APIView):
         return Response({"message": "Você é um Administrador!"})
 
 
+class UserImportView(APIView):
+    """
+    Importação em massa (somente administradores). Aceita upload multipart no
+    campo `file` ou o corpo cru como text/csv ou application/x-ndjson.
+
+    As senhas são hasheadas dentro do request, então o endpoint aceita no
+    máximo USER_IMPORT_MAX_ROWS linhas (o bastante para caber no timeout do
+    worker); acima disso responde 413 e a turma vai pelo comando import_users.
+    """
+    permission_classes = [IsAdminRole]
+
+    def post(self, request):
+        content_type = request.content_type or ''
+        if content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"error": "Envie o arquivo no campo 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+            lines = upload
+            ndjson = upload.name.endswith(('.ndjson', '.jsonl'))
+        else:
+            lines = request.stream or []
+            ndjson = 'json' in content_type
+        fmt = request.query_params.get('format') or ('ndjson' if ndjson else 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            return Response({"error": "Formato deve ser csv ou ndjson."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Importado aqui: puxa concurrent.futures, que só a importação usa
+        from .importer import UserImporter, read_rows
+
+        # Hash no próprio processo: um pool de processos aqui faria fork do
+        # worker do gunicorn (com threads) no meio do request. Arquivos
+        # grandes vão pelo comando import_users, que usa o pool.
+        max_rows = settings.USER_IMPORT_MAX_ROWS
+        # Lê uma linha além do limite, só para saber se passou
+        rows = list(islice(read_rows(lines, fmt), max_rows + 1))
+        if len(rows) > max_rows:
+            return Response({
+                "error": f"O endpoint importa no máximo {max_rows} linhas por envio. "
+                         "Para arquivos maiores use: python manage.py import_users <arquivo>",
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        importer = UserImporter(chunk_size=settings.USER_IMPORT_CHUNK_SIZE, workers=0)
+        report = importer.run(rows)
+        return Response(report.as_dict())
+
+
+class UserDirectoryView(generics.ListAPIView):
+    """
+    Diretório de usuários (somente leitura, administradores).
+
+    Filtros: `role` e `plan` (ids) e `is_active` (true/false). Paginação por
+    cursor em `id` (ver pagination.py); role e plan vêm no mesmo SELECT. Cada
+    página leva um ETag fraco: quem envia `If-None-Match` com o mesmo valor
+    recebe 304 sem corpo.
+    """
+    serializer_class = UserSerializer
+    pagination_class = UserDirectoryPagination
+    permission_classes = [IsAdminRole]
+
+    def get_queryset(self):
+        queryset = CustomUser.objects.select_related('role', 'plan').only(
+            'id', 'email', 'name', 'is_active', 'role__id', 'role__name', 'plan__id', 'plan__name',
+        )
+        params = self.request.query_params
+        for field in ('role', 'plan'):
+            value = params.get(field)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({field: "Informe o id numérico."})
+                queryset = queryset.filter(**{f'{field}_id': int(value)})
+        is_active = params.get('is_active')
+        if is_active:
+            if is_active.lower() not in ('true', 'false', '1', '0'):
+                raise ValidationError({'is_active': "Use true ou false."})
+            queryset = queryset.filter(is_active=is_active.lower() in ('true', '1'))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        body = json.dumps(response.data, sort_keys=True, default=str).encode()
+        etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            # Comparação fraca: ignora o prefixo W/
+            candidates = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+            if '*' in candidates or etag.removeprefix('W/') in candidates:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response['ETag'] = etag
+        return response
+
+
 
 @login_required
 def upgrade_plan(request):
@@ -85,6 +240,9 @@ def upgrade_plan(request):
 
 class PasswordResetRequestView(APIView):
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [SlidingWindowThrottle]
+    throttle_scope = 'password_reset'
     
     def post(self, request):
         email = request.data.get("email")
@@ -95,26 +253,15 @@ class PasswordResetRequestView(APIView):
             )
         
         try:
-            user = CustomUser.objects.get(email=email)
-            # Gera token seguro
-            token = default_token_generator.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            
-            # Cria link de redefinição
-            reset_link = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}"
-            
-            # Envia e-mail (será impresso no console)
-            send_mail(
-                subject="Redefinição de senha",
-                message=f"Use este link para redefinir sua senha: {reset_link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
-            )
-            return Response({"message": "E-mail de recuperação enviado com sucesso."})
-        except CustomUser.DoesNotExist:
-            # Não revela se o e-mail existe (segurança)
-            return Response({"message": "E-mail de recuperação enviado com sucesso."})
+            validate_email(email)
+        except DjangoValidationError:
+            return Response({"error": "Email inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Só enfileira (um INSERT): o worker send_emails gera o link e envia,
+        # ignorando e-mails sem conta. Mesmo tempo de resposta para qualquer
+        # e-mail, então a resposta não revela se ele existe.
+        enqueue_password_reset(email)
+        return Response({"message": "E-mail de recuperação enviado com sucesso."})
 
 
 class PasswordResetConfirmView(APIView):
@@ -155,9 +302,11 @@ class PasswordResetConfirmView(APIView):
 
 from rest_framework.decorators import api_view, permission_classes
 from .permissions import IsProUser, IsAdmin
+from .utils.decorators import track_feature
 
 @api_view(['GET'])
 @permission_classes([IsProUser])
+@track_feature("pro")
 def pro_feature(request):
     return Response({"message": "Acesso permitido para usuários Pro!"})
 
@@ -29,7 +29,8 @@ echo ">> Estáticos coletados com sucesso"
 
 
 echo "Iniciando servidor Gunicorn..."
-exec gunicorn Api.wsgi:application --bind 0.0.0.0:8000
+# Workers pelos núcleos do container, preload e reciclagem (SERVE_MODE=asgi para uvicorn)
+exec python manage.py serve
 
 
 